@@ -0,0 +1,97 @@
+"""Per-cycle cost of building the requests of a cycle query.
+
+Compares the historical per-cycle ``ValueRequest.copy()`` (deepcopy)
+with building the requests from a ``ValueRequestTemplate``. The build
+step is what ``BaseCycleQuery._get_list_request_with_extinction`` does on
+every cycle; the serialize step is what the request solver then does
+with the result.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_request_template [number_of_requests] [cycles]
+"""
+import sys
+import time
+import tracemalloc
+
+from obcom.data_colection.tree_user import TreeUser
+from obcom.data_colection.value_call import ValueRequest, ValueRequestTemplate
+
+
+def _make_requests(n: int):
+    user = TreeUser(name='bench', email='bench@example.com', description='benchmark user')
+    return [ValueRequest(address=f'tic.telescope.jk15.mount.position_{i}', time_of_data_tolerance=1.0,
+                         request_timeout=30.0, request_data={'time_of_known_change': 1.0, 'no_send_before': 2.0,
+                                                             'param': {'a': 1, 'b': [1, 2, 3]}},
+                         user=user, cycle_query=True)
+            for i in range(n)]
+
+
+def _build_deepcopy(requests, additional):
+    out = []
+    for i, r in enumerate(requests):
+        new_r = r.copy()
+        new_r.request_data.update(additional[i])
+        out.append(new_r)
+    return out
+
+
+def _build_template(requests, additional, templates):
+    out = []
+    for i, r in enumerate(requests):
+        t = templates[i]
+        if t is None or not t.matches(r):
+            t = ValueRequestTemplate(r)
+            templates[i] = t
+        request_data = dict(r.request_data)
+        request_data.update(additional[i])
+        out.append(t.build(time_of_data=r.time_of_data, request_data=request_data))
+    return out
+
+
+def _serialize(requests):
+    return [r.to_byte() for r in requests]
+
+
+def _measure(build, cycles: int):
+    """Return (build ms/cycle, serialize ms/cycle, build peak KiB, live blocks per built batch)."""
+    build()  # warm up, templates are created here
+    t_build = t_ser = 0.0
+    for _ in range(cycles):
+        start = time.perf_counter()
+        out = build()
+        t_build += time.perf_counter() - start
+        start = time.perf_counter()
+        _serialize(out)
+        t_ser += time.perf_counter() - start
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    out = build()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(s.count_diff for s in after.compare_to(before, 'filename') if s.count_diff > 0)
+    del out
+    return t_build / cycles * 1000, t_ser / cycles * 1000, peak / 1024, blocks
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    requests = _make_requests(n)
+    additional = [{} for _ in range(n)]
+    templates = [None] * n
+    variants = [
+        ('deepcopy (before)', lambda: _build_deepcopy(requests, additional)),
+        ('template (after)', lambda: _build_template(requests, additional, templates)),
+    ]
+    print(f'{n} requests per cycle, {cycles} cycles')
+    print(f'{"variant":<20}{"build ms":>10}{"serialize ms":>14}{"build peak KiB":>16}{"blocks/cycle":>14}')
+    for name, build in variants:
+        t_build, t_ser, peak, blocks = _measure(build, cycles)
+        print(f'{name:<20}{t_build:>10.3f}{t_ser:>14.3f}{peak:>16.1f}{blocks:>14}')
+
+
+if __name__ == '__main__':
+    main()
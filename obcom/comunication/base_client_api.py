@@ -4,8 +4,26 @@ from abc import ABC, abstractmethod
 from typing import List, Optional
 
 from obcom.comunication.base_client_request_solver import BaseClientRequestSolver
+from obcom.comunication.callback_executor import CallbackDispatch, CallbackExecutor
 from obcom.comunication.comunication_error import CommunicationTimeoutError, CommunicationRuntimeError
-from obcom.comunication.cycle_query import ConditionalCycleQuery, BaseCycleQuery, PeriodicCycleQuery
+from obcom.comunication.change_filter import ChangeFilter
+from obcom.comunication.cycle_driver import CycleQueryDriver
+from obcom.comunication.cycle_query import (
+    AdaptiveRate,
+    AdaptiveTimeout,
+    BaseCycleQuery,
+    ConditionalCycleQuery,
+    CycleQueryState,
+    PeriodicCycleQuery,
+)
+from obcom.comunication.error_policy import CircuitBreakerRegistry, ErrorPolicy
+from obcom.comunication.periodic_scheduler import PeriodicScheduler
+from obcom.comunication.rate_control import AimdRateController
+from obcom.comunication.response_queue import OverflowPolicy
+from obcom.comunication.subscription_hub import SubscriptionHub
+from obcom.comunication.subscription_manager import SubscriptionManager
+from obcom.comunication.subscription_restore import SubscriptionRestorer
+from obcom.comunication.value_snapshot import ValueSnapshot
 from obcom.data_colection.address import Address
 from obcom.data_colection.tree_user import BaseTreeUser
 from obcom.data_colection.value_call import ValueRequest, ValueResponse
@@ -14,6 +32,20 @@ logger = logging.getLogger(__name__.rsplit('.')[-1])
 
 
 class BaseClientAPI(ABC):
+    # maximum number of distinct shared subscriptions packed into one cycle query, see `SubscriptionHub`
+    SUBSCRIPTION_MAX_BATCH_SIZE: int = 1
+    # executor of sync callbacks of every cycle query created by this client, None - called on the event loop
+    callback_executor: Optional[CallbackExecutor] = None
+    # how async callbacks of every cycle query created by this client are awaited, None - query default (sequential)
+    callback_dispatch: Optional[CallbackDispatch] = None
+    # driver running the cycle queries created by this client which can be driven, None - every query runs own tasks
+    cycle_driver: Optional[CycleQueryDriver] = None
+    # restore the subscriptions of this client in bulk when the request solver reports a reconnect
+    restore_subscriptions: bool = False
+    # last known values recorded by the subscriptions of this client and used to resume them, None - not kept
+    value_snapshot: Optional[ValueSnapshot] = None
+    # circuit breakers passed by the single requests and the subscriptions of this client, None - no circuit breaking
+    circuit_breakers: Optional[CircuitBreakerRegistry] = None
 
     @property
     @abstractmethod
@@ -25,6 +57,66 @@ class BaseClientAPI(ABC):
     def _CRS(self) -> BaseClientRequestSolver:
         raise NotImplementedError
 
+    @property
+    def subscription_hub(self) -> SubscriptionHub:
+        """Hub of subscriptions shared by all ``subscribe(..., shared=True)`` calls of this client."""
+        hub = getattr(self, '_subscription_hub', None)
+        if hub is None:
+            hub = SubscriptionHub(crs=self._CRS, max_batch_size=self.SUBSCRIPTION_MAX_BATCH_SIZE)
+            self._subscription_hub = hub
+        return hub
+
+    @property
+    def periodic_scheduler(self) -> PeriodicScheduler:
+        """Shared ticks of all ``send_cycle_multipart(..., shared_tick=True)`` calls of this client."""
+        scheduler = getattr(self, '_periodic_scheduler', None)
+        if scheduler is None:
+            scheduler = PeriodicScheduler(crs=self._CRS)
+            self._periodic_scheduler = scheduler
+        return scheduler
+
+    @property
+    def subscription_manager(self) -> SubscriptionManager:
+        """Registry of every cycle query created by this client, used for bulk stop and health checks."""
+        manager = getattr(self, '_subscription_manager', None)
+        if manager is None:
+            manager = SubscriptionManager()
+            self._subscription_manager = manager
+        return manager
+
+    @property
+    def subscription_restorer(self) -> Optional[SubscriptionRestorer]:
+        """
+        Restorer of the subscriptions of this client after a reconnect, created with the first cycle query when
+        `restore_subscriptions` is set, see :class:`.subscription_restore.SubscriptionRestorer`.
+        """
+        return getattr(self, '_subscription_restorer', None)
+
+    def _restored_queries(self) -> List[BaseCycleQuery]:
+        manager = self.subscription_manager
+        queries = manager.by_state(CycleQueryState.STARTING) + manager.by_state(CycleQueryState.RUNNING)
+        hub = getattr(self, '_subscription_hub', None)
+        if hub is not None:
+            queries += hub.sources()
+        return queries
+
+    def _track(self, cq: BaseCycleQuery) -> BaseCycleQuery:
+        """Apply client-wide settings to a newly created cycle query and register it."""
+        if self.restore_subscriptions and self.subscription_restorer is None:
+            self._subscription_restorer = SubscriptionRestorer(crs=self._CRS, queries=self._restored_queries)
+        if self.callback_executor is not None:
+            cq.set_callback_executor(self.callback_executor)
+        if self.callback_dispatch is not None:
+            cq.set_callback_dispatch(self.callback_dispatch)
+        if self.cycle_driver is not None and cq._driver_unsupported() is None:
+            cq.set_driver(self.cycle_driver)
+        if self.circuit_breakers is not None and cq.error_policy.circuit_breakers is None:
+            cq.set_circuit_breakers(self.circuit_breakers)
+        throttle = getattr(self._CRS, 'retry_throttle', None)
+        if throttle is not None and cq.error_policy.retry_throttle is None:
+            cq.set_retry_throttle(throttle)
+        return self.subscription_manager.register(cq)
+
     async def get_async(self, address, time_of_data: float or None = None,
                         time_of_data_tolerance: float or None = None,
                         request_timeout: float or None = None,
@@ -65,6 +157,7 @@ class BaseClientAPI(ABC):
 
         :param no_wait: If 'true' than request will be sent and client will not wait for response
         :param requests: request
+        :raise CircuitOpenError: if the circuit of an address is open (see `circuit_breakers`), nothing was sent
         :raise CommunicationRuntimeError:
         :raise CommunicationTimeoutError:
         :return:
@@ -77,22 +170,41 @@ class BaseClientAPI(ABC):
                 r.user = self.user
         if shortest_timeout is None:
             logger.error(f"Unable to get timeout value from request. Request is uncompleted.")
+        registry = self.circuit_breakers
+        breakers = registry.check(r.address for r in requests) if registry is not None else []
+        controller: Optional[AimdRateController] = getattr(self._CRS, 'rate_controller', None)
         try:
+            slots = await controller.acquire(r.address for r in requests) if controller is not None else []
             resp = await self._CRS.send_request(requests=requests, timeout=shortest_timeout, no_wait=no_wait)
-        except CommunicationRuntimeError:
-            raise
         except CommunicationTimeoutError:
+            if registry is not None:
+                registry.record_timeout(breakers)
+            if controller is not None:
+                controller.record_timeout(slots)
+            raise
+        except BaseException:
+            if registry is not None:
+                registry.abandon(breakers)
             raise
+        # without a response (`no_wait`) nothing is known
+        if registry is not None:
+            registry.record(breakers, resp or [])
+        if controller is not None:
+            controller.record(slots, resp or [])
         return resp
 
     async def subscribe(self, address: str or Address, time_of_data_tolerance: float or None = None,
                         delay: float or None = None, parameters_dict: dict = None,
                         name: str = 'Default_subscription', max_missed_msg: int = None,
                         ignore_errors: bool = False,
-                        error_policy: 'ErrorPolicy' = None) -> BaseCycleQuery:
+                        error_policy: 'ErrorPolicy' = None, shared: bool = False,
+                        streaming: bool = False, change_filter: ChangeFilter = None,
+                        adaptive_timeout: AdaptiveTimeout = None, initial: bool = False,
+                        resume_from: ValueResponse = None) -> BaseCycleQuery:
         """
         This method creates a cycle query that only returns new values. The `ConditionalCycleQuery` object is
-        created and returned.
+        created and returned. With `shared` set a `SharedCycleQuery` handle is returned instead, see
+        :class:`.subscription_hub.SubscriptionHub`.
 
         :param address: address
         :param time_of_data_tolerance: how old data can be returned. This time should be greater than that specified
@@ -105,27 +217,95 @@ class BaseClientAPI(ABC):
         :param error_policy: per-severity error-handling policy. See
             :class:`obcom.comunication.error_policy.ErrorPolicy`. Default
             is ``ErrorPolicy.INTERACTIVE`` (GUI-friendly).
+        :param shared: share one underlying query with every other shared subscription of this client with the
+            same address and parameters. Consumers with different `delay` are served from the fastest one. If
+            `time_of_data_tolerance` is not set the fastest `delay` is used. With `SUBSCRIPTION_MAX_BATCH_SIZE`
+            greater than 1 shared subscriptions to different addresses are also packed into multi-request queries.
+        :param streaming: use a server-pushed stream instead of a long-poll per change when the request solver
+            supports it, more information in :class:`.cycle_query.ConditionalCycleQuery`. Not applied to shared
+            subscriptions
+        :param change_filter: client-side deadband / minimum interval / changed fields filter of this subscription,
+            see :class:`.change_filter.ChangeFilter`. Filtered updates do not wake the consumers
+        :param adaptive_timeout: adapt the long-poll horizon to the observed change intervals of the address, see
+            :class:`.cycle_query.AdaptiveTimeout`. Not applied to shared subscriptions
+        :param initial: start the query and return it with the current value in `current_response`, read from the
+            first conditional response (one round trip instead of `get_async` followed by `subscribe`). Following
+            responses continue from its `time_of_known_change`, an iterator created right after this call misses
+            no change. A running shared subscription gives its last value without a request, see
+            :meth:`.cycle_query.BaseCycleQuery.start_and_get`
+        :param resume_from: cached response of the address to continue from, only a newer value is transferred;
+            with `initial` it is returned at once. Not supported for shared subscriptions. Default - the value in
+            `value_snapshot` (if set), see :meth:`get_last_known`
+        :raise CommunicationRuntimeError: with `initial`, if the query stopped with an error before the first
+            response
         :return: object `ConditionalCycleQuery`
         """
-        if time_of_data_tolerance is None and delay:
-            time_of_data_tolerance = delay
         if parameters_dict is None:
             parameters_dict = {}
+        if shared:
+            if ignore_errors:
+                raise ValueError("'ignore_errors' is not supported for shared subscriptions, use 'error_policy'")
+            if resume_from is not None:
+                raise ValueError("'resume_from' is not supported for shared subscriptions")
+            if self.circuit_breakers is not None and (error_policy is None or error_policy.circuit_breakers is None):
+                # passed by the underlying query, the handle sends nothing
+                error_policy = (error_policy or ErrorPolicy.INTERACTIVE).with_circuit_breakers(self.circuit_breakers)
+            throttle = getattr(self._CRS, 'retry_throttle', None)
+            if throttle is not None and (error_policy is None or error_policy.retry_throttle is None):
+                error_policy = (error_policy or ErrorPolicy.INTERACTIVE).with_retry_throttle(throttle)
+            cq = self.subscription_hub.subscribe(address=address, time_of_data_tolerance=time_of_data_tolerance,
+                                                 delay=delay, parameters_dict=parameters_dict, name=name,
+                                                 max_missed_msg=max_missed_msg, error_policy=error_policy,
+                                                 user=self.user)
+            if change_filter is not None:
+                cq.set_change_filter(change_filter)
+            self._track(cq)
+            if self.value_snapshot is not None:
+                self.value_snapshot.track(cq, parameters_dict)
+            if initial:
+                await cq.start_and_get()
+            return cq
+        if time_of_data_tolerance is None and delay:
+            time_of_data_tolerance = delay
+        if resume_from is None:
+            resume_from = self.get_last_known(address, parameters_dict)
         request = ValueRequest(address=address,
                                time_of_data_tolerance=time_of_data_tolerance,
                                request_data=parameters_dict,
                                user=self.user)
         CQ_API = ConditionalCycleQuery(crs=self._CRS, list_request=[request], delay=delay,
                                        max_missed_msg=max_missed_msg, query_name=name,
-                                       ignore_errors=ignore_errors, error_policy=error_policy)
+                                       ignore_errors=ignore_errors, error_policy=error_policy, streaming=streaming,
+                                       change_filter=change_filter, adaptive_timeout=adaptive_timeout,
+                                       resume_from=[resume_from] if resume_from is not None else None)
+        self._track(CQ_API)
+        if self.value_snapshot is not None:
+            self.value_snapshot.track(CQ_API, parameters_dict)
+        if initial:
+            await CQ_API.start_and_get()
         return CQ_API
 
+    def get_last_known(self, address: str or Address, parameters_dict: dict = None) -> Optional[ValueResponse]:
+        """
+        Return the last known value of the address from `value_snapshot` at once, without a request. The value may be
+        stale (e.g. recorded before a restart), it is marked with the ``from_snapshot`` tag.
+
+        :param address: address
+        :param parameters_dict: parameters of the subscription which recorded the value
+        :return: response or None if the value is not known or `value_snapshot` is not set
+        """
+        if self.value_snapshot is None:
+            return None
+        return self.value_snapshot.get(address, parameters_dict)
+
     async def subscribe_with_callback(self, address: str or Address, time_of_data_tolerance: float or None = None,
                                       delay: float or None = None, parameters_dict: dict = None,
                                       name: str = 'Default_subscription', max_missed_msg: int = None,
                                       ignore_errors: bool = False, callback_method=None,
                                       async_callback_method=None,
-                                      error_policy: 'ErrorPolicy' = None) -> BaseCycleQuery:
+                                      error_policy: 'ErrorPolicy' = None, shared: bool = False,
+                                      streaming: bool = False, change_filter: ChangeFilter = None,
+                                      adaptive_timeout: AdaptiveTimeout = None) -> BaseCycleQuery:
         """
         This method creates a cycle query that only returns new values. The `ConditionalCycleQuery` object is
         created, started and returned.
@@ -142,11 +322,17 @@ class BaseClientAPI(ABC):
         :param async_callback_method: async method with one will be run after CycleQuery retrieve message from server
         :param error_policy: per-severity error-handling policy. See
             :class:`obcom.comunication.error_policy.ErrorPolicy`.
+        :param shared: share the underlying query, see :meth:`subscribe`
+        :param streaming: use a server-pushed stream if supported, see :meth:`subscribe`
+        :param change_filter: filter of the updates, see :meth:`subscribe`
+        :param adaptive_timeout: adaptive long-poll horizon, see :meth:`subscribe`
         :return:
         """
         cq = await self.subscribe(address=address, time_of_data_tolerance=time_of_data_tolerance, delay=delay,
                                   parameters_dict=parameters_dict, name=name, max_missed_msg=max_missed_msg,
-                                  ignore_errors=ignore_errors, error_policy=error_policy)
+                                  ignore_errors=ignore_errors, error_policy=error_policy, shared=shared,
+                                  streaming=streaming, change_filter=change_filter,
+                                  adaptive_timeout=adaptive_timeout)
         if callback_method is not None:
             cq.add_callback_method(callback_method)
         if async_callback_method is not None:
@@ -165,11 +351,10 @@ class BaseClientAPI(ABC):
                                                 callback_method=callback_method,
                                                 async_callback_method=async_callback_method)
         try:
-            while True:
-                await asyncio.sleep(0)
-                await cq.get_response()
-                # todo w przyszłości pomyśleć nad przeniesieniem nieskończonej pętli do CycleQuery i zastąpieniem jej
-                #  przez Condition które jest uwalniane po zamknięciu CycleQuery
+            # callbacks are run by the cycle query itself, here only wait (without polling) until it finishes
+            with cq.iterate(maxsize=1, overflow=OverflowPolicy.KEEP_LATEST) as updates:
+                async for _ in updates:
+                    pass
         except CommunicationRuntimeError as e:
             logger.error(f"updater named {name} receive CommunicationRuntimeError: {e}")
         finally:
@@ -180,7 +365,8 @@ class BaseClientAPI(ABC):
     async def send_cycle_multipart(self, address: str or Address, time_of_data_tolerance: float or None = None,
                                    delay: float or None = None, parameters_dict: dict = None,
                                    name: str = 'Default_cycle_request', max_missed_msg: int = None,
-                                   log_missed_msg: bool = False) -> BaseCycleQuery:
+                                   log_missed_msg: bool = False, shared_tick: bool = False,
+                                   adaptive: AdaptiveRate = None) -> BaseCycleQuery:
         """
         This method creates a cycle query that returns a value once per specified interval of time (`delay`).
 
@@ -191,6 +377,10 @@ class BaseClientAPI(ABC):
         :param parameters_dict: dict of parameters to send witch request GET/PUT/etc...
         :param name: name of the subscription
         :param max_missed_msg: more information in :class:`.cycle_query.ConditionalCycleQuery`
+        :param shared_tick: send the request together with every other shared-tick query of this client with the same
+            `delay`, one batched request per tick, see :class:`.periodic_scheduler.PeriodicScheduler`
+        :param adaptive: poll less often while the value does not change, see :class:`.cycle_query.AdaptiveRate`.
+            Can not be combined with `shared_tick`
         :return: object PeriodicCycleQuery
         """
         if not time_of_data_tolerance and delay:
@@ -202,8 +392,9 @@ class BaseClientAPI(ABC):
                                request_data=parameters_dict,
                                user=self.user)
         CQ_API = PeriodicCycleQuery(crs=self._CRS, list_request=[request], delay=delay,
-                                    max_missed_msg=max_missed_msg, query_name=name, log_missed_msg=log_missed_msg)
-        return CQ_API
+                                    max_missed_msg=max_missed_msg, query_name=name, log_missed_msg=log_missed_msg,
+                                    scheduler=self.periodic_scheduler if shared_tick else None, adaptive=adaptive)
+        return self._track(CQ_API)
 
     @abstractmethod
     async def server_is_alive(self, request_timeout: float = None):
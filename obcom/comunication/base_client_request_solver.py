@@ -1,15 +1,101 @@
 import logging
 from abc import ABC, abstractmethod
-from typing import List
+from enum import Enum
+from typing import Callable, List, Optional
 
+from obcom.comunication.error_policy import RetryThrottle
+from obcom.comunication.rate_control import AimdRateController
+from obcom.comunication.value_stream import BaseValueStream
 from obcom.data_colection.value_call import ValueRequest, ValueResponse
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
 
+class ConnectionState(Enum):
+    """State of the connection of a request solver to the router."""
+    CONNECTED = 'connected'
+    DISCONNECTED = 'disconnected'
+
+
 class BaseClientRequestSolver(ABC):
 
+    # retry budget of the requests of this solver: an implementation resending a request (e.g. after a lost reply)
+    # asks `RetryThrottle.retry` first and reports answered requests by `RetryThrottle.record_success`. Subscriptions
+    # of a client using this solver share it when their error policy has none. None - retries not throttled
+    retry_throttle: Optional[RetryThrottle] = None
+    # request rate per endpoint, cut on overload signals: conditional cycle queries and single requests of a client
+    # using this solver wait for their slots. None - not paced
+    rate_controller: Optional[AimdRateController] = None
+    # state of the connection to the router, changed by the implementation by `_set_connection_state`
+    _connection_state: ConnectionState = ConnectionState.CONNECTED
+    # functions called when the connection state changes, the list is created by the first `add_connection_listener`
+    _connection_listeners: Optional[List[Callable[['BaseClientRequestSolver', ConnectionState,
+                                                  ConnectionState], None]]] = None
+
     @abstractmethod
     async def send_request(self, requests: List[ValueRequest], timeout: float = None,
                            no_wait: bool = False) -> List[ValueResponse]:
         raise NotImplementedError
+
+    def supports_streaming(self) -> bool:
+        """
+        Method returns True if this solver can open server-pushed subscription streams (:meth:`open_stream`).
+
+        :return: True if streaming subscriptions are supported
+        """
+        return False
+
+    async def open_stream(self, requests: List[ValueRequest], credits: int, lease: float,
+                          min_interval: float = 0) -> BaseValueStream:
+        """
+        Open a server-pushed stream of responses for the given conditional requests.
+
+        :param requests: subscribed requests
+        :param credits: initial number of updates the server may push before the client grants more
+        :param lease: requested lease time in seconds, the server may shorten it
+        :param min_interval: minimum interval between two pushed updates
+        :raise CommunicationRuntimeError: when the stream can not be opened
+        :raise CommunicationTimeoutError: when the router did not answer
+        :return: opened stream
+        """
+        raise NotImplementedError
+
+    @property
+    def connection_state(self) -> ConnectionState:
+        """State of the connection to the router, reported by the implementation, default CONNECTED."""
+        return self._connection_state
+
+    def add_connection_listener(self, listener: Callable[['BaseClientRequestSolver', ConnectionState,
+                                                          ConnectionState], None]):
+        """
+        Register a function called with (solver, old state, new state) when the connection to the router is lost or
+        established again.
+
+        :param listener: no async method
+        """
+        if self._connection_listeners is None:
+            self._connection_listeners = []
+        self._connection_listeners.append(listener)
+
+    def remove_connection_listener(self, listener):
+        listeners = self._connection_listeners
+        if listeners and listener in listeners:
+            listeners.remove(listener)
+
+    def _set_connection_state(self, state: ConnectionState):
+        """
+        Called by the implementation when the connection to the router was lost (the router stopped answering) or
+        established again.
+
+        :param state: new state
+        """
+        old = self.connection_state
+        if old == state:
+            return
+        self._connection_state = state
+        logger.info(f"Connection to the router: {state.value}")
+        for listener in list(self._connection_listeners or ()):
+            try:
+                listener(self, old, state)
+            except Exception as e:
+                logger.exception(f"Connection listener raised {type(e).__name__}: {e}")
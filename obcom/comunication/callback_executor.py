@@ -0,0 +1,128 @@
+"""Running cycle query callbacks off the event loop.
+
+Sync callbacks registered with ``add_callback_method`` are called directly
+on the event loop by default, so one slow callback (a database write, a
+plot refresh) stalls every subscription of the process. A
+:class:`CallbackExecutor` given to a cycle query runs them in a thread
+pool instead:
+
+* the callback runner of a subscription still waits for each callback, so
+  callbacks of one subscription see the responses in order;
+* the number of simultaneous runs of one callback (shared by several
+  subscriptions) is limited by ``max_concurrency``;
+* a callback still running after ``timeout`` seconds is logged. It is not
+  interrupted, a thread can not be cancelled.
+
+One executor is meant to be shared by many cycle queries, e.g. all queries
+of one client (``BaseClientAPI.callback_executor``).
+
+Async callbacks stay on the event loop; :class:`CallbackDispatch` chooses
+whether callbacks of one subscription are awaited one after another or in
+parallel.
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from enum import Enum
+from typing import Callable, Dict, Optional
+
+__all__ = ['CallbackDispatch', 'CallbackExecutor']
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+class CallbackDispatch(str, Enum):
+    """How async callbacks of one cycle query are awaited for every response."""
+
+    # one after another, the next response waits for all of them
+    SEQUENTIAL = 'sequential'
+    # all at once (gathered), the next response waits for the slowest one
+    CONCURRENT = 'concurrent'
+    # every callback has its own task and queue: it gets responses in order, callbacks run in parallel and the next
+    # response does not wait for them
+    PER_CALLBACK = 'per_callback'
+
+
+class _CallbackLimit:
+    """Concurrency limit of one callback and the number of runs using it."""
+
+    __slots__ = ('semaphore', 'users')
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(max_concurrency)
+        self.users: int = 0
+
+
+class CallbackExecutor:
+    """
+    Executor of cycle query callbacks.
+
+    :param max_workers: number of threads of the pool created by this executor, ignored if `executor` is given
+    :param executor: `concurrent.futures.Executor` to run sync callbacks in, it is not shut down by this object
+    :param timeout: time in seconds after which a still running callback is logged, None - never
+    :param max_concurrency: maximum number of simultaneous runs of one callback
+    """
+
+    def __init__(self, max_workers: int = None, executor: Executor = None, timeout: float = None,
+                 max_concurrency: int = 1):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+        self._own_executor: bool = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='obcom-callback')
+        self._executor: Executor = executor
+        self._timeout: Optional[float] = timeout
+        self._max_concurrency: int = max_concurrency
+        self._limits: Dict[Callable, _CallbackLimit] = {}
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return self._timeout
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    async def run_sync(self, method: Callable, *args, owner=None):
+        """
+        Run a sync callback in the thread pool and wait for its result.
+
+        :param method: no async method
+        :param args: arguments of the method
+        :param owner: object used in logs (cycle query)
+        :raise: exception raised by the method
+        :return: result of the method
+        """
+        limit = self._limits.get(method)
+        if limit is None:
+            limit = self._limits[method] = _CallbackLimit(self._max_concurrency)
+        limit.users += 1
+        try:
+            async with limit.semaphore:
+                future = asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+                return await self._wait_logging_timeout(future, method, owner)
+        finally:
+            limit.users -= 1
+            if not limit.users:
+                del self._limits[method]
+
+    async def _wait_logging_timeout(self, future: asyncio.Future, method: Callable, owner):
+        if self._timeout is None:
+            return await future
+        start = time.monotonic()
+        done, _ = await asyncio.wait({future}, timeout=self._timeout)
+        if not done:
+            logger.warning(f"{owner}: callback {getattr(method, '__name__', method)} is running longer than "
+                           f"{self._timeout} s")
+            result = await future
+            logger.warning(f"{owner}: callback {getattr(method, '__name__', method)} finished after "
+                           f"{time.monotonic() - start:.3f} s")
+            return result
+        return future.result()
+
+    def shutdown(self, wait: bool = True):
+        """Shut down the thread pool created by this executor."""
+        if self._own_executor:
+            self._executor.shutdown(wait=wait)
@@ -0,0 +1,157 @@
+"""Client-side filtering of cycle query updates.
+
+A subscription delivers every change of a value, and a noisy one (a
+temperature jittering in the fourth decimal place) runs every callback and
+redraws every plot on every tiny change. A :class:`ChangeFilter` given to a
+cycle query drops such updates before they reach any consumer: iterators,
+callbacks and ``get_response`` waiters are not woken by a filtered update.
+
+* ``abs_deadband`` / ``rel_deadband`` - a numeric value is a change only if
+  it moved more than the deadband from the last delivered value. Small
+  moves are accumulated, a slow drift is delivered once it exceeds the
+  deadband;
+* ``min_interval`` - updates are delivered not more often than this. An
+  update coming too early is held and the newest significant one is
+  delivered when the interval has passed, so the last change is never lost;
+* ``changed_fields_only`` - dict values are delivered with only the keys
+  that changed (or were added) since the last delivered value.
+
+Errors are never filtered. An update of a multi-address query is delivered
+when at least one of its values changed.
+"""
+
+from dataclasses import dataclass, replace
+from numbers import Number
+from typing import Any, Dict, List, Optional
+
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueResponse
+
+__all__ = ['ChangeFilter']
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class ChangeFilter:
+    """
+    Filter of the updates of one subscription.
+
+    :param abs_deadband: minimal absolute change of a numeric value, None - any change
+    :param rel_deadband: minimal change of a numeric value relative to the last delivered one (0.01 - 1 %),
+        None - any change. With both deadbands set a change must exceed both
+    :param min_interval: minimal time in seconds between delivered updates, None - no limit
+    :param changed_fields_only: deliver dict values with the changed keys only. Deadbands apply to every numeric
+        field
+    """
+
+    abs_deadband: Optional[float] = None
+    rel_deadband: Optional[float] = None
+    min_interval: Optional[float] = None
+    changed_fields_only: bool = False
+
+    def __post_init__(self):
+        for name in ('abs_deadband', 'rel_deadband', 'min_interval'):
+            value = getattr(self, name)
+            if value is not None and value < 0:
+                raise ValueError(f"{name} can not be negative, got {value}")
+
+    def _make_state(self) -> '_ChangeFilterState':
+        return _ChangeFilterState(self)
+
+
+class _ChangeFilterState:
+    """Last delivered values of one cycle query, compared with new updates."""
+
+    def __init__(self, change_filter: ChangeFilter):
+        self.filter: ChangeFilter = change_filter
+        self._delivered: Dict[int, Any] = {}  # index of the response -> last delivered `v`
+        self._delivered_count: Optional[int] = None
+        self._last_time: Optional[float] = None
+
+    def reset(self):
+        self._delivered.clear()
+        self._delivered_count = None
+        self._last_time = None
+
+    def wait_time(self, now: float) -> float:
+        """Return how long an update has to be held because of `min_interval`."""
+        if self.filter.min_interval is None or self._last_time is None:
+            return 0.0
+        return self._last_time + self.filter.min_interval - now
+
+    def is_significant(self, responses: List[ValueResponse]) -> bool:
+        """Return True if the update differs enough from the last delivered one."""
+        if self._delivered_count != len(responses):
+            return True
+        for i, response in enumerate(responses):
+            if not response.status or response.value is None:
+                return True
+            old = self._delivered.get(i, _MISSING)
+            if old is _MISSING:
+                return True
+            new = response.value.v
+            if isinstance(new, dict) and isinstance(old, dict):
+                if self._changed_keys(old, new):
+                    return True
+            elif self._changed(old, new):
+                return True
+        return False
+
+    def shape(self, responses: List[ValueResponse]) -> List[ValueResponse]:
+        """Return the update as delivered to consumers (changed dict fields only), remember it as delivered."""
+        if self._delivered_count != len(responses):
+            self._delivered.clear()
+        shaped = []
+        for i, response in enumerate(responses):
+            shaped.append(response)
+            if response.value is None:
+                continue
+            old = self._delivered.get(i, _MISSING)
+            new = response.value.v
+            if isinstance(new, dict) and isinstance(old, dict):
+                # only the delivered fields move, small moves of the others keep accumulating
+                keys = self._changed_keys(old, new)
+                delivered = dict(old)
+                for k in keys:
+                    if k in new:
+                        delivered[k] = new[k]
+                    else:
+                        delivered.pop(k, None)
+                self._delivered[i] = delivered
+                if self.filter.changed_fields_only:
+                    value = response.value
+                    changed = Value(v={k: new[k] for k in keys if k in new}, ts=value.ts, value_type=value.type,
+                                    tags=value.tags)
+                    shaped[i] = replace(response, value=changed)
+            elif old is _MISSING or self._changed(old, new):
+                self._delivered[i] = new
+        self._delivered_count = len(responses)
+        return shaped
+
+    def delivered_at(self, now: float):
+        self._last_time = now
+
+    def _changed_keys(self, old: dict, new: dict) -> List:
+        keys = [k for k, v in new.items() if k not in old or self._changed(old[k], v)]
+        keys.extend(k for k in old if k not in new)
+        return keys
+
+    def _changed(self, old, new) -> bool:
+        if self._is_number(old) and self._is_number(new):
+            diff = abs(new - old)
+            if self.filter.abs_deadband is None and self.filter.rel_deadband is None:
+                return diff != 0
+            if self.filter.abs_deadband is not None and diff <= self.filter.abs_deadband:
+                return False
+            if self.filter.rel_deadband is not None and diff <= self.filter.rel_deadband * abs(old):
+                return False
+            return True
+        try:
+            return bool(old != new)
+        except Exception:  # values without a plain equality (e.g. arrays) are treated as changed
+            return True
+
+    @staticmethod
+    def _is_number(value) -> bool:
+        return isinstance(value, Number) and not isinstance(value, bool)
@@ -0,0 +1,112 @@
+"""Addresses changed in one update of a multi-address cycle query.
+
+A cycle query with many requests delivers the whole ``List[ValueResponse]``
+on every update, also when only one of the values changed. A
+:class:`ChangeSet` tells which responses are new: a response changed when
+its `Value.ts` (or its status) differs from the response to the same request
+in the previous update. It is available as ``BaseCycleQuery.last_changes``
+and ``ResponseSubscription.last_changes``, and it routes the responses to the
+callbacks registered per address (``add_address_callback_method``).
+"""
+
+from typing import Iterator, List, Optional, Tuple
+
+from obcom.data_colection.address import Address
+from obcom.data_colection.value_call import ValueResponse
+
+__all__ = ['ChangeSet']
+
+
+class ChangeSet:
+    """
+    Responses of one update which changed since the previous update.
+
+    :param responses: all responses of the update
+    :param indexes: positions of the changed responses
+    """
+
+    __slots__ = ('_responses', '_indexes', '_by_address')
+
+    def __init__(self, responses: List[ValueResponse], indexes: Tuple[int, ...]):
+        self._responses: List[ValueResponse] = responses
+        self._indexes: Tuple[int, ...] = indexes
+        self._by_address: Optional[dict] = None
+
+    @property
+    def responses(self) -> List[ValueResponse]:
+        """All responses of the update."""
+        return self._responses
+
+    @property
+    def indexes(self) -> Tuple[int, ...]:
+        """Positions of the changed responses in :attr:`responses`."""
+        return self._indexes
+
+    @property
+    def changed(self) -> List[ValueResponse]:
+        """The changed responses."""
+        return [self._responses[i] for i in self._indexes]
+
+    @property
+    def addresses(self) -> List[str]:
+        """Addresses of the changed responses."""
+        return list(self._index())
+
+    def get(self, address: str or Address) -> Optional[ValueResponse]:
+        """Return the response of `address` if it changed, else None."""
+        return self._index().get(str(address))
+
+    def _index(self) -> dict:
+        if self._by_address is None:
+            self._by_address = {str(self._responses[i].address): self._responses[i] for i in self._indexes}
+        return self._by_address
+
+    def __contains__(self, address: str or Address) -> bool:
+        return str(address) in self._index()
+
+    def __iter__(self) -> Iterator[ValueResponse]:
+        return (self._responses[i] for i in self._indexes)
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __repr__(self):
+        return f"ChangeSet({len(self._indexes)}/{len(self._responses)}: {self.addresses})"
+
+
+def _signature(response: ValueResponse) -> tuple:
+    """Status and `Value.ts` of the response, equal signatures mean an unchanged response."""
+    return response.status, response.value.ts if response.value is not None else None
+
+
+class _ChangeTracker:
+    """Signature (status, `Value.ts`) of the last delivered response to every request."""
+
+    __slots__ = ('_signatures',)
+
+    def __init__(self):
+        self._signatures: list = []
+
+    def reset(self):
+        self._signatures = []
+
+    def add(self):
+        """A request was appended, its first response is a change."""
+        if self._signatures:
+            self._signatures.append(None)
+
+    def remove(self, index: int):
+        """The request at `index` was removed."""
+        if index < len(self._signatures):
+            del self._signatures[index]
+
+    def update(self, responses: List[ValueResponse]) -> ChangeSet:
+        """Compare `responses` with the previous update and remember them."""
+        signatures = [_signature(r) for r in responses]
+        previous = self._signatures
+        if len(previous) != len(signatures):
+            indexes = tuple(range(len(signatures)))
+        else:
+            indexes = tuple(i for i, (old, new) in enumerate(zip(previous, signatures)) if old != new)
+        self._signatures = signatures
+        return ChangeSet(responses, indexes)
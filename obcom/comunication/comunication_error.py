@@ -20,3 +20,11 @@ class CommunicationRuntimeError(BaseCommunicationError):
 
     def __init__(self, message='', **kwargs):
         super().__init__(message=message, **kwargs)
+
+
+class CircuitOpenError(CommunicationRuntimeError):
+    """The request was not sent, the circuit breaker of its address is open."""
+
+    def __init__(self, message='The circuit of the address is open', retry_after: float = 0.0, **kwargs):
+        self.retry_after: float = retry_after
+        super().__init__(message=message, **kwargs)
@@ -0,0 +1,189 @@
+"""One driver stepping many cycle queries.
+
+A cycle query normally runs two tasks of its own for its whole life: the
+loop sending the requests and the callback runner. A process with 2000
+subscriptions has 4000 tasks, each woken on every cycle. Queries attached to
+a :class:`CycleQueryDriver` run no task of their own: the wait before the next
+request is a timer of the event loop (``call_at``), a task exists only while
+a request is in flight, and the responses of all queries are processed one
+after another by a single driver task, which exits when there is nothing to
+process. An idle query (waiting for its next tick or backoff, or paused) costs
+a timer handle and no task; a ``ConditionalCycleQuery`` waiting in a long-poll
+costs just the task of the request. Callbacks of a driven query run in a
+task created when an update for them arrives and finished when they are done.
+Query types without a stepped driven mode run their whole loop in the task
+of the request.
+
+::
+
+    driver = CycleQueryDriver()
+    cq = PeriodicCycleQuery(crs=crs, list_request=requests, delay=1, driver=driver)
+    cq.start()
+
+A driven query behaves like a query running its own tasks (states, error
+policy, consumers, pause/resume, runtime changes of requests and delay), with
+these differences:
+
+* streaming ``ConditionalCycleQuery`` and ``PeriodicCycleQuery`` with a
+  ``scheduler`` can not be driven, they already share their task,
+* responses are processed in turn, a consumer queue with
+  ``OverflowPolicy.BLOCK`` which is full holds up every driven query.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from obcom.comunication.cycle_query import BaseCycleQuery
+
+__all__ = ['CycleQueryDriver']
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+class _Driven:
+    """Timer and request in flight of one attached query."""
+
+    __slots__ = ('timer', 'send', 'paused')
+
+    def __init__(self):
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.send: Optional[asyncio.Task] = None
+        self.paused: bool = False  # the timer fired while the query was paused, nothing is scheduled
+
+
+class CycleQueryDriver:
+    """
+    Single driver of cycle queries created with the `driver` parameter (or `BaseCycleQuery.set_driver`).
+
+    :param loop: async loop, default - the running loop when the first query is attached
+    """
+
+    def __init__(self, loop=None):
+        self._loop = loop
+        self._queries: Dict[BaseCycleQuery, _Driven] = {}
+        self._ready: Deque[Tuple[BaseCycleQuery, asyncio.Task]] = deque()  # finished requests to process
+        self._task: Optional[asyncio.Task] = None
+
+    def _get_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop
+
+    def queries_count(self) -> int:
+        """Return number of running queries attached to this driver."""
+        return len(self._queries)
+
+    def in_flight_count(self) -> int:
+        """Return number of attached queries with a request waiting for its response."""
+        return sum(1 for d in self._queries.values() if d.send is not None)
+
+    def is_running(self) -> bool:
+        """Return True if the driver task is processing responses now."""
+        return self._task is not None and not self._task.done()
+
+    def close(self):
+        """Stop every attached query."""
+        for cq in list(self._queries):
+            cq.stop()
+
+    def _attach(self, cq: BaseCycleQuery):
+        reason = cq._driver_unsupported()
+        if reason is not None:
+            raise ValueError(f"{cq}: can not be driven, {reason}")
+        self._get_loop()
+        self._queries[cq] = _Driven()
+        self._schedule(cq, cq._driven_begin())
+
+    def _detach(self, cq: BaseCycleQuery) -> Optional[asyncio.Task]:
+        """Remove `cq` from the driver, return its cancelled request task (if any) to be awaited."""
+        driven = self._queries.pop(cq, None)
+        if driven is not None:
+            return self._cancel(driven)
+        return None
+
+    @staticmethod
+    def _cancel(driven: _Driven) -> Optional[asyncio.Task]:
+        if driven.timer is not None:
+            driven.timer.cancel()
+            driven.timer = None
+        send, driven.send = driven.send, None
+        if send is not None:
+            send.cancel()
+        return send
+
+    def _schedule(self, cq: BaseCycleQuery, when: float):
+        driven = self._queries[cq]
+        driven.paused = False
+        if when <= self._loop.time():
+            driven.timer = self._loop.call_soon(self._fire, cq)
+        else:
+            driven.timer = self._loop.call_at(when, self._fire, cq)
+
+    def _interrupt(self, cq: BaseCycleQuery):
+        """Abandon the request in flight (or the wait) of `cq`, its parameters changed."""
+        driven = self._queries.get(cq)
+        if driven is None or driven.paused:
+            return
+        self._cancel(driven)
+        self._schedule(cq, cq._driven_reschedule())
+
+    def _retime(self, cq: BaseCycleQuery):
+        """The interval of `cq` changed, move its pending timer."""
+        driven = self._queries.get(cq)
+        if driven is None or driven.timer is None:
+            return
+        driven.timer.cancel()
+        self._schedule(cq, cq._driven_reschedule())
+
+    def _resume(self, cq: BaseCycleQuery):
+        driven = self._queries.get(cq)
+        if driven is not None and driven.paused:
+            self._schedule(cq, cq._driven_resume())
+
+    def _fire(self, cq: BaseCycleQuery):
+        driven = self._queries.get(cq)
+        if driven is None:
+            return
+        driven.timer = None
+        if cq.is_paused():
+            driven.paused = True
+            return
+        send = driven.send = self._loop.create_task(cq._driven_send())
+        send.add_done_callback(lambda task: self._on_sent(cq, task))
+
+    def _on_sent(self, cq: BaseCycleQuery, send: asyncio.Task):
+        driven = self._queries.get(cq)
+        if driven is None or driven.send is not send:
+            return  # abandoned (stopped, interrupted)
+        # `send` stays in `driven.send` until processed, an interruption meanwhile drops the response
+        self._ready.append((cq, send))
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._process())
+
+    async def _process(self):
+        """Body of the driver task: process the finished requests, exit when there are none."""
+        while self._ready:
+            cq, send = self._ready.popleft()
+            driven = self._queries.get(cq)
+            if driven is None or driven.send is not send:
+                continue
+            if send.cancelled():
+                # cancelled by somebody else, the query goes on as after an interruption
+                next_send = cq._driven_reschedule()
+            else:
+                try:
+                    next_send = await cq._driven_result(send)
+                except Exception as e:
+                    logger.exception(f"{cq}: processing of the response raised {type(e).__name__}: {e}")
+                    next_send = None
+            if self._queries.get(cq) is not driven:
+                continue  # stopped meanwhile
+            if next_send is None:
+                self._detach(cq)
+                cq._finish()
+            elif driven.send is send:
+                driven.send = None
+                self._schedule(cq, next_send)
+            # else interrupted meanwhile, already rescheduled by `_interrupt`
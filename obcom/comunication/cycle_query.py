@@ -1,20 +1,35 @@
 import asyncio
+import contextlib
 import logging
 import time
 import warnings
-from typing import Dict, List, Optional
+from collections import deque
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
 
 from obcom.comunication.base_client_request_solver import BaseClientRequestSolver
+from obcom.comunication.callback_executor import CallbackDispatch, CallbackExecutor
+from obcom.comunication.change_filter import ChangeFilter, _ChangeFilterState
+from obcom.comunication.change_set import ChangeSet, _ChangeTracker
 from obcom.comunication.comunication_error import CommunicationRuntimeError, CommunicationTimeoutError
+from obcom.comunication.rate_control import AimdRateController
+from obcom.comunication.response_queue import OverflowPolicy, ResponseSubscription, _ResponseQueue
+from obcom.comunication.value_stream import BaseValueStream
 from obcom.comunication.error_policy import (
     Backoff,
+    CircuitBreakerRegistry,
     ErrorPolicy,
+    RetryLimiter,
+    RetryThrottle,
     SeverityAction,
     SeverityRule,
     _LogPolicyState,
 )
+from obcom.data_colection.address import Address
+from obcom.data_colection.coded_error import TreeOtherError
 from obcom.data_colection.response_error import ResponseError
-from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from obcom.data_colection.value_call import ValueRequest, ValueRequestTemplate, ValueResponse
 from abc import ABC, abstractmethod
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
@@ -25,6 +40,172 @@ logger = logging.getLogger(__name__.rsplit('.')[-1])
 _CATCH_ALL_RETRY_DELAY = 60.0
 
 
+class CycleQueryState(str, Enum):
+    """Lifecycle state of a cycle query."""
+
+    STARTING = 'starting'  # started, main task not running yet
+    RUNNING = 'running'
+    PAUSED = 'paused'  # running, but not sending requests nor delivering responses until resumed
+    STOPPING = 'stopping'  # stop requested, main task not finished yet
+    STOPPED = 'stopped'
+
+
+class MissedTickPolicy(str, Enum):
+    """What a `PeriodicCycleQuery` does with ticks that passed while the previous request was still running."""
+
+    SKIP = 'skip'  # continue with the next tick in the future, the missed ones are counted
+    CATCH_UP = 'catch_up'  # send one request for every missed tick without waiting (at most `MAX_CATCH_UP_TICKS`)
+    REPORT = 'report'  # like SKIP, and every skip is logged as a warning
+
+
+@dataclass
+class TickStats:
+    """Observed schedule of a periodic cycle query, compare `actual period` with the configured `period`."""
+
+    period: float  # configured period (`delay`)
+    ticks: int = 0  # number of ticks fired
+    missed_ticks: int = 0  # number of ticks skipped
+    last_period: Optional[float] = None  # time between the last two ticks
+    mean_period: Optional[float] = None  # mean time between ticks
+    max_lateness: float = 0.0  # biggest delay of a tick after its scheduled time
+    current_period: Optional[float] = None  # interval used for the next tick (differs from `period` when adaptive)
+    _first: Optional[float] = field(default=None, repr=False, compare=False)
+    _last: Optional[float] = field(default=None, repr=False, compare=False)
+
+    def _record(self, now: float, lateness: float = 0.0):
+        if self._last is not None:
+            self.last_period = now - self._last
+        if self._first is None:
+            self._first = now
+        self._last = now
+        self.ticks += 1
+        if self.ticks > 1:
+            self.mean_period = (now - self._first) / (self.ticks - 1)
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+
+
+@dataclass(frozen=True)
+class AdaptiveRate:
+    """
+    Adaptive polling interval of a `PeriodicCycleQuery`.
+
+    After every response without a change (same status, `v` and `ts` of every value as in the previous response) the
+    interval is multiplied by `factor` up to `max_delay`; a response with a change puts it back to `min_delay`.
+
+    :param max_delay: longest interval between requests
+    :param min_delay: interval used while values change, None - `delay` of the query
+    :param factor: growth of the interval after each response without a change
+    :param compare_ts: whether a new `ts` with the same `v` is a change. False suits values re-sampled with the same
+        reading (e.g. a parked mount)
+    """
+
+    max_delay: float
+    min_delay: Optional[float] = None
+    factor: float = 2.0
+    compare_ts: bool = True
+
+    def __post_init__(self):
+        if self.factor <= 1:
+            raise ValueError(f"factor must be greater than 1, got {self.factor}")
+        if self.min_delay is not None and not 0 < self.min_delay <= self.max_delay:
+            raise ValueError(f"min_delay must be in (0, max_delay], got {self.min_delay}")
+
+
+@dataclass(frozen=True)
+class AdaptiveTimeout:
+    """
+    Long-poll horizon (`request_timeout`) of a `ConditionalCycleQuery` adapted per address.
+
+    The horizon of an address is `factor` times the mean interval between its changes, so a value changing once a day
+    is not renewed (4004) every `request_timeout`. A long-poll expiring without a change counts the quiet time as an
+    interval, the horizon of a quiet address grows by about `factor` per renewal. Bounds declared by the server in the
+    expiry response (`min_request_timeout` / `max_request_timeout`) narrow `min_timeout` / `max_timeout`.
+
+    :param max_timeout: longest horizon
+    :param min_timeout: shortest horizon
+    :param factor: horizon as a multiple of the mean interval between changes
+    :param smoothing: weight of a new interval in the mean (exponential moving average)
+    """
+
+    max_timeout: float = 600.0
+    min_timeout: float = 10.0
+    factor: float = 2.0
+    smoothing: float = 0.3
+
+    def __post_init__(self):
+        if not 0 < self.min_timeout <= self.max_timeout:
+            raise ValueError(f"min_timeout must be in (0, max_timeout], got {self.min_timeout}")
+        if self.factor < 1:
+            raise ValueError(f"factor must be at least 1, got {self.factor}")
+        if not 0 < self.smoothing <= 1:
+            raise ValueError(f"smoothing must be in (0, 1], got {self.smoothing}")
+
+
+class _Horizon:
+    """Observed change intervals of one address and its long-poll horizon, see :class:`AdaptiveTimeout`."""
+
+    __slots__ = ('timeout', 'mean', 'last_ts', 'last_change', 'server_min', 'server_max')
+
+    def __init__(self, timeout: float):
+        self.timeout: float = timeout
+        self.mean: Optional[float] = None  # mean interval between changes
+        self.last_ts: Optional[float] = None  # `Value.ts` of the last change
+        self.last_change: Optional[float] = None  # wall time the last change was received
+        self.server_min: Optional[float] = None
+        self.server_max: Optional[float] = None
+
+    def changed(self, ts: float, now: float, adaptive: AdaptiveTimeout):
+        if ts == self.last_ts:
+            return
+        if self.last_ts is not None and ts > self.last_ts:
+            self._add_interval(ts - self.last_ts, adaptive)
+        self.last_ts = ts
+        self.last_change = now
+
+    def expired(self, now: float, error: ResponseError, adaptive: AdaptiveTimeout):
+        bounds = error.kwargs
+        if 'min_request_timeout' in bounds:
+            self.server_min = bounds['min_request_timeout']
+        if 'max_request_timeout' in bounds:
+            self.server_max = bounds['max_request_timeout']
+        if self.last_change is None:
+            self.last_change = now - self.timeout
+        # nothing changed for the whole horizon, the interval is at least that long
+        quiet = now - self.last_change
+        if self.mean is None or quiet > self.mean:
+            self.mean = quiet
+        self._update(adaptive)
+
+    def _add_interval(self, interval: float, adaptive: AdaptiveTimeout):
+        self.mean = interval if self.mean is None else self.mean + adaptive.smoothing * (interval - self.mean)
+        self._update(adaptive)
+
+    def _update(self, adaptive: AdaptiveTimeout):
+        timeout = max(adaptive.min_timeout, min(adaptive.max_timeout, adaptive.factor * self.mean))
+        # bounds of the server win over the configured ones
+        if self.server_max is not None:
+            timeout = min(timeout, self.server_max)
+        if self.server_min is not None:
+            timeout = max(timeout, self.server_min)
+        self.timeout = timeout
+
+
+class _ResponseOutcome(Enum):
+    """What the cycle query does with a response after the error policy was consulted."""
+
+    PUBLISH = 'publish'    # deliver to consumers
+    NOTIFY = 'notify'      # deliver to consumers, then retry
+    RETRY = 'retry'        # retry silently
+    RENEW = 'renew'        # the long-poll expired (4004), poll again, not a retry
+
+
+def _supports_streaming(crs) -> bool:
+    """True if the request solver can open server-pushed streams."""
+    supports = getattr(crs, 'supports_streaming', None)
+    return bool(supports is not None and supports())
+
+
 class _SeverityRetryState:
     """Per-severity bookkeeping for one subscription.
 
@@ -36,17 +217,20 @@ class _SeverityRetryState:
     being stuck in throttled mode forever.
     """
 
-    __slots__ = ('attempts', 'started_monotonic', 'log_state')
+    __slots__ = ('attempts', 'started_monotonic', 'log_state', 'last_delay', 'clock')
 
-    def __init__(self, rule: SeverityRule) -> None:
+    def __init__(self, rule: SeverityRule, clock=time) -> None:
+        self.clock = clock
         self.attempts: int = 0
-        self.started_monotonic: float = time.monotonic()
-        self.log_state: _LogPolicyState = rule.log.make_state()
+        self.started_monotonic: float = clock.monotonic()
+        self.log_state: _LogPolicyState = rule.log.make_state(clock)
+        self.last_delay: Optional[float] = None  # previous backoff delay, used by decorrelated jitter
 
     def reset(self, rule: SeverityRule) -> None:
         self.attempts = 0
-        self.started_monotonic = time.monotonic()
-        self.log_state = rule.log.make_state()
+        self.started_monotonic = self.clock.monotonic()
+        self.log_state = rule.log.make_state(self.clock)
+        self.last_delay = None
 
 
 def _ignore_errors_to_policy(ignore_errors: bool) -> ErrorPolicy:
@@ -71,7 +255,9 @@ class BaseCycleQuery(ABC):
     """
     This is an abstract class that represents a circular query. It can only be created in a running asynchronous event
     loop or elsewhere when an asynchronous event loop is supplied in the argument. the class provides the methods
-    'get_response', thanks to which you can wait for the next message for any number of tasks.
+    'get_response', thanks to which you can wait for the next message for any number of tasks. A consumer which must
+    not miss messages iterates over the query instead (``async for responses in cq``, see `iterate`), every iterator
+    has its own bounded queue.
 
     After creating the circular query object, call the `start()` method to start communication with the server.
     To cancel the query, call the `stop()` method. The `stop()` method will be automatically called when the object
@@ -86,20 +272,43 @@ class BaseCycleQuery(ABC):
         set from -1 to inf. If it is ste to -1 that mean isn't max missed messages and query will be renewing all time
     :param ignore_errors: flag to ignore errors. If the server returns an error other than temporary, the situation
         will be treated as a failed attempt and will be re-requested.
+    :param callback_executor: executor running the sync callbacks in a thread pool, see
+        :class:`.callback_executor.CallbackExecutor`. Default None - sync callbacks are called on the event loop
+    :param callback_dispatch: how async callbacks are awaited, see :class:`.callback_executor.CallbackDispatch`.
+        Default `CallbackDispatch.SEQUENTIAL`
+    :param change_filter: client-side deadband / minimum interval / changed fields filter, see
+        :class:`.change_filter.ChangeFilter`. Filtered updates do not wake any consumer. Default None - every update
+        is delivered
+    :param driver: run the query in a shared driver instead of its own tasks, see
+        :class:`.cycle_driver.CycleQueryDriver`. Default None - own tasks
+    :param clock: source of the wall (`time()`) and monotonic (`monotonic()`) time of the query and the retry state
+        of its error policy, default - the `time` module
     :raise CommunicationRuntimeError: if not provide async loop and czn not get existing loop
     """
 
     DEFAULT_DELAY = 5
     DEFAULT_MAX_MISSED_MSG = 3
     DEFAULT_REQUEST_TIMEOUT = 30
+    # queue of a consumer created by `iterate()` / `async for`
+    DEFAULT_QUEUE_SIZE = 64
+    DEFAULT_OVERFLOW = OverflowPolicy.DROP_OLDEST
+    # queue of the callback runner task
+    CALLBACK_QUEUE_SIZE = 16
+    CALLBACK_OVERFLOW = OverflowPolicy.DROP_OLDEST
 
     def __init__(self, crs: BaseClientRequestSolver, list_request: List[ValueRequest], delay: float or None = None,
                  loop=None, query_name: str = 'Default cycle query', max_missed_msg: int = None,
-                 ignore_errors: bool = False, error_policy: Optional[ErrorPolicy] = None, **kwargs):
+                 ignore_errors: bool = False, error_policy: Optional[ErrorPolicy] = None,
+                 callback_executor: Optional[CallbackExecutor] = None,
+                 callback_dispatch: CallbackDispatch = CallbackDispatch.SEQUENTIAL,
+                 change_filter: Optional[ChangeFilter] = None, driver: 'CycleQueryDriver' = None, clock=time,
+                 **kwargs):
         self._query_name = query_name
+        self._clock = clock
         self._CRS: BaseClientRequestSolver = crs
         self._event: asyncio.Event = asyncio.Event()
         self._last_response: List[ValueResponse] = []
+        self._delivered_response: List[ValueResponse] = []  # last response given to consumers (after the filter)
         if delay is None or delay <= 0:
             delay = self.DEFAULT_DELAY
         self._delay: float = delay
@@ -107,15 +316,45 @@ class BaseCycleQuery(ABC):
             max_missed_msg = self.DEFAULT_MAX_MISSED_MSG
         self._max_missed_msg: int = max_missed_msg  # can be number from -1 to inf
         self._task: asyncio.Task or None = None
+        self._driver: Optional['CycleQueryDriver'] = driver
+        self._driven: bool = False  # running in `_driver`
+        self._missed: int = 0  # requests without a response in a row
+        self._abandoned_send: Optional[asyncio.Task] = None  # request task of a driven query cancelled by `stop`
+        self._callback_pending: Deque[tuple] = deque()  # updates for the callbacks of a driven query
+        self._callback_wake: Optional[asyncio.Future] = None  # set by a new update for the callbacks of a driven query
+        self._state: CycleQueryState = CycleQueryState.STOPPED
+        self._state_listeners: List[Callable[['BaseCycleQuery', CycleQueryState, CycleQueryState], None]] = []
+        self._requests_listeners: List[Callable[['BaseCycleQuery', List[str], List[str]], None]] = []
+        # changed by every `add_request` / `remove_request`, a response to an older list is not used
+        self._requests_version: int = 0
+        self._requests_changed: Optional[asyncio.Future] = None  # set by `_wake_requests`, see `_send_wakeable`
+        self._resumed: asyncio.Event = asyncio.Event()  # cleared while paused
+        self._resumed.set()
         self._loop = loop
         self._set_loop()  # can raise CommunicationRuntimeError
         self._list_request: List[ValueRequest] = list_request
         self._additional_request_data = [{} for _ in range(
             len(self._list_request))]  # data to put to nex request in `request_data` dict
+        # pre-encoded static part of every request, rebuilt only when the static fields change
+        self._templates: List[Optional[ValueRequestTemplate]] = [None] * len(self._list_request)
         self._errors: CommunicationRuntimeError or None = None
         self._callback_methods_a: list = []
         self._callback_methods: list = []
         self._callback_task: asyncio.Task or None = None
+        self._callback_executor: Optional[CallbackExecutor] = callback_executor
+        self._callback_dispatch: CallbackDispatch = CallbackDispatch(callback_dispatch)
+        self._queues: List[_ResponseQueue] = []  # one per consumer created by `iterate()`
+        self._dropped_updates: int = 0
+        self._filter_state: Optional[_ChangeFilterState] = None
+        self._held_response: Optional[List[ValueResponse]] = None  # update waiting for `min_interval` of the filter
+        self._held_task: Optional[asyncio.Task] = None
+        self._filtered_updates: int = 0
+        self.set_change_filter(change_filter)
+        self._change_tracker: _ChangeTracker = _ChangeTracker()
+        self._last_changes: Optional[ChangeSet] = None
+        # callbacks of single addresses, run only when the address is in the change set
+        self._address_callbacks: Dict[str, list] = {}
+        self._address_callbacks_a: Dict[str, list] = {}
         # Resolve error policy. ``error_policy`` is the new public API;
         # ``ignore_errors`` is preserved for one release and translated
         # automatically when the new parameter is not set.
@@ -142,23 +381,215 @@ class BaseCycleQuery(ABC):
         # handler, derived from the normal rule's LogPolicy so SERVICE
         # daemons get the same first_n=3/then_every_seconds=3600 behaviour
         # they already use for structured errors.
-        self._catch_all_log_state: _LogPolicyState = error_policy.normal.log.make_state()
+        self._catch_all_log_state: _LogPolicyState = error_policy.normal.log.make_state(clock)
+        # the next send is a retry, it takes a token of the retry limiter of the error policy
+        self._retry_pending: bool = False
 
     def get_name(self):
         return self._query_name
 
+    def set_delay(self, delay: float):
+        """
+        Change the delay of the query, also when it is running. A request waiting for its response is re-sent with the
+        new delay.
+
+        :param delay: new delay, see the `delay` parameter of the query
+        """
+        if delay is None or delay <= 0:
+            raise ValueError(f"delay must be positive, got {delay}")
+        if delay == self._delay:
+            return
+        logger.debug(f"{self}: delay changed {self._delay} -> {delay}")
+        self._delay = delay
+        self._interrupt()
+
+    def pause(self):
+        """
+        Stop sending requests and delivering responses until :meth:`resume`. Unlike `stop` the query keeps its
+        state, e.g. `ConditionalCycleQuery` resumes from its last `time_of_known_change` without a full transfer.
+        A request waiting for its response is abandoned.
+        """
+        if not self._resumed.is_set():
+            return
+        self._resumed.clear()
+        if self._state == CycleQueryState.RUNNING:
+            self._set_state(CycleQueryState.PAUSED)
+        self._interrupt()
+
+    def resume(self):
+        """Continue a query paused with :meth:`pause`."""
+        if self._resumed.is_set():
+            return
+        self._resumed.set()
+        if self._state == CycleQueryState.PAUSED:
+            self._set_state(CycleQueryState.RUNNING)
+        if self._driven:
+            self._driver._resume(self)
+
+    def is_paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    async def _wait_resumed(self) -> bool:
+        """Wait while the query is paused, return True if it was."""
+        if self._resumed.is_set():
+            return False
+        logger.debug(f"{self}: paused")
+        await self._resumed.wait()
+        logger.debug(f"{self}: resumed")
+        return True
+
+    def _interrupt(self):
+        """Abandon a request waiting for its response (in `_send_wakeable`), the query parameters changed."""
+        self._requests_version += 1
+        self._wake_requests()
+        if self._driven:
+            self._driver._interrupt(self)
+
+    def get_delay(self) -> float:
+        return self._delay
+
+    @property
+    def state(self) -> CycleQueryState:
+        """Lifecycle state of this cycle query, tracked directly (no scan of the event loop tasks)."""
+        return self._state
+
+    def add_state_listener(self, listener: Callable[['BaseCycleQuery', CycleQueryState, CycleQueryState], None]):
+        """
+        Register a function called with (cycle query, old state, new state) on every state change.
+
+        :param listener: no async method
+        """
+        self._state_listeners.append(listener)
+
+    def remove_state_listener(self, listener):
+        if listener in self._state_listeners:
+            self._state_listeners.remove(listener)
+
+    def add_requests_listener(self, listener: Callable[['BaseCycleQuery', List[str], List[str]], None]):
+        """
+        Register a function called with (cycle query, added addresses, removed addresses) when requests are added or
+        removed at runtime.
+
+        :param listener: no async method
+        """
+        self._requests_listeners.append(listener)
+
+    def remove_requests_listener(self, listener):
+        if listener in self._requests_listeners:
+            self._requests_listeners.remove(listener)
+
+    def _set_state(self, state: CycleQueryState):
+        old = self._state
+        if old == state:
+            return
+        self._state = state
+        for listener in self._state_listeners:
+            try:
+                listener(self, old, state)
+            except Exception as e:
+                logger.exception(f"{self}: state listener raised {type(e).__name__}: {e}")
+
     def __repr__(self):
         addresses = ' '.join(str(r.address).rsplit('.', maxsplit=1)[-1] for r in self._list_request)
         return f'{self._query_name} [{addresses}]'
 
     def _get_list_request_with_extinction(self) -> List[ValueRequest]:
+        """
+        Build requests for the next send. Only the per-cycle fields (`time_of_data` and `request_data` with the
+        conditional state and additional error kwargs) are new objects, the rest is shared with the templates.
+        """
         out = []
         for i, r in enumerate(self._list_request):
-            new_r = r.copy()
-            new_r.request_data.update(self._additional_request_data[i])
-            out.append(new_r)
+            template = self._templates[i]
+            if template is None or not template.matches(r):
+                template = ValueRequestTemplate(r)
+                self._templates[i] = template
+            request_data = dict(r.request_data)
+            request_data.update(self._additional_request_data[i])
+            out.append(template.build(time_of_data=r.time_of_data, request_data=request_data))
         return out
 
+    def add_request(self, request: ValueRequest):
+        """
+        Add a request to the cycle query, also when it is running. It is sent from the next cycle; a waiting long-poll
+        of a `ConditionalCycleQuery` is interrupted, so the new address gets its value at once. The response of the
+        new address is appended at the end of the responses.
+
+        :param request: request of an address not requested by this query yet
+        :raise ValueError: if the address is already requested
+        """
+        address = str(request.address)
+        if any(str(r.address) == address for r in self._list_request):
+            raise ValueError(f"{self}: address {address} is already requested")
+        self._prepare_request(request)
+        # new lists, the list given to the constructor is not modified
+        self._list_request = self._list_request + [request]
+        self._additional_request_data = self._additional_request_data + [{}]
+        self._templates = self._templates + [None]
+        self._change_tracker.add()
+        self._requests_modified([address], [])
+
+    def remove_request(self, address: str or Address) -> bool:
+        """
+        Remove the request of `address` from the cycle query, also when it is running. The other requests keep their
+        state (e.g. `time_of_known_change` of a `ConditionalCycleQuery`), so no full resync is needed.
+
+        :param address: requested address
+        :raise ValueError: if it is the last request of the query, stop the query instead
+        :return: False if the address is not requested by this query
+        """
+        address = str(address)
+        index = next((i for i, r in enumerate(self._list_request) if str(r.address) == address), None)
+        if index is None:
+            return False
+        if len(self._list_request) == 1:
+            raise ValueError(f"{self}: can not remove the last request, stop the query instead")
+
+        def without(items: list) -> list:
+            return items[:index] + items[index + 1:]
+
+        self._list_request = without(self._list_request)
+        self._additional_request_data = without(self._additional_request_data)
+        self._templates = without(self._templates)
+        if index < len(self._last_response):
+            # keep the last responses aligned with the requests, they carry the conditional state of the next send
+            self._last_response = without(self._last_response)
+        self._change_tracker.remove(index)
+        self._requests_modified([], [address])
+        return True
+
+    def _prepare_request(self, request: ValueRequest):
+        """Set the fields the query needs on a new request."""
+
+    def _requests_modified(self, added: List[str], removed: List[str]):
+        for listener in self._requests_listeners:
+            try:
+                listener(self, added, removed)
+            except Exception as e:
+                logger.exception(f"{self}: requests listener raised {type(e).__name__}: {e}")
+        self._interrupt()
+
+    def _wake_requests(self):
+        """Interrupt a request waiting in `_send_wakeable`, the requests changed."""
+        if self._requests_changed is not None and not self._requests_changed.done():
+            self._requests_changed.set_result(None)
+
+    async def _send_wakeable(self, requests: List[ValueRequest], timeout: float) -> Optional[List[ValueResponse]]:
+        """
+        Send requests and wait for the response, return None when interrupted because the requests were changed.
+        """
+        send = self._loop.create_task(self._CRS.send_request(requests=requests, timeout=timeout, no_wait=False))
+        woken = self._requests_changed = self._loop.create_future()
+        try:
+            await asyncio.wait({send, woken}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._requests_changed = None
+            if not send.done():
+                send.cancel()
+        if send.cancelled() or not send.done():
+            return None
+        return send.result()
+
     async def get_response(self) -> List[ValueResponse]:
         """
         This method waits for the next response and returns it when it comes.
@@ -166,15 +597,187 @@ class BaseCycleQuery(ABC):
         :raise CommunicationRuntimeError: when cycle request loop was stopped or message can't retrieve for other reason
         :return: new response as object ValueResponse
         """
-        if not self.is_stopped() and not self._task.done():
+        if not self.is_stopped():
             await self._event.wait()
             await asyncio.sleep(0)  # let main task set event to false before return control to client's tasks
             if self._errors:
                 raise self._errors
-            return self._last_response
+            return self._delivered_response
         raise CommunicationRuntimeError(message=f"{self}: Query was stopped. before waiting for a reply "
                                                 f"you have to run them first")
 
+    async def start_and_get(self) -> List[ValueResponse]:
+        """
+        Start the query and return its first response, the current value, in one round trip. A consumer created right
+        after this call (`iterate`, `get_response`) gets every following response, so no change is missed between
+        reading the current value and subscribing.
+
+        :raise CommunicationRuntimeError: when the query finished with an error before the first response
+        :return: the first response
+        """
+        if not self.is_stopped():
+            raise CommunicationRuntimeError(message=f"{self}: This cycle query is already started")
+        with self.iterate(maxsize=1, overflow=OverflowPolicy.KEEP_LATEST) as first:
+            self.start()
+            return await first.get()
+
+    @property
+    def current_response(self) -> List[ValueResponse]:
+        """The response delivered last to consumers (after the change filter), empty before the first one."""
+        return self._delivered_response
+
+    def iterate(self, maxsize: int = None, overflow: OverflowPolicy = None) -> ResponseSubscription:
+        """
+        Create a consumer with its own bounded queue, receiving every response published from now on. Unlike
+        `get_response` a consumer busy with the previous response does not miss the next one; when the queue is full
+        the `overflow` policy decides what happens. ``async for responses in cq:`` uses the default queue.
+
+        :param maxsize: queue size, default `DEFAULT_QUEUE_SIZE`
+        :param overflow: policy for a full queue, default `DEFAULT_OVERFLOW`
+        :return: asynchronous iterator of responses
+        """
+        if maxsize is None:
+            maxsize = self.DEFAULT_QUEUE_SIZE
+        if overflow is None:
+            overflow = self.DEFAULT_OVERFLOW
+        queue = _ResponseQueue(maxsize=maxsize, overflow=OverflowPolicy(overflow))
+        self._queues.append(queue)
+        return ResponseSubscription(queue, self.is_stopped, self._detach_queue)
+
+    def __aiter__(self) -> ResponseSubscription:
+        return self.iterate()
+
+    def _detach_queue(self, queue: _ResponseQueue):
+        if queue in self._queues:
+            self._queues.remove(queue)
+
+    @property
+    def dropped_updates(self) -> int:
+        """Number of responses dropped in all consumer queues (including the callback runner) of this query."""
+        return self._dropped_updates
+
+    @property
+    def last_changes(self) -> Optional[ChangeSet]:
+        """
+        Responses changed (by `Value.ts`) in the last delivered update, see :class:`.change_set.ChangeSet`. A consumer
+        iterating over the query reads the change set of its own update from `ResponseSubscription.last_changes`.
+        """
+        return self._last_changes
+
+    @property
+    def filtered_updates(self) -> int:
+        """Number of updates dropped by the change filter."""
+        return self._filtered_updates
+
+    def set_change_filter(self, change_filter: Optional[ChangeFilter]):
+        """
+        Set the client-side filter of updates, see :class:`.change_filter.ChangeFilter`.
+
+        :param change_filter: filter or None - deliver every update
+        """
+        self._cancel_held()
+        self._filter_state = change_filter._make_state() if change_filter is not None else None
+
+    async def _publish(self):
+        """Deliver `_last_response` (or `_errors`) to every consumer queue and wake `get_response` waiters."""
+        state = self._filter_state
+        if state is None or self._errors is not None:
+            held = self._held_response if self._held_task is not None else None
+            self._cancel_held()
+            if held is not None:
+                # the update waiting for `min_interval` is not lost, it goes before the error
+                await self._deliver(held, None)
+            await self._deliver(self._last_response, self._errors)
+            return
+        if not state.is_significant(self._last_response):
+            self._filtered_updates += 1
+            return
+        if self._held_task is not None:
+            # an update is already waiting for `min_interval`, the newest significant one replaces it
+            self._held_response = self._last_response
+            return
+        wait = state.wait_time(self._loop.time())
+        if wait > 0:
+            self._held_response = self._last_response
+            self._held_task = self._loop.create_task(self._publish_held(wait))
+            return
+        await self._deliver(self._last_response, None)
+
+    async def _publish_held(self, wait: float):
+        await asyncio.sleep(wait)
+        self._held_task = None
+        response, self._held_response = self._held_response, None
+        if self._filter_state is not None and not self._filter_state.is_significant(response):
+            self._filtered_updates += 1
+            return
+        await self._deliver(response, None)
+        await asyncio.sleep(0)
+        self._event.clear()
+
+    def _cancel_held(self):
+        if self._held_task is not None:
+            self._held_task.cancel()
+            self._held_task = None
+        self._held_response = None
+
+    async def _deliver(self, response: List[ValueResponse], errors: Optional[Exception]):
+        if self._filter_state is not None and errors is None:
+            response = self._filter_state.shape(response)
+            self._filter_state.delivered_at(self._loop.time())
+        self._delivered_response = response
+        changes = self._change_tracker.update(response) if errors is None else ChangeSet(response, ())
+        self._last_changes = changes
+        item = (response, errors, changes)
+        for queue in list(self._queues):
+            dropped = queue.dropped
+            await queue.put(item)
+            if queue.dropped != dropped:
+                self._dropped_updates += queue.dropped - dropped
+                logger.debug(f"{self}: consumer too slow, {queue.dropped - dropped} response(s) dropped")
+        if self._driven and self._has_callbacks():
+            self._queue_driven_callbacks(item)
+        self._event.set()
+
+    def _throttled(self, delay: float) -> float:
+        """
+        Record a failed attempt in the retry throttle of the error policy (if any), return the delay of its retry:
+        `delay`, or the `suppressed_delay` of the throttle if the retry is suppressed.
+        """
+        throttle = self._error_policy.retry_throttle
+        if throttle is None:
+            return delay
+        return throttle.retry_delay(delay)
+
+    def _throttle_success(self):
+        throttle = self._error_policy.retry_throttle
+        if throttle is not None:
+            throttle.record_success()
+
+    def _retry_delay(self, delay: float) -> float:
+        """
+        Return the backoff `delay` before a retry and mark the next send as the retry. Its token of the retry limiter
+        of the error policy is taken right before the send, see `_take_retry_token`.
+        """
+        self._retry_pending = True
+        return delay
+
+    async def _take_retry_token(self) -> Optional[RetryLimiter]:
+        """
+        Wait for a token of the retry limiter of the error policy if the next send is a retry. Return the limiter the
+        token was taken from, the caller gives the token back (`RetryLimiter.release`) when the send is abandoned.
+        """
+        limiter = self._error_policy.retry_limiter
+        if not self._retry_pending or limiter is None:
+            return None
+        await limiter.acquire()
+        self._retry_pending = False
+        return limiter
+
+    def _give_back_retry_token(self, limiter: Optional[RetryLimiter]):
+        if limiter is not None:
+            limiter.release()
+            self._retry_pending = True
+
     @abstractmethod
     async def _send_message(self):
         raise NotImplementedError
@@ -184,8 +787,109 @@ class BaseCycleQuery(ABC):
             r.time_of_data = time_now
 
     def _run(self):
-        self._task = self._loop.create_task(self._send_message())
+        self._set_state(CycleQueryState.STARTING)
+        self._task = self._loop.create_task(self._main())
+        self._task.add_done_callback(self._on_task_done)
+        self._event.clear()
+
+    async def _main(self):
+        self._started()
+        await self._send_message()
+
+    def _started(self):
+        self._set_state(CycleQueryState.RUNNING if self._resumed.is_set() else CycleQueryState.PAUSED)
+        if self._filter_state is not None:
+            self._filter_state.reset()  # the first response after a start is always delivered
+        self._change_tracker.reset()
+
+    def _on_task_done(self, task: asyncio.Task):
+        if task is self._task:
+            self._finish()
+
+    def _finish(self):
+        self._driven = False
+        self._cancel_held()
+        # consumers get the queued responses and then the end of iteration
+        queues, self._queues = self._queues, []
+        for queue in queues:
+            queue.close()
+        self._set_state(CycleQueryState.STOPPED)
+
+    def set_driver(self, driver: Optional['CycleQueryDriver']):
+        """
+        Run the query in `driver` from the next start, see :class:`.cycle_driver.CycleQueryDriver`.
+
+        :param driver: driver or None to run own tasks
+        :raise ValueError: if the query is running or can not be driven
+        """
+        if not self.is_stopped():
+            raise ValueError(f"{self}: can not change the driver of a running query")
+        if driver is not None:
+            reason = self._driver_unsupported()
+            if reason is not None:
+                raise ValueError(f"{self}: can not be driven, {reason}")
+        self._driver = driver
+
+    @property
+    def driver(self) -> Optional['CycleQueryDriver']:
+        return self._driver
+
+    def _driver_unsupported(self) -> Optional[str]:
+        """Return why the query can not run in a driver, None if it can."""
+        return None
+
+    def _restore_through(self, restorer: 'SubscriptionRestorer') -> bool:
+        """
+        Abandon the request waiting for its response, the next requests go to `restorer` (the connection to the router
+        was lost or is back), see :class:`.subscription_restore.SubscriptionRestorer`.
+
+        :return: False if this query is not restored
+        """
+        return False
+
+    def _run_driven(self):
+        self._set_state(CycleQueryState.STARTING)
         self._event.clear()
+        self._driven = True
+        try:
+            self._driver._attach(self)
+        except Exception:
+            self._driven = False
+            self._set_state(CycleQueryState.STOPPED)
+            raise
+        self._started()
+
+    def _driven_begin(self) -> float:
+        """Reset the state of a driven query before its start, return the loop time of the first request."""
+        self._missed = 0
+        self._errors = None
+        return self._loop.time()
+
+    async def _driven_send(self) -> Optional[List[ValueResponse]]:
+        """
+        Send the next requests of a driven query, the body of its request task. By default the whole loop of
+        `_send_message` runs in it, query types stepping through the driver send one request here.
+        """
+        await self._send_message()
+        return None
+
+    async def _driven_result(self, send: asyncio.Task) -> Optional[float]:
+        """
+        Handle the finished request task of a driven query, one step of the loop of `_send_message`. By default the
+        task ran the whole loop, the query finished.
+
+        :return: loop time of the next request, None if the query finished
+        """
+        send.result()
+        return None
+
+    def _driven_reschedule(self) -> float:
+        """Return the loop time of the next request after an interruption (the delay or the requests changed)."""
+        return self._loop.time()
+
+    def _driven_resume(self) -> float:
+        """Return the loop time of the first request after a pause."""
+        return self._loop.time()
 
     def _set_loop(self):
         """
@@ -204,6 +908,9 @@ class BaseCycleQuery(ABC):
         Method starts cycle query if not started yet.
         """
         if self.is_stopped():
+            if self._driver is not None:
+                self._run_driven()
+                return
             self._run()
             self._run_callbacks()
         else:
@@ -211,23 +918,32 @@ class BaseCycleQuery(ABC):
 
     def stop(self):
         """Method stop cycle query."""
-        if not self.is_stopped() and not self._task.done():
-            self._task.cancel()
+        if not self.is_stopped():
+            self._set_state(CycleQueryState.STOPPING)
+            if self._driven:
+                self._abandoned_send = self._driver._detach(self)
+                self._finish()
+            else:
+                self._task.cancel()
             self._event.set()
-        if self._callback_task and self._callback_task in asyncio.all_tasks(
-                self._loop) and not self._callback_task.done():
+        if self._callback_task is not None and not self._callback_task.done():
             self._callback_task.cancel()
 
     async def stop_and_wait(self):
         self.stop()
-        try:
-            await self._task
-        except asyncio.CancelledError:
-            pass
-        try:
-            await self._callback_task
-        except asyncio.CancelledError:
-            pass
+        send, self._abandoned_send = self._abandoned_send, None
+        if send is not None:
+            await asyncio.wait({send})
+        if self._task is not None:
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._callback_task is not None:
+            try:
+                await self._callback_task
+            except asyncio.CancelledError:
+                pass
 
     def is_stopped(self):
         """
@@ -235,9 +951,7 @@ class BaseCycleQuery(ABC):
 
         :return: False if running
         """
-        if self._task and self._task in asyncio.all_tasks(self._loop):
-            return False
-        return True
+        return not self._driven and (self._task is None or self._task.done())
 
     def __del__(self):
         self.stop()
@@ -260,57 +974,240 @@ class BaseCycleQuery(ABC):
         """
         self._callback_methods.append(method)
 
+    def add_address_callback_async_method(self, address: str or Address, method):
+        """
+        Add an async method run with the `ValueResponse` of `address` only when this address changed.
+
+        :param address: address of one of the requests
+        :param method: asyncio method taking one `ValueResponse`
+        """
+        self._address_callbacks_a.setdefault(str(address), []).append(method)
+
+    def add_address_callback_method(self, address: str or Address, method):
+        """
+        Add a method run with the `ValueResponse` of `address` only when this address changed.
+
+        :param address: address of one of the requests
+        :param method: no async method taking one `ValueResponse`
+        """
+        self._address_callbacks.setdefault(str(address), []).append(method)
+
+    def remove_address_callback(self, address: str or Address, method):
+        """Remove a callback added with `add_address_callback_method` or `add_address_callback_async_method`."""
+        for callbacks in (self._address_callbacks, self._address_callbacks_a):
+            methods = callbacks.get(str(address))
+            if methods and method in methods:
+                methods.remove(method)
+                if not methods:
+                    del callbacks[str(address)]
+
+    def set_callback_executor(self, executor: Optional[CallbackExecutor]):
+        """
+        Set executor of sync callbacks, used from the next response.
+
+        :param executor: executor or None to call sync callbacks on the event loop
+        """
+        self._callback_executor = executor
+
+    def set_callback_dispatch(self, dispatch: CallbackDispatch):
+        """
+        Set how async callbacks are awaited, used from the next response.
+
+        :param dispatch: dispatch mode
+        """
+        self._callback_dispatch = CallbackDispatch(dispatch)
+
+    @property
+    def error_policy(self) -> ErrorPolicy:
+        return self._error_policy
+
+    def set_circuit_breakers(self, registry: Optional[CircuitBreakerRegistry]):
+        """
+        Pass the requests through the circuit breakers of `registry`, used from the next request. Shorthand of the
+        error policy :meth:`.error_policy.ErrorPolicy.with_circuit_breakers`.
+
+        :param registry: circuit breakers, None - no circuit breaking
+        """
+        self._error_policy = self._error_policy.with_circuit_breakers(registry)
+
+    def set_retry_throttle(self, throttle: Optional[RetryThrottle]):
+        """
+        Allow the retries of this query by `throttle`, used from the next retry. Shorthand of the error policy
+        :meth:`.error_policy.ErrorPolicy.with_retry_throttle`.
+
+        :param throttle: retry throttle, None - retries not throttled
+        """
+        self._error_policy = self._error_policy.with_retry_throttle(throttle)
+
     def _run_callbacks(self):
-        self._callback_task = self._loop.create_task(self._execute_callbacks())
+        # the queue is created before the main task runs, so the first response can not be missed
+        updates = self.iterate(maxsize=self.CALLBACK_QUEUE_SIZE, overflow=self.CALLBACK_OVERFLOW)
+        self._callback_task = self._loop.create_task(self._execute_callbacks(updates))
 
-    async def _execute_callbacks(self):
+    async def _execute_callbacks(self, updates: ResponseSubscription):
         """Main loop for callback runner task"""
-        run = True
-        while run:
-            # it is not necessary to check main task is still running because it is realized in 'get_response'
-            await asyncio.sleep(0)
-            try:
-                result = await self.get_response()
-            except CommunicationRuntimeError:
-                run = False
-                result = self._last_response
-                # if exist last response then make callback last time but if not don't do it
-                if not self._last_response:
+        workers: Dict[int, Tuple[_ResponseQueue, asyncio.Task]] = {}  # used by `CallbackDispatch.PER_CALLBACK`
+        finished = False
+        try:
+            run = True
+            while run:
+                try:
+                    result = await updates.__anext__()
+                except StopAsyncIteration:
                     return
+                except CommunicationRuntimeError:
+                    run = False
+                    result = self._last_response
+                    # if exist last response then make callback last time but if not don't do it
+                    if not self._last_response:
+                        return
+
+                await self._call_callbacks(result, updates.last_changes if run else None, workers)
+            finished = True
+        finally:
+            updates.close()
+            await self._close_workers(workers, finished)
+
+    @staticmethod
+    async def _close_workers(workers: Dict[int, Tuple[_ResponseQueue, asyncio.Task]], finished: bool):
+        """End the tasks of `CallbackDispatch.PER_CALLBACK`, if `finished` after they deliver the queued responses."""
+        for queue, task in workers.values():
+            queue.close()
+            if not finished:
+                task.cancel()
+        if finished and workers:
+            # the last responses are still delivered to every callback
+            await asyncio.gather(*(task for _, task in workers.values()), return_exceptions=True)
+        workers.clear()
 
+    async def _call_callbacks(self, result: List[ValueResponse], changes: Optional[ChangeSet],
+                              workers: Dict[int, Tuple[_ResponseQueue, asyncio.Task]]):
+        """Run all callbacks with one update, the address callbacks only if `changes` is given."""
+        dispatch = self._callback_dispatch
+        if dispatch == CallbackDispatch.CONCURRENT:
+            await asyncio.gather(*(self._call_async_callback(m, result) for m in self._callback_methods_a))
+        elif dispatch == CallbackDispatch.PER_CALLBACK:
+            for i, a_method in enumerate(self._callback_methods_a):
+                worker = workers.get(i)
+                if worker is None or worker[1].done():
+                    queue = _ResponseQueue(maxsize=self.CALLBACK_QUEUE_SIZE, overflow=self.CALLBACK_OVERFLOW)
+                    worker = workers[i] = (queue, self._loop.create_task(self._callback_worker(a_method, queue)))
+                await worker[0].put((result, None, None))
+        else:
             for a_method in self._callback_methods_a:
-                if callable(a_method):
-                    logger.debug(f"{self}: Execute callback {a_method.__name__}")
-                    try:
-                        await a_method(result)
-                    except Exception as e:
-                        # Catch broadly so a buggy callback cannot kill the
-                        # callback runner task. If the exception escapes this
-                        # try-except block, the task dies silently — the producer keeps
-                        # polling (so is_stopped() stays False and no
-                        # SUBSCRIPTION STOPPED log appears) but no further
-                        # callbacks fire, leaving downstream consumers with
-                        # stale data and no diagnostic signal.
-                        #
-                        # Do NOT widen to BaseException: CancelledError must
-                        # propagate so task cancellation works correctly
-                        # (CancelledError is BaseException since Python 3.8).
-                        logger.exception(
-                            f"{self}: async callback {a_method.__name__} raised "
-                            f"unhandled {type(e).__name__}: {e}. Continuing — the "
-                            f"subscription stays alive."
-                        )
-
-            for method in self._callback_methods:
-                if callable(method):
-                    logger.debug(f"{self}: Execute callback {method.__name__}")
-                    try:
-                        method(result)
-                    except Exception as e:
-                        logger.exception(
-                            f"{self}: sync callback {method.__name__} raised "
-                            f"unhandled {type(e).__name__}: {e}. Continuing."
-                        )
+                await self._call_async_callback(a_method, result)
+
+        for method in self._callback_methods:
+            await self._call_sync_callback(method, result)
+
+        if changes is not None and (self._address_callbacks or self._address_callbacks_a):
+            await self._route_changes(changes)
+
+    def _has_callbacks(self) -> bool:
+        return bool(self._callback_methods_a or self._callback_methods or self._address_callbacks
+                    or self._address_callbacks_a)
+
+    def _queue_driven_callbacks(self, item: tuple):
+        """
+        Pass an update to the callbacks of a driven query. They run in a task which exists only while there are
+        updates for them; the updates wait in a queue of `CALLBACK_QUEUE_SIZE`, the oldest one is dropped.
+        """
+        pending = self._callback_pending
+        if len(pending) >= self.CALLBACK_QUEUE_SIZE:
+            pending.popleft()
+            self._dropped_updates += 1
+            logger.debug(f"{self}: callbacks too slow, 1 response dropped")
+        pending.append(item)
+        if self._callback_task is None or self._callback_task.done():
+            self._callback_task = self._loop.create_task(self._drain_callbacks())
+        elif self._callback_wake is not None and not self._callback_wake.done():
+            self._callback_wake.set_result(None)
+
+    async def _drain_callbacks(self):
+        pending = self._callback_pending
+        workers: Dict[int, Tuple[_ResponseQueue, asyncio.Task]] = {}  # used by `CallbackDispatch.PER_CALLBACK`
+        finished = False
+        try:
+            while True:
+                while pending:
+                    result, errors, changes = pending.popleft()
+                    if errors is not None:
+                        # the last response is given to the callbacks once more, if there is any
+                        result, changes = self._last_response, None
+                        if not result:
+                            continue
+                    await self._call_callbacks(result, changes, workers)
+                busy = [task for _, task in workers.values() if not task.done()]
+                if not busy:
+                    break
+                # wait for the callbacks of `CallbackDispatch.PER_CALLBACK` still running, or for a new update
+                self._callback_wake = self._loop.create_future()
+                await asyncio.wait(busy + [self._callback_wake], return_when=asyncio.FIRST_COMPLETED)
+                self._callback_wake = None
+            finished = True
+        finally:
+            self._callback_wake = None
+            pending.clear()
+            await self._close_workers(workers, finished)
+
+    async def _route_changes(self, changes: Optional[ChangeSet]):
+        """Run the callbacks of the changed addresses only."""
+        if not changes:
+            return
+        for response in changes:
+            address = str(response.address)
+            for a_method in self._address_callbacks_a.get(address, ()):
+                await self._call_async_callback(a_method, response)
+            for method in self._address_callbacks.get(address, ()):
+                await self._call_sync_callback(method, response)
+
+    async def _callback_worker(self, method, queue: _ResponseQueue):
+        """
+        Deliver responses to one async callback in order, used by `CallbackDispatch.PER_CALLBACK`. The task ends when
+        the queue is empty, the next response starts a new one.
+        """
+        while len(queue):
+            item = await queue.get()
+            await self._call_async_callback(method, item[0])
+
+    async def _call_async_callback(self, a_method, result: List[ValueResponse]):
+        if not callable(a_method):
+            return
+        logger.debug(f"{self}: Execute callback {a_method.__name__}")
+        try:
+            await a_method(result)
+        except Exception as e:
+            # Catch broadly so a buggy callback cannot kill the
+            # callback runner task. If the exception escapes this
+            # try-except block, the task dies silently — the producer keeps
+            # polling (so is_stopped() stays False and no
+            # SUBSCRIPTION STOPPED log appears) but no further
+            # callbacks fire, leaving downstream consumers with
+            # stale data and no diagnostic signal.
+            #
+            # Do NOT widen to BaseException: CancelledError must
+            # propagate so task cancellation works correctly
+            # (CancelledError is BaseException since Python 3.8).
+            logger.exception(
+                f"{self}: async callback {a_method.__name__} raised "
+                f"unhandled {type(e).__name__}: {e}. Continuing — the "
+                f"subscription stays alive."
+            )
+
+    async def _call_sync_callback(self, method, result: List[ValueResponse]):
+        if not callable(method):
+            return
+        logger.debug(f"{self}: Execute callback {method.__name__}")
+        try:
+            if self._callback_executor is not None:
+                await self._callback_executor.run_sync(method, result, owner=self)
+            else:
+                method(result)
+        except Exception as e:
+            logger.exception(
+                f"{self}: sync callback {method.__name__} raised "
+                f"unhandled {type(e).__name__}: {e}. Continuing."
+            )
 
 
 class PeriodicCycleQuery(BaseCycleQuery):
@@ -329,86 +1226,352 @@ class PeriodicCycleQuery(BaseCycleQuery):
         set from -1 to inf. If it is ste to -1 that mean isn't max missed messages and query will be renewing all time
     :param log_missed_msg: If is False missed messages will be skipped. Default False.
         Used only when is `only_new_data` set to False
+    :param scheduler: shared tick, see :class:`.periodic_scheduler.PeriodicScheduler`. The requests of all queries
+        with the same `delay` registered in the scheduler are sent together once per tick. Default None - own timer
+        and own request
+    :param missed_tick_policy: what to do with ticks missed because a request took longer than `delay`, see
+        :class:`MissedTickPolicy`. Default `MissedTickPolicy.SKIP`
+    :param align_to_wall_clock: put the ticks on wall clock multiples of `delay` (e.g. every full second), so queries
+        of different processes with the same `delay` sample at the same moments. Default False - the first tick is
+        `delay` after start
+    :param adaptive: adaptive polling interval, see :class:`AdaptiveRate`. The interval grows while the values do not
+        change and goes back to the minimum on a change. Can not be used with `scheduler`. Default None - fixed
+        `delay`
     :raise CommunicationRuntimeError: if not provide async loop and czn not get existing loop
+
+    Ticks are scheduled on the monotonic clock of the event loop from a fixed anchor (tick n is at anchor + n *
+    `delay`), so the period does not drift by the round trip time and is not disturbed by wall clock steps. The
+    observed schedule is available in :attr:`tick_stats`.
+
+    The interval can be pinned for a critical operation (e.g. a slew) with :meth:`pin_rate` / :meth:`unpin_rate` or
+    the :meth:`pinned_rate` context manager; a pending wait is shortened at once.
     """
 
     _DEFAULT_MIN_DELAY = 0.5
+    MAX_CATCH_UP_TICKS = 10
 
     def __init__(self, crs: BaseClientRequestSolver, list_request: List[ValueRequest], delay: float or None = None,
                  loop=None, log_missed_msg: bool = False, query_name: str = 'Default periodic query',
-                 max_missed_msg: int = None, **kwargs):
+                 max_missed_msg: int = None, scheduler: 'PeriodicScheduler' = None,
+                 missed_tick_policy: MissedTickPolicy = MissedTickPolicy.SKIP, align_to_wall_clock: bool = False,
+                 adaptive: AdaptiveRate = None, **kwargs):
         super().__init__(crs=crs, list_request=list_request, delay=delay, loop=loop, query_name=query_name,
                          max_missed_msg=max_missed_msg, **kwargs)
+        if adaptive is not None and scheduler is not None:
+            raise ValueError("Adaptive rate can not be used with a shared tick (scheduler)")
+        self._scheduler: Optional['PeriodicScheduler'] = scheduler
+        self._adaptive: Optional[AdaptiveRate] = adaptive
+        self._interval: float = self._base_interval()
+        self._pinned: Optional[float] = None
+        self._last_signature: Optional[list] = None
+        # set when the interval is pinned or unpinned, wakes the wait for the next tick
+        self._reschedule: asyncio.Event = asyncio.Event()
+        self._ticks: Optional[_ResponseQueue] = None  # queue of the scheduler tick this query is registered on
+        self._missed_tick_policy: MissedTickPolicy = MissedTickPolicy(missed_tick_policy)
+        self._align_to_wall_clock: bool = align_to_wall_clock
+        self._tick_stats: TickStats = TickStats(period=self._delay)
+        self._driven_tick: Optional[float] = None  # tick of the next (or in flight) request of a driven query
+        self._driven_previous: Optional[float] = None
         self._log_missed_msg: bool = log_missed_msg
         self._min_delay = self._DEFAULT_MIN_DELAY
         if self._delay < self._min_delay:
             logger.warning(f"delay value is to low. Will by set to {self._min_delay}")
 
     async def _send_message(self):
-        missed = 0
-        start_time = time.time()
-        self._errors = None
-        while True:
+        try:
+            await self._periodic_loop()
+        finally:
+            self._leave_scheduler()
 
-            # wait before  send nex request
-            wait_range = start_time + self._delay - time.time()
-            if wait_range > 0:
-                logger.debug(f"{self}: Wait {wait_range} before next request:{self}")
-                await asyncio.sleep(wait_range)
+    def set_delay(self, delay: float):
+        super().set_delay(delay)
+        self._interval = self._base_interval()
+        self._tick_stats.period = self._delay
 
-            start_time = time.time()
+    def _interrupt(self):
+        super()._interrupt()
+        # a new delay needs another tick of the scheduler, a paused query leaves it
+        self._leave_scheduler()
+        self._reschedule.set()
 
-            # move request time of data tolerance
-            self._change_time(start_time)
+    def _driver_unsupported(self) -> Optional[str]:
+        if self._scheduler is not None:
+            return "it shares the tick of a scheduler"
+        return None
 
-            # make query
+    def _driven_begin(self) -> float:
+        self._missed = 0
+        self._reset_schedule()
+        self._driven_previous = None
+        self._driven_tick = self._first_tick()
+        return self._driven_tick
+
+    async def _driven_send(self) -> Optional[List[ValueResponse]]:
+        now = self._loop.time()
+        self._tick_stats._record(now, now - self._driven_tick)
+        self._driven_previous = self._driven_tick
+        return await self._poll()
+
+    async def _driven_result(self, send: asyncio.Task) -> Optional[float]:
+        wait = await self._poll_step(send)
+        if wait is None:
+            return None
+        if wait > 0:
+            self._driven_tick = self._loop.time() + wait
+        else:
+            self._driven_tick = self._following_tick(self._driven_tick)
+        return self._driven_tick
+
+    def _driven_reschedule(self) -> float:
+        if self._driven_previous is not None:
+            # the interval changed, count it from the previous tick (or fire now if that is already past)
+            self._driven_tick = max(self._driven_previous + self.get_current_delay(), self._loop.time())
+        return self._driven_tick
+
+    def _driven_resume(self) -> float:
+        # the value is stale after a pause, poll at once and continue the schedule from now
+        self._driven_tick = self._loop.time()
+        return self._driven_tick
+
+    def _join_scheduler(self) -> _ResponseQueue:
+        # with a scheduler the timer and the request are shared, responses come from its tick
+        if self._ticks is None:
+            self._ticks = self._scheduler._register(self)
+        return self._ticks
+
+    def _leave_scheduler(self):
+        if self._ticks is not None:
+            self._ticks = None
+            self._scheduler._unregister(self)
+
+    async def _next_tick(self, ticks: _ResponseQueue) -> Optional[List[ValueResponse]]:
+        """Return the responses of the next tick, None if the query left the tick (paused, delay changed)."""
+        item = await ticks.get()
+        if item is None:
+            if ticks is not self._ticks:
+                return None
+            raise CommunicationRuntimeError(message="Periodic scheduler was closed")
+        result, error, _ = item
+        if error is not None:
+            raise error
+        self._tick_stats._record(self._loop.time())
+        return result
+
+    @property
+    def tick_stats(self) -> TickStats:
+        """Snapshot of the observed schedule (actual period, missed ticks, lateness)."""
+        return replace(self._tick_stats, current_period=self.get_current_delay())
+
+    def get_current_delay(self) -> float:
+        """Return the interval used for the next tick: pinned, adaptive or `delay`."""
+        if self._pinned is not None:
+            return self._pinned
+        return self._interval
+
+    def pin_rate(self, delay: float = None):
+        """
+        Poll with a fixed interval until :meth:`unpin_rate`, regardless of the adaptive rate.
+
+        :param delay: pinned interval, None - the minimum interval (`min_delay` of the adaptive rate or `delay`)
+        """
+        if delay is not None and delay <= 0:
+            raise ValueError(f"Pinned delay must be positive, got {delay}")
+        self._pinned = self._base_interval() if delay is None else delay
+        self._rescheduled()
+
+    def unpin_rate(self):
+        """Go back to the adaptive (or fixed) interval, the adaptive interval starts again from the minimum."""
+        self._pinned = None
+        self._interval = self._base_interval()
+        self._rescheduled()
+
+    def _rescheduled(self):
+        """The interval changed, move the wait for the next tick."""
+        self._reschedule.set()
+        if self._driven:
+            self._driver._retime(self)
+
+    @contextlib.contextmanager
+    def pinned_rate(self, delay: float = None):
+        """Context manager pinning the interval (:meth:`pin_rate`) for the duration of a block."""
+        self.pin_rate(delay)
+        try:
+            yield self
+        finally:
+            self.unpin_rate()
+
+    def _base_interval(self) -> float:
+        if self._adaptive is not None and self._adaptive.min_delay is not None:
+            return self._adaptive.min_delay
+        return self._delay
+
+    @staticmethod
+    def _signature(result: List[ValueResponse], compare_ts: bool) -> list:
+        return [(r.status, r.value.v if r.value else None, r.value.ts if r.value and compare_ts else None)
+                for r in result]
+
+    def _adapt(self, result: List[ValueResponse]):
+        """Update the adaptive interval with a new response."""
+        if self._adaptive is None:
+            return
+        signature = self._signature(result, self._adaptive.compare_ts)
+        try:
+            unchanged = signature == self._last_signature
+        except Exception:  # values without a plain equality (e.g. arrays) are treated as changed
+            unchanged = False
+        self._last_signature = signature
+        if unchanged is True:
+            self._interval = min(self._interval * self._adaptive.factor, self._adaptive.max_delay)
+        else:
+            self._interval = self._base_interval()
+
+    def _first_tick(self) -> float:
+        """Loop time of the first tick."""
+        now = self._loop.time()
+        delay = self.get_current_delay()
+        if self._align_to_wall_clock:
+            return now + delay - self._clock.time() % delay
+        return now + delay
+
+    def _following_tick(self, previous: float) -> float:
+        """Loop time of the tick after `previous`, applying the missed tick policy."""
+        delay = self.get_current_delay()
+        candidate = previous + delay
+        now = self._loop.time()
+        if candidate >= now:
+            return candidate
+        behind = int((now - candidate) // delay) + 1  # ticks already in the past, `candidate` included
+        if self._missed_tick_policy == MissedTickPolicy.CATCH_UP:
+            if behind <= self.MAX_CATCH_UP_TICKS:
+                return candidate
+            skipped = behind - self.MAX_CATCH_UP_TICKS
+        else:
+            skipped = behind
+        self._tick_stats.missed_ticks += skipped
+        msg = f"{self}: request took longer than the period, {skipped} tick(s) skipped"
+        if self._missed_tick_policy == MissedTickPolicy.REPORT:
+            logger.warning(msg)
+        else:
+            logger.debug(msg)
+        return candidate + skipped * delay
+
+    async def _wait_for_tick(self, tick: float, previous: Optional[float]) -> float:
+        """Wait until `tick`, rescheduling it when the rate is pinned or unpinned meanwhile. Return the tick."""
+        while True:
+            wait_range = tick - self._loop.time()
+            if wait_range <= 0:
+                return tick
+            logger.debug(f"{self}: Wait {wait_range} before next request:{self}")
+            self._reschedule.clear()
+            # not `wait_for`: it can swallow a cancellation (stop) arriving together with a reschedule
+            waiter = asyncio.ensure_future(self._reschedule.wait())
             try:
-                requests = self._get_list_request_with_extinction()
-                result = await self._CRS.send_request(requests=requests, timeout=start_time + self._delay,
-                                                      no_wait=False)
-                self._errors = None
-                if result is None:
-                    logger.error(f"{self}: Can not get response for giving request")
-                    raise CommunicationRuntimeError(message="Can not get response for giving request, check "
-                                                            "that the 'no_wait' flag is not set to true")
-
-                self._last_response = result
-                missed = 0
-                self._event.set()
-            except CommunicationRuntimeError as e:
-                self._errors = e
-                self._last_response = []
-                self._event.set()
-                break
-            except CommunicationTimeoutError:
-                missed += 1
-                self._last_response = []
-                logger.warning(f'{self}: The waiting time for the message: has expired. The router is not '
-                               f'responding. Number of missing answers: {missed}')
-                if self._log_missed_msg:
-                    self._event.set()
+                done, _ = await asyncio.wait({waiter}, timeout=wait_range)
+            finally:
+                waiter.cancel()
+            if not done:
+                return tick
+            if previous is not None:
+                # the interval changed, count it from the previous tick (or fire now if that is already past)
+                tick = max(previous + self.get_current_delay(), self._loop.time())
 
-            except Exception as e:
-                self._last_response = []
-                msg = f'{self}: Unrecognized error in periodic cycle query: {type(e)}:{str(e)}'
-                if self._catch_all_log_state.should_warn():
-                    logger.error(msg, exc_info=True)
-                else:
-                    logger.debug(msg, exc_info=True)
-                if self._error_policy.normal.action != SeverityAction.STOP:
-                    await asyncio.sleep(_CATCH_ALL_RETRY_DELAY)
-                    continue
-                self._errors = CommunicationRuntimeError(message='Unrecognized error')
-                self._event.set()
-                break
+    def _reset_schedule(self):
+        self._tick_stats = TickStats(period=self._delay)
+        self._last_signature = None
+        self._interval = self._base_interval()
+        self._errors = None
 
-            if missed > self._max_missed_msg >= 0:
-                logger.error(f"{self}: Too many missed messages at same time")
-                self._errors = CommunicationRuntimeError(message='Too many missed messages at same time')
-                self._event.set()
+    async def _poll(self) -> Optional[List[ValueResponse]]:
+        """Send the requests of one tick, the request half of one step of the query."""
+        start_time = self._clock.time()
+        # move request time of data tolerance
+        self._change_time(start_time)
+        requests = self._get_list_request_with_extinction()
+        return await self._CRS.send_request(requests=requests, timeout=start_time + self._delay, no_wait=False)
+
+    async def _poll_step(self, poll: Awaitable[Optional[List[ValueResponse]]]) -> Optional[float]:
+        """
+        One step of the query, shared by the loop of `_send_message` and the driver: await the responses of `poll`
+        (`_poll` or the next tick of the scheduler) and publish them.
+
+        :return: seconds to wait before the schedule goes on (0 - the next tick as scheduled), None if the query
+            finished
+        """
+        try:
+            result = await poll
+            if result is None and self._scheduler is not None:
+                # left the tick of the scheduler (paused, delay changed), join it again
+                return 0.0
+            self._errors = None
+            if result is None:
+                logger.error(f"{self}: Can not get response for giving request")
+                raise CommunicationRuntimeError(message="Can not get response for giving request, check "
+                                                        "that the 'no_wait' flag is not set to true")
+
+            self._last_response = result
+            self._missed = 0
+            self._adapt(result)
+            await self._publish()
+        except CommunicationRuntimeError as e:
+            self._errors = e
+            self._last_response = []
+            await self._publish()
+            return None
+        except CommunicationTimeoutError:
+            self._missed += 1
+            self._last_response = []
+            logger.warning(f'{self}: The waiting time for the message: has expired. The router is not '
+                           f'responding. Number of missing answers: {self._missed}')
+            if self._log_missed_msg:
+                await self._publish()
+
+        except Exception as e:
+            self._last_response = []
+            msg = f'{self}: Unrecognized error in periodic cycle query: {type(e)}:{str(e)}'
+            if self._catch_all_log_state.should_warn():
+                logger.error(msg, exc_info=True)
+            else:
+                logger.debug(msg, exc_info=True)
+            if self._error_policy.normal.action != SeverityAction.STOP:
+                return _CATCH_ALL_RETRY_DELAY
+            self._errors = CommunicationRuntimeError(message='Unrecognized error')
+            await self._publish()
+            return None
+
+        if self._missed > self._max_missed_msg >= 0:
+            logger.error(f"{self}: Too many missed messages at same time")
+            self._errors = CommunicationRuntimeError(message='Too many missed messages at same time')
+            await self._publish()
+            return None
+        await asyncio.sleep(0)
+        self._event.clear()
+        return 0.0
+
+    async def _periodic_loop(self):
+        self._missed = 0
+        next_tick: Optional[float] = None
+        self._reset_schedule()
+        while True:
+            if self._scheduler is not None:
+                await self._wait_resumed()
+                poll = self._next_tick(self._join_scheduler())
+            else:
+                # wait for the next tick of the fixed schedule
+                previous = next_tick
+                next_tick = self._first_tick() if previous is None else self._following_tick(previous)
+                next_tick = await self._wait_for_tick(next_tick, previous)
+                if await self._wait_resumed():
+                    # the value is stale after a pause, poll at once and continue the schedule from now
+                    next_tick = self._loop.time()
+                self._tick_stats._record(self._loop.time(), self._loop.time() - next_tick)
+                poll = self._poll()
+
+            # make query
+            wait = await self._poll_step(poll)
+            if wait is None:
                 break
-            await asyncio.sleep(0)
-            self._event.clear()
+            if wait > 0:
+                await asyncio.sleep(wait)
 
 
 class ConditionalCycleQuery(BaseCycleQuery):
@@ -434,188 +1597,637 @@ class ConditionalCycleQuery(BaseCycleQuery):
         there are communication problems or the router is turned off. Recommended to leave the default value
     :param ignore_errors: flag to ignore errors. If the server returns an error other than temporary, the situation
         will be treated as a failed attempt and will be re-requested.
+    :param streaming: if the request solver supports it (see `BaseClientRequestSolver.supports_streaming`), open one
+        server-pushed stream instead of sending a new request after every change. The stream lease is
+        `request_timeout` and is renewed in the background. Falls back to long-poll if not supported
+    :param stream_credits: number of updates the server may push before the client grants more
+    :param adaptive_timeout: adapt the long-poll horizon of every address to its observed change intervals, see
+        :class:`AdaptiveTimeout`. `request_timeout` is the initial horizon. Not used by streaming. Default None - fixed
+        `request_timeout`
+    :param resume_from: cached responses (one per request) to continue from, see :meth:`set_resume_point`
     :raise CommunicationRuntimeError: if not provide async loop and czn not get existing loop
+
+    A long-poll which expired without a change (every response is the 4004 error) is renewed with the requests sent
+    last, only the lease and the subscription parameters returned by the server are updated; the count is in
+    :attr:`renewals`.
     """
 
+    DEFAULT_STREAM_CREDITS = 16
+    # part of the lease after which it is renewed
+    STREAM_RENEW_FRACTION = 0.5
+
     def __init__(self, crs: BaseClientRequestSolver, list_request: List[ValueRequest], delay: float or None = None,
                  loop=None, query_name: str = 'Default conditional query', max_missed_msg: int = None,
                  request_timeout: float = None, ignore_errors: bool = False,
-                 error_policy: Optional[ErrorPolicy] = None, **kwargs):
+                 error_policy: Optional[ErrorPolicy] = None, streaming: bool = False, stream_credits: int = None,
+                 adaptive_timeout: AdaptiveTimeout = None, resume_from: List[ValueResponse] = None, **kwargs):
         super().__init__(crs=crs, list_request=list_request, delay=delay, loop=loop,
                          query_name=query_name, max_missed_msg=max_missed_msg,
                          ignore_errors=ignore_errors, error_policy=error_policy, **kwargs)
         if request_timeout is None:
             request_timeout = self.DEFAULT_REQUEST_TIMEOUT
         self._timeout: float = request_timeout
+        self._streaming: bool = streaming
+        if stream_credits is None or stream_credits < 1:
+            stream_credits = self.DEFAULT_STREAM_CREDITS
+        self._stream_credits: int = stream_credits
+        self._stream_missed: int = 0
+        self._poll_version: int = 0  # `_requests_version` of the long-poll in flight
+        self._adaptive_timeout: Optional[AdaptiveTimeout] = adaptive_timeout
+        self._horizons: Dict[str, _Horizon] = {}
+        self._observed: Optional[List[ValueResponse]] = None  # last response used by `_observe`
+        # requests sent last and `_requests_version` they were built for, reused by a renewal
+        self._sent_requests: Optional[List[ValueRequest]] = None
+        self._sent_version: int = -1
+        self._renewals: int = 0
+        self._restorer: Optional['SubscriptionRestorer'] = None
+        self._resume_point: Optional[List[ValueResponse]] = None
         for r in self._list_request:
-            r.request_timeout = self._timeout
-            r.cycle_query = True
+            self._prepare_request(r)
+        if resume_from is not None:
+            self.set_resume_point(resume_from)
 
-    async def _send_message(self):
-        missed = 0
+    def set_resume_point(self, responses: List[ValueResponse]):
+        """
+        Continue from cached responses, e.g. kept from a previous session. The first request carries their
+        `time_of_known_change`, so the server answers only with a newer value and the cached one is not transferred
+        again. Until then the cached responses are the `current_response` and :meth:`start_and_get` returns them at
+        once.
+
+        :param responses: one response per request, in the order of the requests
+        :raise ValueError: if the query is running or the responses do not match the requests
+        """
+        if not self.is_stopped():
+            raise ValueError(f"{self}: can not set the resume point of a running query")
+        if [str(r.address) for r in responses] != [str(r.address) for r in self._list_request]:
+            raise ValueError(f"{self}: resume point must have one response per request, in the order of the requests")
+        self._last_response = list(responses)
+        self._delivered_response = list(responses)
+        self._resume_point = self._delivered_response
+
+    async def start_and_get(self) -> List[ValueResponse]:
+        resume_point, self._resume_point = self._resume_point, None
+        if resume_point is None or resume_point is not self._delivered_response or not self.is_stopped():
+            # no resume point or already replaced by a newer response
+            return await super().start_and_get()
+        self.start()
+        return resume_point
+
+    def _prepare_request(self, request: ValueRequest):
+        request.request_timeout = self._timeout
+        request.cycle_query = True
+
+    @property
+    def renewals(self) -> int:
+        """Number of long-polls renewed after an expiry without a change."""
+        return self._renewals
+
+    def get_request_timeout(self, address: str or Address) -> float:
+        """Return the long-poll horizon of `address`, adapted if the query has `adaptive_timeout`."""
+        horizon = self._horizons.get(str(address))
+        return horizon.timeout if horizon is not None else self._timeout
+
+    def remove_request(self, address: str or Address) -> bool:
+        removed = super().remove_request(address)
+        if removed:
+            self._horizons.pop(str(address), None)
+        return removed
+
+    def _horizon(self, address: str) -> _Horizon:
+        horizon = self._horizons.get(address)
+        if horizon is None:
+            adaptive = self._adaptive_timeout
+            horizon = self._horizons[address] = _Horizon(
+                max(adaptive.min_timeout, min(adaptive.max_timeout, self._timeout)))
+        return horizon
+
+    def _observe(self, responses: List[ValueResponse]):
+        """Update the long-poll horizons with the changes and expiries in `responses`, see :class:`AdaptiveTimeout`."""
+        if self._adaptive_timeout is None or responses is self._observed:
+            return
+        self._observed = responses
+        now = self._clock.time()
+        for r in responses:
+            if r.status and r.value is not None:
+                self._horizon(str(r.address)).changed(r.value.ts, now, self._adaptive_timeout)
+            elif r.error is not None and r.error.code == 4004:
+                self._horizon(str(r.address)).expired(now, r.error, self._adaptive_timeout)
+
+    @staticmethod
+    def _is_expiry(responses: List[ValueResponse]) -> bool:
+        return bool(responses) and all(not r.status and r.error is not None and r.error.code == 4004
+                                       for r in responses)
+
+    def _next_requests(self) -> List[ValueRequest]:
+        """Requests of the next long-poll: after an expiry the requests sent last renewed, else built anew."""
+        self._observe(self._last_response)
+        requests = self._renewal_requests()
+        if requests is None:
+            self._update_request_data()
+            if self._adaptive_timeout is not None:
+                for r in self._list_request:
+                    r.request_timeout = self._horizon(str(r.address)).timeout
+            requests = self._get_list_request_with_extinction()
+            self._sent_requests = requests
+            self._sent_version = self._requests_version
+        return requests
+
+    def _renewal_requests(self) -> Optional[List[ValueRequest]]:
+        """
+        Return copies of the requests sent last with a renewed lease if the long-poll expired without a change, else
+        None. Nothing changed, so the conditional state is not repacked, the copies are built from the templates with
+        the request data sent last. The sent requests are not modified, the request solver may still hold them.
+        """
+        sent = self._sent_requests
+        responses = self._last_response
+        if (sent is None or self._sent_version != self._requests_version or len(sent) != len(responses)
+                or not self._is_expiry(responses)):
+            return None
+        renewed = []
+        for i, (request, response) in enumerate(zip(sent, responses)):
+            template = self._templates[i]
+            if template is None or not template.matches(self._list_request[i]):
+                return None
+            kwargs = response.error.kwargs
+            if kwargs != self._additional_request_data[i]:
+                # new subscription parameters returned by the server
+                self._additional_request_data[i] = kwargs
+                request_data = dict(self._list_request[i].request_data)
+                request_data.update(kwargs)
+            else:
+                request_data = dict(request.request_data)
+            new_r = template.build(time_of_data=request.time_of_data, request_data=request_data)
+            new_r.request_timeout = request.request_timeout
+            if self._adaptive_timeout is not None:
+                new_r.request_timeout = self._horizon(str(request.address)).timeout
+            renewed.append(new_r)
+        self._sent_requests = renewed
+        self._renewals += 1
+        return renewed
+
+    def _long_poll_timeout(self, requests: List[ValueRequest]) -> float:
+        """Client side timeout of a long-poll, the longest horizon of the requests."""
+        if self._adaptive_timeout is None:
+            return self._timeout
+        return max(r.request_timeout for r in requests)
+
+    def _driver_unsupported(self) -> Optional[str]:
+        if self._streaming and _supports_streaming(self._CRS):
+            return "a stream is received by its own task"
+        return None
+
+    def _restore_through(self, restorer: 'SubscriptionRestorer') -> bool:
+        if self.is_stopped():
+            return False
+        self._restorer = restorer
+        # also closes the stream of a streaming query, it is opened again after the restore
+        self._interrupt()
+        return True
+
+    async def _send_guarded(self, requests: List[ValueRequest], send: Callable[[], Awaitable],
+                            opens_stream: bool = False):
+        """
+        Send the requests by `send` through the circuit breakers of the error policy and the rate controller of the
+        request solver (if any): wait while a circuit of their addresses is open, for a token of the retry limiter if
+        the send is a retry and for the rate slots of their endpoints, then record the outcome.
+
+        :param opens_stream: `send` opens a stream, an opened stream is a success of the endpoints of the requests
+        """
+        registry = self._error_policy.circuit_breakers
+        controller: Optional[AimdRateController] = getattr(self._CRS, 'rate_controller', None)
+        breakers = await registry.acquire(r.address for r in requests) if registry is not None else []
+        limiter = None
+        slots = []
+        try:
+            limiter = await self._take_retry_token()
+            if controller is not None:
+                slots = await controller.acquire(r.address for r in requests)
+            result = await send()
+        except CommunicationTimeoutError:
+            if registry is not None:
+                registry.record_timeout(breakers)
+            if controller is not None:
+                controller.record_timeout(slots)
+            raise
+        except BaseException:
+            # also cancelled while waiting for the slots, a probe taken on a half-open circuit is given back
+            if registry is not None:
+                registry.abandon(breakers)
+            if controller is not None:
+                controller.release(slots)
+            self._give_back_retry_token(limiter)
+            raise
+        if opens_stream:
+            for b in breakers:
+                b.record_success()
+            for e, _ in slots:
+                e.record_success()
+            return result
+        if result is None:
+            # interrupted, the retry is sent again
+            if registry is not None:
+                registry.abandon(breakers)
+            if controller is not None:
+                controller.release(slots)
+            self._give_back_retry_token(limiter)
+            return result
+        if registry is not None:
+            registry.record(breakers, result)
+        if controller is not None:
+            controller.record(slots, result, long_poll=True)
+        return result
+
+    async def _restored(self, requests: List[ValueRequest]) -> Optional[List[ValueResponse]]:
+        """Responses of `requests` from a bulk restore after a reconnect, None if they have to be sent as usual."""
+        restorer, self._restorer = self._restorer, None
+        if restorer is None:
+            return None
+        responses = await restorer._submit(self, requests)
+        if responses is not None:
+            # answered by the restore, no retry is sent
+            self._retry_pending = False
+        return responses
+
+    async def _driven_send(self) -> Optional[List[ValueResponse]]:
+        # the driver interrupts a driven query by cancelling this task
+        return await self._long_poll(wakeable=False)
+
+    async def _driven_result(self, send: asyncio.Task) -> Optional[float]:
+        wait = await self._long_poll_step(send)
+        return None if wait is None else self._loop.time() + wait
+
+    async def _long_poll(self, wakeable: bool) -> Optional[List[ValueResponse]]:
+        """
+        Send the next long-poll, or take its responses from a bulk restore, the request half of one step of the
+        query. If `wakeable` it returns None when the query is interrupted, see `_send_wakeable`.
+        """
+        self._poll_version = self._requests_version
+        requests = self._next_requests()
+        result = await self._restored(requests)
+        if result is not None:
+            return result
+        if wakeable:
+            return await self._send_guarded(requests, lambda: self._send_wakeable(
+                requests, timeout=self._clock.time() + self._long_poll_timeout(requests)))
+        return await self._send_guarded(requests, lambda: self._CRS.send_request(
+            requests=requests, timeout=self._clock.time() + self._long_poll_timeout(requests), no_wait=False))
+
+    async def _long_poll_step(self, poll: Awaitable[Optional[List[ValueResponse]]]) -> Optional[float]:
+        """
+        One step of the query, shared by the loop of `_send_message` and the driver: await the responses of `poll`
+        (see `_long_poll`), handle them according to the error policy and publish them.
+
+        :return: seconds to wait before the next long-poll, None if the query finished
+        """
         not_clear_result = False
+        try:
+            result = await poll
+            if self._poll_version != self._requests_version:
+                # requests were added or removed meanwhile, the response is for the old list: send the new one
+                logger.debug(f"{self}: requests changed, sending the new requests")
+                return 0.0
+            self._errors = None
+            if result is None:
+                logger.error(f"{self}: Can not get response for giving request")
+                raise CommunicationRuntimeError(message="Can not get response for giving request, check "
+                                                        "that the 'no_wait' flag is not set to true")
+            self._last_response = result
+            self._missed = 0
+            not_clear_result = True  # if it gets some result return it for callback
+            outcome, retry_delay = self._dispatch_response()
+            if outcome == _ResponseOutcome.NOTIFY:
+                # Fire callback with the error response, then keep
+                # retrying in the next step.
+                await self._publish()
+                await asyncio.sleep(0)
+                self._event.clear()
+                return self._retry_delay(retry_delay)
+            if outcome == _ResponseOutcome.RETRY:
+                return self._retry_delay(retry_delay)
+            if outcome == _ResponseOutcome.RENEW:
+                return 0.0
+            await self._publish()
+        except CommunicationRuntimeError as e:
+            self._errors = e
+            if not not_clear_result:
+                self._last_response = []
+            await self._publish()
+            return None
+        except CommunicationTimeoutError:
+            self._missed += 1
+            self._last_response = []
+            logger.warning(f'{self}: The waiting time for the message has expired. The router is not '
+                           f'responding. Number of missing answers: {self._missed}')
+            if self._missed >= self._max_missed_msg >= 0:
+                logger.error(f"{self}: Too many missed messages at same time")
+                self._errors = CommunicationRuntimeError(message='Too many missed messages at same time')
+                await self._publish()
+                return None
+            return self._retry_delay(self._throttled(0.0))
+        except Exception as e:
+            self._last_response = []
+            # Under a SERVICE-style policy (NORMAL action = RETRY), an
+            # unexpected exception must not permanently kill the
+            # subscription — a daemon is explicitly configured to
+            # "retry forever", so stopping here defeats the whole
+            # purpose.  Wait a safe ceiling delay and keep the query
+            # alive so the subscription can recover once the underlying
+            # condition clears.
+            msg = f'{self}: Unrecognized error in conditional cycle query: {type(e)}:{str(e)}'
+            if self._catch_all_log_state.should_warn():
+                logger.error(msg, exc_info=True)
+            else:
+                logger.debug(msg, exc_info=True)
+            if self._error_policy.normal.action != SeverityAction.STOP:
+                return _CATCH_ALL_RETRY_DELAY
+            self._errors = CommunicationRuntimeError(message='Unrecognized error')
+            await self._publish()
+            return None
+        await asyncio.sleep(0)
+        self._event.clear()
+        return 0.0
+
+    async def _send_message(self):
+        if self._streaming:
+            if _supports_streaming(self._CRS):
+                await self._stream_messages()
+                return
+            logger.info(f"{self}: request solver does not support streaming, falling back to long-poll")
+        self._missed = 0
         self._errors = None
         while True:
-            start_time = time.time()
-
-            # update request data
-            self._update_request_data()
+            await self._wait_resumed()
 
             # make query
+            wait = await self._long_poll_step(self._long_poll(wakeable=True))
+            if wait is None:
+                break
+            await asyncio.sleep(wait)
+
+    def _dispatch_response(self) -> Tuple['_ResponseOutcome', float]:
+        """
+        Decide what to do with `_last_response` according to the error policy.
+
+        :raise CommunicationRuntimeError: when the subscription has to stop (STOP action, exhausted budget, address
+            not supporting conditional queries)
+        :return: outcome and the backoff delay to sleep before the next attempt (RETRY/NOTIFY)
+        """
+        # ----- Error dispatch driven by self._error_policy -----
+        # See ``error_policy.py`` for the action vocabulary
+        # (RETRY / NOTIFY / STOP) and the per-severity rules. The
+        # legacy ``ignore_errors`` flag is mapped onto a policy
+        # at construction time, so this block only consults the
+        # policy.
+        continue_while = False           # outer-loop "go again, no callback fire"
+        renew = False                    # outer-loop "poll again", the subscription expired
+        notify_then_continue = False     # outer-loop "fire callback first, then go again"
+        retry_delay = 0.0                # backoff sleep before next attempt (RETRY/NOTIFY)
+        successful_response = True       # reset per-severity state if no error
+        for r in self._last_response:
+            if r.status:
+                continue
+            successful_response = False
+            # 4004 (subscription expired) is a protocol heartbeat,
+            # not really an error — keep its dedicated silent retry.
+            if r.error and r.error.code == 4004:
+                logger.debug(f'{self}: address ({str(r.address)}) subscription expired - renewing')
+                # the endpoint answered, the renewal is not a retry
+                self._throttle_success()
+                renew = True
+                break
+            if r.error is None:
+                # Response carried ``status=False`` without an
+                # error object — preserve the historical "stop"
+                # behaviour for that, since we have no severity
+                # to dispatch on.
+                raise CommunicationRuntimeError(
+                    message=f"Client retrieve response without error object: {str(r)}")
+            severity = r.error.severity or ResponseError.SEVERITY_NORMAL
+            rule = self._error_policy.rule_for(severity)
+            state = self._severity_state.get(severity)
+            if state is None:
+                state = _SeverityRetryState(rule, self._clock)
+                self._severity_state[severity] = state
+            state.attempts += 1
+            action = rule.action
+            # Convert RETRY/NOTIFY → STOP if the budget is spent.
+            if (action != SeverityAction.STOP and rule.budget is not None
+                    and rule.budget.is_exhausted(state.attempts, state.started_monotonic, self._clock)):
+                logger.warning(
+                    f'{self}: address ({str(r.address)}) retry budget exhausted '
+                    f'(severity={severity}, attempts={state.attempts}); stopping subscription'
+                )
+                action = SeverityAction.STOP
+            if action == SeverityAction.STOP:
+                raise CommunicationRuntimeError(
+                    message=f"Client retrieve response with error: {str(r.error)}")
+            # RETRY or NOTIFY: log according to the rule's
+            # throttle (always emit DEBUG for forensics).
+            msg = (f'{self}: address ({str(r.address)}) error severity={severity} '
+                   f'code={r.error.code}: {r.error.message} — retrying '
+                   f'(attempt {state.attempts}, action={action.value})')
+            if state.log_state.should_warn():
+                logger.warning(msg)
+            else:
+                logger.debug(msg)
+            state.last_delay = rule.backoff.next_delay(state.attempts, state.last_delay)
+            retry_delay = max(retry_delay, self._throttled(state.last_delay))
+            if action == SeverityAction.NOTIFY:
+                notify_then_continue = True
+            else:
+                continue_while = True
+            break
+        # Apply per-response value/protocol checks for the
+        # status=True path (these mirror the historical code).
+        if not continue_while and not notify_then_continue and not renew:
+            for r in self._last_response:
+                if not r.status:
+                    continue
+                if r.value is not None and 'from_cf' not in r.value.tags:
+                    logger.info(f'{self}: this address ({str(r.address)}) does not support cycle '
+                                f'conditional')
+                    raise CommunicationRuntimeError(
+                        message=f"this address ({str(r.address)}) does not support "
+                                f"recursive conditional queries")
+                if r.value is None:
+                    logger.info(f'{self}: this address ({str(r.address)}) does not return any value')
+                    raise CommunicationRuntimeError(
+                        message=f"this address ({str(r.address)}) does not return any value")
+        # All responses were successful → reset per-severity state
+        # so the next failure starts the loud-warning streak fresh.
+        if successful_response:
+            self._throttle_success()
+            if self._severity_state:
+                self._severity_state.clear()
+        if notify_then_continue:
+            return _ResponseOutcome.NOTIFY, retry_delay
+        if continue_while:
+            return _ResponseOutcome.RETRY, retry_delay
+        if renew:
+            return _ResponseOutcome.RENEW, 0.0
+        return _ResponseOutcome.PUBLISH, 0.0
+
+    async def _stream_messages(self):
+        """Main loop of the streaming mode: open a stream, deliver pushed updates, re-open it when broken."""
+        # missed counter is reset by a received update or a confirmed lease renewal, not by opening the stream
+        self._stream_missed = 0
+        self._errors = None
+        while True:
+            await self._wait_resumed()
+            retry_delay = 0.0
+            reopen = False
+            not_clear_result = False
+            stream: Optional[BaseValueStream] = None
+            renew_task: Optional[asyncio.Task] = None
+            self._update_request_data()
             try:
-                not_clear_result = False
                 requests = self._get_list_request_with_extinction()
-                result = await self._CRS.send_request(requests=requests, timeout=start_time + self._timeout,
-                                                      no_wait=False)
-                self._errors = None
-                if result is None:
-                    logger.error(f"{self}: Can not get response for giving request")
-                    raise CommunicationRuntimeError(message="Can not get response for giving request, check "
-                                                            "that the 'no_wait' flag is not set to true")
-                self._last_response = result
-                missed = 0
-                not_clear_result = True  # if it gets some result return it for callback
-                # ----- Error dispatch driven by self._error_policy -----
-                # See ``error_policy.py`` for the action vocabulary
-                # (RETRY / NOTIFY / STOP) and the per-severity rules. The
-                # legacy ``ignore_errors`` flag is mapped onto a policy
-                # at construction time, so this block only consults the
-                # policy.
-                continue_while = False           # outer-loop "go again, no callback fire"
-                notify_then_continue = False     # outer-loop "fire callback first, then go again"
-                retry_delay = 0.0                # backoff sleep before next attempt (RETRY/NOTIFY)
-                successful_response = True       # reset per-severity state if no error
-                for r in self._last_response:
-                    if r.status:
+                restored = await self._restored(requests)
+                if restored is not None:
+                    # values changed while the connection was lost, the stream is opened after them
+                    self._stream_missed = 0
+                    self._last_response = restored
+                    not_clear_result = True
+                    self._dispatch_response()  # every response carries a value, bookkeeping of a success
+                    self._update_request_data()
+                    await self._publish()
+                    await asyncio.sleep(0)
+                    self._event.clear()
+                    requests = self._get_list_request_with_extinction()
+                stream = await self._send_guarded(requests, lambda: self._CRS.open_stream(
+                    requests=requests, credits=self._stream_credits, lease=self._timeout, min_interval=self._delay),
+                    opens_stream=True)
+                renew_task = self._loop.create_task(self._renew_stream_lease(stream))
+                outstanding = self._stream_credits
+                while True:
+                    self._requests_changed = self._loop.create_future()
+                    try:
+                        result = await self._receive_from_stream(stream, renew_task, self._requests_changed)
+                    except CommunicationRuntimeError as e:
+                        # the stream was closed by the server, a failure handled by the error policy like an error
+                        # response: the stream is re-opened after backoff or the subscription stops
+                        logger.debug(f'{self}: The stream was closed: {e}')
+                        self._last_response = self._stream_closed_responses(requests, e)
+                        not_clear_result = True
+                        outcome, retry_delay = self._dispatch_response()
+                        if outcome == _ResponseOutcome.NOTIFY:
+                            await self._publish()
+                            await asyncio.sleep(0)
+                            self._event.clear()
+                        break
+                    if result is None:
+                        # requests or delay were changed or the query was paused, the stream is re-opened
+                        reopen = True
+                        break
+                    self._stream_missed = 0
+                    outstanding -= 1
+                    if outstanding <= self._stream_credits // 2:
+                        stream.grant(self._stream_credits - outstanding)
+                        outstanding = self._stream_credits
+                    self._errors = None
+                    self._last_response = result
+                    not_clear_result = True
+                    outcome, retry_delay = self._dispatch_response()
+                    if outcome == _ResponseOutcome.PUBLISH:
+                        # keep the conditional state up to date, a re-opened stream resumes from it
+                        self._update_request_data()
+                        await self._publish()
+                        await asyncio.sleep(0)
+                        self._event.clear()
                         continue
-                    successful_response = False
-                    # 4004 (subscription expired) is a protocol heartbeat,
-                    # not really an error — keep its dedicated silent retry.
-                    if r.error and r.error.code == 4004:
-                        logger.debug(f'{self}: address ({str(r.address)}) subscription expired - renewing')
-                        continue_while = True
+                    if outcome == _ResponseOutcome.RENEW:
+                        # the subscription expired, the stream is re-opened at once
+                        reopen = True
                         break
-                    if r.error is None:
-                        # Response carried ``status=False`` without an
-                        # error object — preserve the historical "stop"
-                        # behaviour for that, since we have no severity
-                        # to dispatch on.
-                        raise CommunicationRuntimeError(
-                            message=f"Client retrieve response without error object: {str(r)}")
-                    severity = r.error.severity or ResponseError.SEVERITY_NORMAL
-                    rule = self._error_policy.rule_for(severity)
-                    state = self._severity_state.get(severity)
-                    if state is None:
-                        state = _SeverityRetryState(rule)
-                        self._severity_state[severity] = state
-                    state.attempts += 1
-                    action = rule.action
-                    # Convert RETRY/NOTIFY → STOP if the budget is spent.
-                    if (action != SeverityAction.STOP and rule.budget is not None
-                            and rule.budget.is_exhausted(state.attempts, state.started_monotonic)):
-                        logger.warning(
-                            f'{self}: address ({str(r.address)}) retry budget exhausted '
-                            f'(severity={severity}, attempts={state.attempts}); stopping subscription'
-                        )
-                        action = SeverityAction.STOP
-                    if action == SeverityAction.STOP:
-                        raise CommunicationRuntimeError(
-                            message=f"Client retrieve response with error: {str(r.error)}")
-                    # RETRY or NOTIFY: log according to the rule's
-                    # throttle (always emit DEBUG for forensics).
-                    msg = (f'{self}: address ({str(r.address)}) error severity={severity} '
-                           f'code={r.error.code}: {r.error.message} — retrying '
-                           f'(attempt {state.attempts}, action={action.value})')
-                    if state.log_state.should_warn():
-                        logger.warning(msg)
-                    else:
-                        logger.debug(msg)
-                    retry_delay = max(retry_delay, rule.backoff.delay(state.attempts))
-                    if action == SeverityAction.NOTIFY:
-                        notify_then_continue = True
-                    else:
-                        continue_while = True
+                    if outcome == _ResponseOutcome.NOTIFY:
+                        await self._publish()
+                        await asyncio.sleep(0)
+                        self._event.clear()
+                    # the stream of this subscription is broken by an error, re-open it after backoff
                     break
-                else:
-                    # for-else: no break taken, all responses were either
-                    # status=True or non-error continuation cases. Fall
-                    # through to the value/None checks below.
-                    pass
-                # Apply per-response value/protocol checks for the
-                # status=True path (these mirror the historical code).
-                if not continue_while and not notify_then_continue:
-                    for r in self._last_response:
-                        if not r.status:
-                            continue
-                        if r.value is not None and 'from_cf' not in r.value.tags:
-                            logger.info(f'{self}: this address ({str(r.address)}) does not support cycle '
-                                        f'conditional')
-                            raise CommunicationRuntimeError(
-                                message=f"this address ({str(r.address)}) does not support "
-                                        f"recursive conditional queries")
-                        if r.value is None:
-                            logger.info(f'{self}: this address ({str(r.address)}) does not return any value')
-                            raise CommunicationRuntimeError(
-                                message=f"this address ({str(r.address)}) does not return any value")
-                # All responses were successful → reset per-severity state
-                # so the next failure starts the loud-warning streak fresh.
-                if successful_response and self._severity_state:
-                    self._severity_state.clear()
-                if notify_then_continue:
-                    # Fire callback with the error response, then keep
-                    # retrying in the next loop iteration.
-                    self._event.set()
-                    if retry_delay > 0:
-                        await asyncio.sleep(retry_delay)
-                    await asyncio.sleep(0)
-                    self._event.clear()
-                    continue
-                if continue_while:
-                    if retry_delay > 0:
-                        await asyncio.sleep(retry_delay)
-                    await asyncio.sleep(0)
-                    continue
-                self._event.set()
             except CommunicationRuntimeError as e:
                 self._errors = e
                 if not not_clear_result:
                     self._last_response = []
-                self._event.set()
+                await self._publish()
                 break
             except CommunicationTimeoutError:
-                missed += 1
+                self._stream_missed += 1
                 self._last_response = []
-                logger.warning(f'{self}: The waiting time for the message has expired. The router is not '
-                               f'responding. Number of missing answers: {missed}')
+                logger.warning(f'{self}: The stream lost connection to the router. Number of missing answers: '
+                               f'{self._stream_missed}')
+                retry_delay = self._throttled(0.0)
             except asyncio.CancelledError:
                 raise
             except Exception as e:
                 self._last_response = []
-                # Under a SERVICE-style policy (NORMAL action = RETRY), an
-                # unexpected exception must not permanently kill the
-                # subscription — a daemon is explicitly configured to
-                # "retry forever", so breaking here defeats the whole
-                # purpose.  Sleep a safe ceiling delay and keep the loop
-                # alive so the subscription can recover once the underlying
-                # condition clears.
-                msg = f'{self}: Unrecognized error in conditional cycle query: {type(e)}:{str(e)}'
+                msg = f'{self}: Unrecognized error in conditional stream: {type(e)}:{str(e)}'
                 if self._catch_all_log_state.should_warn():
                     logger.error(msg, exc_info=True)
                 else:
                     logger.debug(msg, exc_info=True)
                 if self._error_policy.normal.action != SeverityAction.STOP:
-                    await asyncio.sleep(_CATCH_ALL_RETRY_DELAY)
-                    continue
-                self._errors = CommunicationRuntimeError(message='Unrecognized error')
-                self._event.set()
-                break
-            if missed >= self._max_missed_msg >= 0:
+                    retry_delay = _CATCH_ALL_RETRY_DELAY
+                else:
+                    self._errors = CommunicationRuntimeError(message='Unrecognized error')
+                    await self._publish()
+                    break
+            finally:
+                self._requests_changed = None
+                if renew_task is not None:
+                    renew_task.cancel()
+                if stream is not None:
+                    try:
+                        await stream.close()
+                    except (CommunicationRuntimeError, CommunicationTimeoutError):
+                        pass
+            if self._stream_missed >= self._max_missed_msg >= 0:
                 logger.error(f"{self}: Too many missed messages at same time")
                 self._errors = CommunicationRuntimeError(message='Too many missed messages at same time')
-                self._event.set()
+                await self._publish()
                 break
+            if not reopen:
+                await asyncio.sleep(self._retry_delay(retry_delay))
             await asyncio.sleep(0)
-            self._event.clear()
+
+    @staticmethod
+    def _stream_closed_responses(requests: List[ValueRequest],
+                                 error: CommunicationRuntimeError) -> List[ValueResponse]:
+        """Error responses standing for the updates of `requests` lost when their stream was closed by `error`."""
+        return [ValueResponse(address=r.address, value=None, status=False,
+                              error=ResponseError(code=TreeOtherError.CODE_GROUP, message=f'Stream closed: {error}',
+                                                  component_name='stream', severity=ResponseError.SEVERITY_NORMAL))
+                for r in requests]
+
+    @staticmethod
+    async def _receive_from_stream(stream: BaseValueStream, renew_task: asyncio.Task,
+                                   woken: asyncio.Future = None) -> Optional[List[ValueResponse]]:
+        """
+        Wait for the next pushed update, raise the lease renewal error if renewing fails first. Return None if `woken`
+        is set first.
+        """
+        receive = asyncio.ensure_future(stream.receive())
+        waited = {receive, renew_task} if woken is None else {receive, renew_task, woken}
+        try:
+            await asyncio.wait(waited, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            receive.cancel()
+            raise
+        if woken is not None and woken.done():
+            receive.cancel()
+            return None
+        if receive.done():
+            return receive.result()
+        receive.cancel()
+        renew_task.result()  # raises the renewal error
+        raise CommunicationTimeoutError(message='Stream lease renewal stopped')
+
+    async def _renew_stream_lease(self, stream: BaseValueStream):
+        while True:
+            await asyncio.sleep(stream.lease * self.STREAM_RENEW_FRACTION)
+            await stream.renew()
+            self._stream_missed = 0
+            logger.debug(f"{self}: stream lease renewed")
 
     def _update_request_data(self):
         """
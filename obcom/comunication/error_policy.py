@@ -24,17 +24,52 @@ stop the subscription so the human can react. Long-running daemons opt
 into ``ErrorPolicy.SERVICE``, which retries NORMAL with a graceful
 backoff (fast at first, then slow) and throttles the resulting log
 volume.
+
+Many subscriptions failing at the same moment (router restart) retry in
+lockstep on a deterministic schedule. Two tools spread them out:
+jittered backoffs (:meth:`Backoff.full_jitter`,
+:meth:`Backoff.decorrelated_jitter`) and a :class:`RetryLimiter` token
+bucket shared by every subscription whose policy carries it
+(:meth:`ErrorPolicy.with_retry_limiter`)::
+
+    policy = ErrorPolicy.SERVICE.with_retry_limiter(RetryLimiter.shared())
+
+A limiter caps the retry rate, not its share of the traffic: during a
+partial outage the retries of the failing subscriptions can still exceed
+the normal traffic many times over. A :class:`RetryThrottle`
+(:meth:`ErrorPolicy.with_retry_throttle`) bounds that share the way gRPC
+retry throttling does: retries are allowed only while successful responses
+keep its token count above half, a suppressed retry waits
+``suppressed_delay`` and is then sent as a new attempt::
+
+    policy = ErrorPolicy.SERVICE.with_retry_throttle(RetryThrottle.shared())
+
+Retry state is kept per subscription, so twenty subscriptions of one dead
+device retry twenty times. A :class:`CircuitBreakerRegistry` keeps one
+:class:`CircuitBreaker` per address prefix instead, fed by the errors and
+timeouts of every subscription whose policy carries it
+(:meth:`ErrorPolicy.with_circuit_breakers`). After ``failure_threshold``
+consecutive failures the circuit opens: the subscriptions of the prefix wait
+and, after ``reset_timeout``, a single probe request is let through. Its
+success closes the circuit for all of them, its failure opens it again::
+
+    breakers = CircuitBreakerRegistry(key_depth=2)
+    policy = ErrorPolicy.SERVICE.with_circuit_breakers(breakers)
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import math
+import random
 import time
 from dataclasses import dataclass, field, replace
 from enum import Enum
-from typing import ClassVar, List, Optional, Tuple
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Tuple
 
+from obcom.comunication.comunication_error import CircuitOpenError
+from obcom.data_colection.address import Address
 from obcom.data_colection.response_error import ResponseError
 
 logger = logging.getLogger(__name__.rsplit('.', maxsplit=1)[-1])
@@ -63,6 +98,14 @@ class Backoff:
     def delay(self, attempt: int) -> float:
         raise NotImplementedError
 
+    def next_delay(self, attempt: int, previous: Optional[float]) -> float:
+        """Delay of the next attempt knowing the delay used before it (``None`` for the first retry).
+
+        The cycle-query calls this method; stateless strategies simply
+        return :meth:`delay`.
+        """
+        return self.delay(attempt)
+
     @classmethod
     def immediate(cls) -> 'Backoff':
         return _ImmediateBackoff()
@@ -92,6 +135,26 @@ class Backoff:
         """
         return _StagedBackoff(stages=tuple(stages))
 
+    @classmethod
+    def full_jitter(cls, base: 'Backoff') -> 'Backoff':
+        """Random delay between zero and the delay of ``base`` ("full jitter").
+
+        Subscriptions failing together spread their retries over the whole
+        window instead of hitting the server at the same moment::
+
+            Backoff.full_jitter(Backoff.exponential(initial=0.5, ceiling=60.0))
+        """
+        return _FullJitterBackoff(base=base)
+
+    @classmethod
+    def decorrelated_jitter(cls, initial: float, ceiling: float) -> 'Backoff':
+        """Random delay between ``initial`` and three times the previous delay, capped by ``ceiling``.
+
+        Grows like an exponential backoff, but consecutive delays of
+        different subscriptions drift apart ("decorrelated jitter").
+        """
+        return _DecorrelatedJitterBackoff(initial=initial, ceiling=ceiling)
+
 
 @dataclass(frozen=True)
 class _ImmediateBackoff(Backoff):
@@ -151,6 +214,441 @@ class _StagedBackoff(Backoff):
         return last_seconds
 
 
+@dataclass(frozen=True)
+class _FullJitterBackoff(Backoff):
+    base: Backoff
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0.0, self.base.delay(attempt))
+
+
+@dataclass(frozen=True)
+class _DecorrelatedJitterBackoff(Backoff):
+    initial: float
+    ceiling: float
+
+    def delay(self, attempt: int) -> float:  # noqa: ARG002
+        # without the previous delay only the first step can be computed
+        return self.next_delay(attempt, None)
+
+    def next_delay(self, attempt: int, previous: Optional[float]) -> float:  # noqa: ARG002
+        if previous is None or previous < self.initial:
+            previous = self.initial
+        return min(self.ceiling, random.uniform(self.initial, previous * 3))
+
+
+# ---------------------------------------------------------------------------
+# Retry limiter — how many retries per second the whole process may send
+# ---------------------------------------------------------------------------
+
+class RetryLimiter:
+    """Token bucket of retry attempts shared by many subscriptions.
+
+    Every retry of a subscription whose policy carries the limiter takes
+    one token; tokens are refilled at ``rate`` per second up to ``burst``.
+    Waiting retries are served in arrival order, so after a router restart
+    the retries of all subscriptions reach it as a steady ramp of ``rate``
+    per second instead of one spike.
+
+    One instance is meant to be shared, :meth:`shared` returns the
+    process-wide one. ``clock`` is the source of ``monotonic()``, the
+    ``time`` module by default.
+    """
+
+    DEFAULT_RATE: ClassVar[float] = 20.0
+    DEFAULT_BURST: ClassVar[int] = 20
+    _shared: ClassVar[Optional['RetryLimiter']] = None
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST, clock=time) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        if burst < 1:
+            raise ValueError(f"burst must be at least 1, got {burst}")
+        self.rate: float = rate
+        self.burst: int = burst
+        self._clock = clock
+        self._tokens: float = float(burst)  # negative when retries are queued
+        self._updated: float = clock.monotonic()
+
+    @classmethod
+    def shared(cls) -> 'RetryLimiter':
+        """Process-wide limiter with the default rate, created on first use."""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def _refill(self) -> None:
+        now = self._clock.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it (0 if available now)."""
+        self._refill()
+        self._tokens -= 1.0
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+    def release(self) -> None:
+        """Give back a token which was reserved but not used."""
+        self._tokens = min(float(self.burst), self._tokens + 1.0)
+
+    async def acquire(self) -> None:
+        """Wait for a retry token."""
+        wait = self.reserve()
+        if wait <= 0:
+            return
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self.release()
+            raise
+
+
+# ---------------------------------------------------------------------------
+# Retry throttle — retries as a share of the successful traffic
+# ---------------------------------------------------------------------------
+
+class RetryThrottle:
+    """Retry budget of a process earned by successful responses (gRPC retry throttling).
+
+    The throttle holds up to ``max_tokens`` tokens, initially full. Every
+    failed attempt takes one token, every successful response gives back
+    ``token_ratio``. A retry is allowed while more than half of
+    ``max_tokens`` is left, so in a steady state retries make at most about
+    ``token_ratio`` of the successful traffic. A suppressed retry is not
+    dropped: the subscription waits ``suppressed_delay`` and then sends its
+    request again as a new attempt.
+
+    ``retries`` and ``suppressed`` count the decisions; a warning is logged
+    when the throttle starts suppressing and when it lets retries through
+    again. :meth:`shared` returns the process-wide instance.
+    """
+
+    DEFAULT_MAX_TOKENS: ClassVar[float] = 100.0
+    DEFAULT_TOKEN_RATIO: ClassVar[float] = 0.1
+    DEFAULT_SUPPRESSED_DELAY: ClassVar[float] = 10.0
+    _shared: ClassVar[Optional['RetryThrottle']] = None
+
+    def __init__(self, max_tokens: float = DEFAULT_MAX_TOKENS, token_ratio: float = DEFAULT_TOKEN_RATIO,
+                 suppressed_delay: float = DEFAULT_SUPPRESSED_DELAY) -> None:
+        if max_tokens <= 0:
+            raise ValueError(f"max_tokens must be positive, got {max_tokens}")
+        if token_ratio <= 0:
+            raise ValueError(f"token_ratio must be positive, got {token_ratio}")
+        if suppressed_delay < 0:
+            raise ValueError(f"suppressed_delay must not be negative, got {suppressed_delay}")
+        self.max_tokens: float = float(max_tokens)
+        self.token_ratio: float = token_ratio
+        self.suppressed_delay: float = suppressed_delay
+        self._tokens: float = self.max_tokens
+        self._retries: int = 0
+        self._suppressed: int = 0
+        self._suppressing: bool = False
+
+    @classmethod
+    def shared(cls) -> 'RetryThrottle':
+        """Process-wide throttle with the default settings, created on first use."""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    @property
+    def retries(self) -> int:
+        """Number of allowed retries."""
+        return self._retries
+
+    @property
+    def suppressed(self) -> int:
+        """Number of suppressed retries."""
+        return self._suppressed
+
+    def is_suppressing(self) -> bool:
+        """Return True if retries are suppressed now."""
+        return self._tokens <= self.max_tokens / 2
+
+    def record_success(self) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + self.token_ratio)
+        if self._suppressing and not self.is_suppressing():
+            self._suppressing = False
+            logger.warning(f'retry throttle: retries allowed again ({self._suppressed} suppressed so far)')
+
+    def retry(self) -> bool:
+        """Record a failed attempt and return True if it may be retried now."""
+        self._tokens = max(0.0, self._tokens - 1.0)
+        if not self.is_suppressing():
+            self._retries += 1
+            return True
+        self._suppressed += 1
+        if not self._suppressing:
+            self._suppressing = True
+            logger.warning(f'retry throttle: suppressing retries, {self._tokens:.1f} of {self.max_tokens:.0f} '
+                           f'tokens left, retried after {self.suppressed_delay} s')
+        return False
+
+    def retry_delay(self, delay: float) -> float:
+        """Record a failed attempt, return the delay of its retry: ``delay``, or at least ``suppressed_delay``."""
+        if self.retry():
+            return delay
+        return max(delay, self.suppressed_delay)
+
+
+# ---------------------------------------------------------------------------
+# Circuit breakers — failures of an address prefix shared by its subscriptions
+# ---------------------------------------------------------------------------
+
+class CircuitState(str, Enum):
+    """State of a :class:`CircuitBreaker`."""
+
+    CLOSED = 'closed'        #: requests pass
+    OPEN = 'open'            #: requests wait (cycle queries) or fail at once (single requests)
+    HALF_OPEN = 'half_open'  #: one probe request is in flight, the others wait for its outcome
+
+
+class CircuitBreaker:
+    """Closed / open / half-open state of one key of a :class:`CircuitBreakerRegistry`.
+
+    A probe which got no outcome within ``reset_timeout`` is considered
+    lost, the next caller probes.
+    """
+
+    def __init__(self, key: str, failure_threshold: int, reset_timeout: float, clock=time) -> None:
+        self.key: str = key
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self._state: CircuitState = CircuitState.CLOSED
+        self._failures: int = 0
+        self._opened_at: float = -math.inf
+        self._probe_at: float = -math.inf  # when the probe of the half-open circuit was let through
+        self._clock = clock
+        self._changed: Optional[asyncio.Event] = None  # set when the state changes, wakes waiting requests
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    @property
+    def failures(self) -> int:
+        """Number of consecutive failures."""
+        return self._failures
+
+    def _set_state(self, state: CircuitState) -> None:
+        if state == self._state:
+            return
+        logger.info(f'circuit {self.key}: {self._state.value} -> {state.value}')
+        self._state = state
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def ready(self) -> bool:
+        """Return True if :meth:`allow` would let a request through now, without taking the probe."""
+        return self._state == CircuitState.CLOSED or self.retry_after() == 0.0
+
+    def allow(self) -> bool:
+        """Return True if a request may be sent now. In an open circuit after ``reset_timeout`` the caller probes."""
+        if self._state == CircuitState.CLOSED:
+            return True
+        if not self.ready():
+            return False
+        self._probe_at = self._clock.monotonic()
+        self._set_state(CircuitState.HALF_OPEN)
+        return True
+
+    def retry_after(self) -> float:
+        """Seconds until a probe may be sent, for a half-open circuit until its probe is considered lost."""
+        if self._state == CircuitState.OPEN:
+            return max(0.0, self._opened_at + self.reset_timeout - self._clock.monotonic())
+        if self._state == CircuitState.HALF_OPEN:
+            return max(0.0, self._probe_at + self.reset_timeout - self._clock.monotonic())
+        return 0.0
+
+    async def wait(self) -> None:
+        """Wait until the state changes, at most until a probe may be sent."""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), self.retry_after())
+        except asyncio.TimeoutError:
+            pass
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        while not self.allow():
+            await self.wait()
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._set_state(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+
+    def abandon(self) -> None:
+        """The request got no outcome (cancelled, interrupted); if it was the probe, the next request probes."""
+        if self._state == CircuitState.HALF_OPEN:
+            self._open(retry_now=True)
+
+    def _open(self, retry_now: bool = False) -> None:
+        self._opened_at = self._clock.monotonic() - (self.reset_timeout if retry_now else 0.0)
+        if self._state == CircuitState.OPEN:
+            if self._changed is not None:
+                self._changed.set()
+                self._changed = None
+            return
+        self._set_state(CircuitState.OPEN)
+
+
+class _AddressKeys:
+    """Key of an address: the longest matching prefix, else its first ``key_depth`` components, else the address."""
+
+    def __init__(self, key_depth: Optional[int], prefixes: Iterable[str]) -> None:
+        if key_depth is not None and key_depth < 1:
+            raise ValueError(f"key_depth must be at least 1, got {key_depth}")
+        self.key_depth: Optional[int] = key_depth
+        # longest first, the first matching one is the key
+        self._prefixes: List[str] = sorted({str(p) for p in prefixes}, key=len, reverse=True)
+
+    def __call__(self, address: str or Address) -> str:
+        address = str(address)
+        for prefix in self._prefixes:
+            if address == prefix or address.startswith(prefix + '.'):
+                return prefix
+        if self.key_depth is not None:
+            return '.'.join(address.split('.')[:self.key_depth])
+        return address
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers shared by the requests of many subscriptions, one per key.
+
+    The key of an address is the longest of ``prefixes`` it belongs to,
+    else its first ``key_depth`` components (e.g. ``key_depth=2`` makes
+    ``dev.mount.ra`` and ``dev.mount.dec`` share ``dev.mount``), else the
+    whole address.
+
+    A response counts as a failure if its error has one of
+    ``failure_severities``; every other response (also the 4004 expiry of a
+    long-poll) shows that the endpoint answers and counts as a success.
+    A timeout is a failure of every key of the request. ``clock`` is the
+    source of ``monotonic()`` of the breakers, the ``time`` module by
+    default.
+    """
+
+    DEFAULT_FAILURE_THRESHOLD: ClassVar[int] = 5
+    DEFAULT_RESET_TIMEOUT: ClassVar[float] = 10.0
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT, key_depth: Optional[int] = None,
+                 prefixes: Iterable[str] = (),
+                 failure_severities: Iterable[str] = (ResponseError.SEVERITY_TEMPORARY,
+                                                      ResponseError.SEVERITY_NORMAL),
+                 clock=time) -> None:
+        if failure_threshold < 1:
+            raise ValueError(f"failure_threshold must be at least 1, got {failure_threshold}")
+        if reset_timeout <= 0:
+            raise ValueError(f"reset_timeout must be positive, got {reset_timeout}")
+        prefixes = tuple(prefixes)
+        self._keys = _AddressKeys(key_depth, prefixes)
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.key_depth: Optional[int] = key_depth
+        self.prefixes: Tuple[str, ...] = prefixes
+        self.failure_severities: frozenset = frozenset(failure_severities)
+        self._clock = clock
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def key_for(self, address: str or Address) -> str:
+        return self._keys(address)
+
+    def breaker(self, address: str or Address) -> CircuitBreaker:
+        """Return the circuit breaker of the address, created closed on first use."""
+        key = self.key_for(address)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(key, self.failure_threshold, self.reset_timeout,
+                                                           self._clock)
+        return breaker
+
+    def states(self) -> Dict[str, CircuitState]:
+        """Return the state of every known key."""
+        return {key: b.state for key, b in self._breakers.items()}
+
+    def _breakers_of(self, addresses: Iterable[str or Address]) -> List[CircuitBreaker]:
+        # a fixed order, two multi-address requests never wait for each other's probes crosswise
+        return sorted({id(b): b for b in (self.breaker(a) for a in addresses)}.values(), key=lambda b: b.key)
+
+    async def acquire(self, addresses: Iterable[str or Address]) -> List[CircuitBreaker]:
+        """
+        Wait until the circuits of all addresses let a request through, return their breakers. No probe is taken
+        while another circuit of the addresses still refuses the request.
+        """
+        breakers = self._breakers_of(addresses)
+        taken: List[CircuitBreaker] = []
+        try:
+            refusing = next((b for b in breakers if not b.ready()), None)
+            while refusing is not None:
+                await refusing.wait()
+                refusing = next((b for b in breakers if not b.ready()), None)
+            # every circuit lets the request through, the probes are taken together
+            for b in breakers:
+                b.allow()
+                taken.append(b)
+        except BaseException:
+            self.abandon(taken)
+            raise
+        return breakers
+
+    def check(self, addresses: Iterable[str or Address]) -> List[CircuitBreaker]:
+        """
+        Return the breakers of the addresses if a request may be sent now, for requests which do not wait.
+
+        :raise CircuitOpenError: if a circuit of the addresses is open
+        """
+        breakers = self._breakers_of(addresses)
+        for b in breakers:
+            if not b.ready():
+                raise CircuitOpenError(message=f"circuit {b.key} is {b.state.value}, retry in "
+                                               f"{b.retry_after():.1f} s", retry_after=b.retry_after())
+        for b in breakers:
+            b.allow()
+        return breakers
+
+    def record(self, breakers: List[CircuitBreaker], responses: Iterable) -> None:
+        """Feed the responses of a request which passed `breakers`."""
+        failed: Dict[str, bool] = {}
+        for r in responses:
+            key = self.key_for(r.address)
+            error = r.error if not r.status else None
+            failure = (error is not None and error.code != 4004
+                       and (error.severity or ResponseError.SEVERITY_NORMAL) in self.failure_severities)
+            failed[key] = failed.get(key, False) or failure
+        for b in breakers:
+            if b.key not in failed:
+                b.abandon()
+            elif failed[b.key]:
+                b.record_failure()
+            else:
+                b.record_success()
+
+    @staticmethod
+    def record_timeout(breakers: List[CircuitBreaker]) -> None:
+        for b in breakers:
+            b.record_failure()
+
+    @staticmethod
+    def abandon(breakers: List[CircuitBreaker]) -> None:
+        for b in breakers:
+            b.abandon()
+
+
 # ---------------------------------------------------------------------------
 # Budget — how long are we willing to retry
 # ---------------------------------------------------------------------------
@@ -167,10 +665,10 @@ class Budget:
     max_attempts: Optional[int] = None    #: ``None`` = unbounded
     max_seconds: Optional[float] = None   #: wall-clock cap
 
-    def is_exhausted(self, attempts: int, started_monotonic: float) -> bool:
+    def is_exhausted(self, attempts: int, started_monotonic: float, clock=time) -> bool:
         if self.max_attempts is not None and attempts >= self.max_attempts:
             return True
-        if self.max_seconds is not None and (time.monotonic() - started_monotonic) >= self.max_seconds:
+        if self.max_seconds is not None and (clock.monotonic() - started_monotonic) >= self.max_seconds:
             return True
         return False
 
@@ -192,8 +690,8 @@ class LogPolicy:
     first_n: int = 1
     then_every_seconds: float = 3600.0
 
-    def make_state(self) -> '_LogPolicyState':
-        return _LogPolicyState(policy=self)
+    def make_state(self, clock=time) -> '_LogPolicyState':
+        return _LogPolicyState(policy=self, clock=clock)
 
 
 @dataclass
@@ -203,14 +701,15 @@ class _LogPolicyState:
     policy: LogPolicy
     fired: int = 0
     last_warned_at: float = -math.inf
+    clock: Any = field(default=time, repr=False)  #: source of ``monotonic()``
 
     def should_warn(self) -> bool:
         self.fired += 1
         if self.fired <= self.policy.first_n:
-            self.last_warned_at = time.monotonic()
+            self.last_warned_at = self.clock.monotonic()
             return True
-        if (time.monotonic() - self.last_warned_at) >= self.policy.then_every_seconds:
-            self.last_warned_at = time.monotonic()
+        if (self.clock.monotonic() - self.last_warned_at) >= self.policy.then_every_seconds:
+            self.last_warned_at = self.clock.monotonic()
             return True
         return False
 
@@ -241,6 +740,12 @@ class ErrorPolicy:
     temporary: SeverityRule
     normal: SeverityRule
     critical: SeverityRule
+    #: shared token bucket every retry has to pass, ``None`` = unlimited
+    retry_limiter: Optional[RetryLimiter] = None
+    #: circuit breakers shared with other subscriptions, ``None`` = no circuit breaking
+    circuit_breakers: Optional[CircuitBreakerRegistry] = None
+    #: retry budget shared with other subscriptions, ``None`` = unlimited
+    retry_throttle: Optional[RetryThrottle] = None
 
     # Class-level presets — set after the class body so they are full
     # ``ErrorPolicy`` instances. See module bottom.
@@ -262,6 +767,18 @@ class ErrorPolicy:
             kwargs['critical'] = critical
         return replace(self, **kwargs)
 
+    def with_retry_limiter(self, limiter: Optional[RetryLimiter]) -> 'ErrorPolicy':
+        """Return a copy whose retries draw from ``limiter`` (``None`` removes the limit)."""
+        return replace(self, retry_limiter=limiter)
+
+    def with_circuit_breakers(self, registry: Optional[CircuitBreakerRegistry]) -> 'ErrorPolicy':
+        """Return a copy whose requests pass the circuit breakers of ``registry`` (``None`` removes them)."""
+        return replace(self, circuit_breakers=registry)
+
+    def with_retry_throttle(self, throttle: Optional[RetryThrottle]) -> 'ErrorPolicy':
+        """Return a copy whose retries are allowed by ``throttle`` (``None`` removes it)."""
+        return replace(self, retry_throttle=throttle)
+
     def rule_for(self, severity: Optional[str]) -> SeverityRule:
         """Look up the rule that applies to a given severity string.
 
@@ -329,8 +846,13 @@ ErrorPolicy.FAIL_FAST = ErrorPolicy(
 __all__ = [
     'Backoff',
     'Budget',
+    'CircuitBreaker',
+    'CircuitBreakerRegistry',
+    'CircuitState',
     'ErrorPolicy',
     'LogPolicy',
+    'RetryLimiter',
+    'RetryThrottle',
     'SeverityAction',
     'SeverityRule',
 ]
@@ -0,0 +1,176 @@
+"""Shared ticks for many periodic cycle queries.
+
+Every :class:`PeriodicCycleQuery` normally runs its own timer and sends its
+own request, so 500 queries polling once a second mean 500 round trips per
+second. Queries created with a :class:`PeriodicScheduler` register on a
+shared tick instead (a timer wheel keyed by period): on each tick the
+requests of all queries with that period are sent in one batched
+``send_request`` and the responses are fanned back out to the queries.
+
+The queries keep their own error handling (missed messages, error policy)
+and their own consumers; only the timer and the round trip are shared. The
+first response of a query registered on a running tick comes with the next
+tick of that period.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from obcom.comunication.base_client_request_solver import BaseClientRequestSolver
+from obcom.comunication.comunication_error import CommunicationRuntimeError, CommunicationTimeoutError
+from obcom.comunication.cycle_query import PeriodicCycleQuery
+from obcom.comunication.response_queue import OverflowPolicy, _ResponseQueue
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+__all__ = ['PeriodicScheduler']
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+class _Wheel:
+    """Queries sharing one period and the task ticking for them."""
+
+    __slots__ = ('period', 'members', 'task')
+
+    def __init__(self, period: float):
+        self.period: float = period
+        # registration order is kept, responses are split in the same order
+        self.members: Dict[PeriodicCycleQuery, _ResponseQueue] = {}
+        self.task: Optional[asyncio.Task] = None
+
+
+class PeriodicScheduler:
+    """
+    Timer wheel coalescing periodic cycle queries with the same period into one request per tick.
+
+    :param crs: request solver used to send the batched requests
+    :param loop: async loop
+    :param max_batch_size: maximum number of requests in one `send_request`, bigger ticks are split into several
+        requests sent concurrently. None - no limit
+    """
+
+    def __init__(self, crs: BaseClientRequestSolver, loop=None, max_batch_size: int = None):
+        if max_batch_size is not None and max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self._crs: BaseClientRequestSolver = crs
+        self._loop = loop
+        self._max_batch_size: Optional[int] = max_batch_size
+        self._wheels: Dict[float, _Wheel] = {}
+
+    @property
+    def crs(self) -> BaseClientRequestSolver:
+        return self._crs
+
+    def _get_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop
+
+    def periods(self) -> List[float]:
+        """Return the periods which have a running tick."""
+        return list(self._wheels)
+
+    def members_count(self, period: float = None) -> int:
+        """Return number of registered queries, all or with given period."""
+        if period is not None:
+            wheel = self._wheels.get(period)
+            return len(wheel.members) if wheel else 0
+        return sum(len(w.members) for w in self._wheels.values())
+
+    def _register(self, cq: PeriodicCycleQuery) -> _ResponseQueue:
+        """Add a query to the tick of its period, return the queue its responses are delivered to."""
+        period = cq.get_delay()
+        wheel = self._wheels.get(period)
+        if wheel is None:
+            wheel = self._wheels[period] = _Wheel(period)
+        queue = _ResponseQueue(maxsize=1, overflow=OverflowPolicy.KEEP_LATEST)
+        wheel.members[cq] = queue
+        if wheel.task is None:
+            wheel.task = self._get_loop().create_task(self._tick(wheel))
+        return queue
+
+    def _unregister(self, cq: PeriodicCycleQuery):
+        for period, wheel in list(self._wheels.items()):
+            queue = wheel.members.pop(cq, None)
+            if queue is None:
+                continue
+            queue.close()
+            if not wheel.members:
+                del self._wheels[period]
+                if wheel.task is not None:
+                    wheel.task.cancel()
+
+    async def close(self):
+        """Stop all ticks. Registered queries stop receiving responses, stop them first."""
+        wheels = list(self._wheels.values())
+        self._wheels.clear()
+        for wheel in wheels:
+            for queue in wheel.members.values():
+                queue.close()
+            if wheel.task is not None:
+                wheel.task.cancel()
+        for wheel in wheels:
+            if wheel.task is not None:
+                try:
+                    await wheel.task
+                except asyncio.CancelledError:
+                    pass
+
+    async def _tick(self, wheel: _Wheel):
+        loop = self._get_loop()
+        next_tick = loop.time()
+        while wheel.members:
+            wait_range = next_tick - loop.time()
+            if wait_range > 0:
+                await asyncio.sleep(wait_range)
+            members = list(wheel.members.items())
+            if members:
+                await self._send_tick(wheel, members)
+            next_tick += wheel.period
+            if next_tick < loop.time():
+                # the round trip took longer than the period, the missed ticks are skipped
+                skipped = int((loop.time() - next_tick) // wheel.period) + 1
+                logger.debug(f"Periodic tick {wheel.period}: {skipped} tick(s) skipped")
+                next_tick += skipped * wheel.period
+
+    async def _send_tick(self, wheel: _Wheel, members: List[Tuple[PeriodicCycleQuery, _ResponseQueue]]):
+        tick_time = time.time()
+        requests: List[ValueRequest] = []
+        sizes: List[int] = []
+        for cq, _ in members:
+            cq._change_time(tick_time)
+            own = cq._get_list_request_with_extinction()
+            requests.extend(own)
+            sizes.append(len(own))
+        chunks = [requests]
+        if self._max_batch_size is not None and len(requests) > self._max_batch_size:
+            chunks = [requests[i:i + self._max_batch_size] for i in range(0, len(requests), self._max_batch_size)]
+        timeout = tick_time + wheel.period
+        results = await asyncio.gather(*(self._crs.send_request(requests=chunk, timeout=timeout, no_wait=False)
+                                         for chunk in chunks), return_exceptions=True)
+        responses: List[ValueResponse] = []
+        error: Optional[BaseException] = None
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                error = result
+                break
+            if result is None:
+                error = CommunicationRuntimeError(message="Can not get response for giving request, check that the "
+                                                          "'no_wait' flag is not set to true")
+                break
+            if len(result) != len(chunk):
+                logger.warning(f"Periodic tick {wheel.period}: got {len(result)} responses for {len(chunk)} requests")
+                error = CommunicationTimeoutError(message="Response does not match the batched requests")
+                break
+            responses.extend(result)
+        if isinstance(error, asyncio.CancelledError):
+            raise error
+        start = 0
+        for (cq, queue), size in zip(members, sizes):
+            if error is not None:
+                await queue.put(([], error, None))
+            else:
+                await queue.put((responses[start:start + size], None, None))
+            start += size
@@ -0,0 +1,467 @@
+"""Offline load simulator of error policies on a virtual clock.
+
+Choosing the ``Backoff`` / ``Budget`` / ``LogPolicy`` settings of an
+``ErrorPolicy`` means guessing how many requests the retries of all
+subscriptions send to the router during an outage, how many log lines they
+write and how quickly the subscriptions are back after it.
+:class:`PolicySimulator` answers that without a router: it runs N
+``ConditionalCycleQuery`` instances against a scripted request solver
+(:class:`SimulatedSolver`) and reports the numbers in a
+:class:`SimulationReport`.
+
+The scripted solver serves conditional long-polls of values changing every
+``change_interval`` seconds, with a latency drawn from a distribution. In
+:class:`Outage` windows it answers with errors of a given severity and
+code, or does not answer at all (router down, the requests time out).
+
+The simulation runs on a virtual clock: the event loop jumps to the next
+timer instead of waiting for it, and the cycle queries, the retry limiter,
+the circuit breakers and the rate controller of the simulation read their
+time from the clock (their ``clock`` parameter), so a multi-hour outage
+takes seconds::
+
+    simulator = PolicySimulator(ErrorPolicy.SERVICE, queries=200, duration=3 * 3600,
+                                outages=[Outage(start=600, end=2 * 3600)])
+    print(simulator.run().summary())
+
+:meth:`PolicySimulator.run` runs its own event loop, it can not be called
+from a running loop. Nothing outside the simulation sees the virtual clock.
+"""
+
+import asyncio
+import contextlib
+import logging
+import math
+import random
+import selectors
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from obcom.comunication.base_client_request_solver import BaseClientRequestSolver
+from obcom.comunication.comunication_error import CommunicationTimeoutError
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.comunication.error_policy import CircuitBreakerRegistry, ErrorPolicy, RetryLimiter
+from obcom.comunication.rate_control import AimdRateController
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+__all__ = ['Outage', 'PolicySimulator', 'SimulatedSolver', 'SimulationReport', 'VirtualClock']
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+# loggers whose lines are counted
+_COUNTED_LOGGERS = ('cycle_query', 'error_policy', 'rate_control')
+
+
+class VirtualClock:
+    """
+    Simulated time, seconds from the start of the simulation. Wall time is `epoch` plus the simulated time. Passed as
+    the `clock` of the components of the simulation in place of the `time` module.
+    """
+
+    def __init__(self, epoch: float = 1_700_000_000.0):
+        self.epoch: float = epoch
+        self.now: float = 0.0
+
+    def wall(self) -> float:
+        return self.epoch + self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    def time(self) -> float:
+        return self.wall()
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Selector advancing the virtual clock by the time the loop would wait for its next timer."""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # nothing scheduled, only a thread can wake the loop
+            return super().select(None)
+        if timeout > 0:
+            self._clock.advance(timeout)
+        return super().select(0)
+
+
+class _VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__(selector=_VirtualSelector(clock))
+        self._virtual_clock = clock
+
+    def time(self) -> float:
+        return self._virtual_clock.now
+
+
+class _LineCounter(logging.Handler):
+
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.lines: Counter = Counter()
+
+    def emit(self, record: logging.LogRecord):
+        self.lines[record.levelname] += 1
+
+
+@contextlib.contextmanager
+def _counted_logs(counter: _LineCounter, quiet: bool):
+    loggers = [logging.getLogger(name) for name in _COUNTED_LOGGERS]
+    propagate = [lg.propagate for lg in loggers]
+    for lg in loggers:
+        lg.addHandler(counter)
+        if quiet:
+            lg.propagate = False
+    try:
+        yield
+    finally:
+        for lg, p in zip(loggers, propagate):
+            lg.removeHandler(counter)
+            lg.propagate = p
+
+
+@dataclass(frozen=True)
+class Outage:
+    """
+    Window of the simulation in which the router does not serve the requests.
+
+    :param start: start, seconds from the start of the simulation
+    :param end: end, seconds from the start of the simulation
+    :param severity: severity of the errors answered in the window
+    :param code: code of the errors answered in the window
+    :param timeout: if True the requests get no answer and time out (router down), `severity` and `code` are not used
+    """
+
+    start: float
+    end: float
+    severity: str = ResponseError.SEVERITY_TEMPORARY
+    code: int = 4002
+    timeout: bool = False
+
+    def __post_init__(self):
+        if self.end <= self.start:
+            raise ValueError(f"outage must end after it starts, got {self.start} - {self.end}")
+
+
+class SimulatedSolver(BaseClientRequestSolver):
+    """
+    Scripted request solver of a simulation, see the module description. Counts every request as the router would
+    see it; a request of an address whose previous request failed or timed out is a retry.
+
+    :param clock: virtual clock of the simulation
+    :param outages: outage windows
+    :param change_interval: every address changes its value every `change_interval` seconds, at its own phase
+    :param latency: seconds of every answer, or a function drawing them from the random generator
+    :param rng: random generator of the latencies and phases
+    """
+
+    def __init__(self, clock: VirtualClock, outages: Sequence[Outage] = (), change_interval: float = 10.0,
+                 latency: Union[float, Callable[[random.Random], float]] = 0.005, rng: random.Random = None):
+        self._clock = clock
+        self._outages: List[Outage] = sorted(outages, key=lambda o: o.start)
+        self._change_interval: float = change_interval
+        self._latency = latency
+        self._rng: random.Random = rng or random.Random(0)
+        self._phases: Dict[str, float] = {}
+        self._failed: Dict[str, bool] = {}
+        self.requests: int = 0
+        self.retries: int = 0
+        # retries per whole second of the simulation
+        self.retries_per_second: Counter = Counter()
+
+    def _draw_latency(self) -> float:
+        if callable(self._latency):
+            return max(0.0, self._latency(self._rng))
+        return self._latency
+
+    def outage_at(self, t: float) -> Optional[Outage]:
+        for o in self._outages:
+            if o.start <= t < o.end:
+                return o
+        return None
+
+    def _next_outage_start(self, t: float) -> float:
+        return min((o.start for o in self._outages if o.start > t), default=math.inf)
+
+    def _phase(self, address: str) -> float:
+        phase = self._phases.get(address)
+        if phase is None:
+            phase = self._phases[address] = self._rng.uniform(0.0, self._change_interval)
+        return phase
+
+    def _last_change(self, address: str, t: float) -> float:
+        phase = self._phase(address)
+        return phase + math.floor((t - phase) / self._change_interval) * self._change_interval
+
+    def _ready_at(self, request: ValueRequest, t: float) -> float:
+        """Simulated time at which the long-poll of the request has a value to answer with."""
+        address = str(request.address)
+        data = request.request_data or {}
+        known = data.get('time_of_known_change')
+        ready = t
+        if known is not None:
+            known -= self._clock.epoch
+            phase = self._phase(address)
+            # the next change after the known one, which is itself a change time up to rounding
+            changes = math.floor((known - phase) / self._change_interval + 1e-6) + 1
+            ready = max(t, phase + changes * self._change_interval)
+        no_send_before = data.get('no_send_before')
+        if no_send_before is not None:
+            ready = max(ready, no_send_before - self._clock.epoch)
+        return ready
+
+    def _count(self, requests: List[ValueRequest], t: float):
+        self.requests += 1
+        if any(self._failed.get(str(r.address)) for r in requests):
+            self.retries += 1
+            self.retries_per_second[int(t)] += 1
+
+    def _mark(self, requests: List[ValueRequest], failed: bool):
+        for r in requests:
+            self._failed[str(r.address)] = failed
+
+    async def _sleep_until(self, t: float):
+        await asyncio.sleep(max(0.0, t - self._clock.now))
+
+    async def _time_out(self, requests: List[ValueRequest], timeout: Optional[float]):
+        self._mark(requests, True)
+        if timeout is not None:
+            await self._sleep_until(timeout - self._clock.epoch)
+        raise CommunicationTimeoutError()
+
+    async def send_request(self, requests: List[ValueRequest], timeout: float = None,
+                           no_wait: bool = False) -> List[ValueResponse]:
+        t = self._clock.now
+        self._count(requests, t)
+        outage = self.outage_at(t)
+        if outage is None:
+            lease_end = t + min(r.request_timeout for r in requests)
+            if timeout is not None:
+                # the same moment, up to the rounding of the wall time
+                lease_end = min(lease_end, timeout - self._clock.epoch)
+            ready = min(self._ready_at(r, t) for r in requests)
+            # a value takes the latency to come, the router answers within the lease
+            answer_at = min(ready + self._draw_latency(), lease_end)
+            outage_start = self._next_outage_start(t)
+            if outage_start < answer_at:
+                # the long-poll is lost with the start of the outage
+                await self._sleep_until(outage_start)
+                outage = self.outage_at(outage_start)
+            elif timeout is not None and answer_at > timeout - self._clock.epoch:
+                return await self._time_out(requests, timeout)
+            else:
+                await self._sleep_until(answer_at)
+                self._mark(requests, False)
+                if ready > lease_end:
+                    return [ValueResponse(address=r.address, value=None, status=False,
+                                          error=ResponseError(code=4004, message='subscription expired',
+                                                              component_name='simulator'))
+                            for r in requests]
+                return [ValueResponse(address=r.address, value=Value(v=self._last_change(str(r.address), ready),
+                                                                     ts=self._clock.epoch + self._last_change(
+                                                                         str(r.address), ready),
+                                                                     tags={'from_cf': True}),
+                                      status=True)
+                        for r in requests]
+        if outage.timeout:
+            return await self._time_out(requests, timeout)
+        await asyncio.sleep(self._draw_latency())
+        self._mark(requests, True)
+        return [ValueResponse(address=r.address, value=None, status=False,
+                              error=ResponseError(code=outage.code, message='simulated outage',
+                                                  severity=outage.severity, component_name='simulator'))
+                for r in requests]
+
+
+@dataclass
+class SimulationReport:
+    """
+    Outcome of a simulation.
+
+    :ivar duration: simulated seconds
+    :ivar queries: number of simulated subscriptions
+    :ivar requests: requests received by the router
+    :ivar retries: requests of an address whose previous request failed or timed out
+    :ivar peak_retry_rate: the most retries in one second
+    :ivar mean_retry_rate: retries per second of all outage windows
+    :ivar recovery_times: per outage, seconds from its end until every subscription still running delivered a
+        value, None if they did not before the next outage or the end of the simulation
+    :ivar callbacks: responses delivered to the callbacks
+    :ivar error_callbacks: error responses delivered to the callbacks
+    :ivar stopped: subscriptions stopped by their error policy
+    :ivar log_lines: lines logged by the cycle queries, by level name
+    :ivar real_seconds: wall-clock time of the simulation
+    """
+
+    duration: float
+    queries: int
+    requests: int = 0
+    retries: int = 0
+    peak_retry_rate: int = 0
+    mean_retry_rate: float = 0.0
+    recovery_times: List[Optional[float]] = field(default_factory=list)
+    callbacks: int = 0
+    error_callbacks: int = 0
+    stopped: int = 0
+    log_lines: Dict[str, int] = field(default_factory=dict)
+    real_seconds: float = 0.0
+
+    @property
+    def warning_lines(self) -> int:
+        """Lines logged at the WARNING level or above."""
+        return sum(n for level, n in self.log_lines.items() if logging.getLevelName(level) >= logging.WARNING)
+
+    def summary(self) -> str:
+        recovery = ', '.join('not recovered' if r is None else f'{r:.1f} s' for r in self.recovery_times) or '-'
+        logs = ', '.join(f'{level} {n}' for level, n in sorted(self.log_lines.items())) or '-'
+        return (f"{self.queries} queries, {self.duration:.0f} s simulated in {self.real_seconds:.2f} s\n"
+                f"  requests: {self.requests}, retries: {self.retries} (peak {self.peak_retry_rate}/s, "
+                f"mean {self.mean_retry_rate:.2f}/s during outages)\n"
+                f"  time to recover: {recovery}\n"
+                f"  callbacks: {self.callbacks} ({self.error_callbacks} errors), stopped queries: {self.stopped}\n"
+                f"  log lines: {logs}")
+
+
+class PolicySimulator:
+    """
+    Runs `queries` conditional subscriptions with `error_policy` against a :class:`SimulatedSolver`, see the module
+    description. The retry limiter and the circuit breakers of `error_policy` and the `rate_controller` are replaced by
+    new ones with the same settings on the virtual clock, the shared ones of the application are not touched.
+
+    :param error_policy: policy of every subscription
+    :param queries: number of subscriptions, one address each
+    :param duration: simulated seconds
+    :param outages: outage windows
+    :param change_interval: seconds between value changes of every address
+    :param latency: seconds of every answer, or a function drawing them from a `random.Random`
+    :param request_timeout: long-poll lease of the subscriptions
+    :param delay: `delay` of the subscriptions
+    :param max_missed_msg: missed answers after which a subscription stops, -1 - never
+    :param seed: seed of the random generator
+    :param quiet: do not pass the log lines of the simulation to the handlers of the application, only count them
+    :param rate_controller: request rate control of the simulated client, None - not paced
+    :param query_kwargs: other arguments of the `ConditionalCycleQuery` instances
+    """
+
+    def __init__(self, error_policy: ErrorPolicy, queries: int = 100, duration: float = 3600.0,
+                 outages: Sequence[Outage] = (), change_interval: float = 10.0,
+                 latency: Union[float, Callable[[random.Random], float]] = 0.005, request_timeout: float = 30.0,
+                 delay: float = 0.1, max_missed_msg: int = -1, seed: int = 0, quiet: bool = True,
+                 rate_controller: Optional[AimdRateController] = None, **query_kwargs):
+        if queries < 1:
+            raise ValueError(f"queries must be at least 1, got {queries}")
+        if duration <= 0:
+            raise ValueError(f"duration must be positive, got {duration}")
+        self.error_policy: ErrorPolicy = error_policy
+        self.queries: int = queries
+        self.duration: float = duration
+        self.outages: List[Outage] = sorted(outages, key=lambda o: o.start)
+        self.change_interval: float = change_interval
+        self.latency = latency
+        self.request_timeout: float = request_timeout
+        self.delay: float = delay
+        self.max_missed_msg: int = max_missed_msg
+        self.seed: int = seed
+        self.quiet: bool = quiet
+        self.rate_controller: Optional[AimdRateController] = rate_controller
+        self.query_kwargs: dict = query_kwargs
+
+    def run(self) -> SimulationReport:
+        """Run the simulation and return its report."""
+        clock = VirtualClock()
+        loop = _VirtualTimeEventLoop(clock)
+        counter = _LineCounter()
+        real_start = time.perf_counter()
+        try:
+            with _counted_logs(counter, self.quiet):
+                report = loop.run_until_complete(self._simulate(clock))
+        finally:
+            loop.close()
+        report.log_lines = dict(counter.lines)
+        report.real_seconds = time.perf_counter() - real_start
+        logger.info(f"simulated {self.duration:.0f} s in {report.real_seconds:.2f} s")
+        return report
+
+    async def _simulate(self, clock: VirtualClock) -> SimulationReport:
+        rng = random.Random(self.seed)
+        solver = SimulatedSolver(clock, outages=self.outages, change_interval=self.change_interval,
+                                 latency=self.latency, rng=rng)
+        controller = self.rate_controller
+        if controller is not None:
+            solver.rate_controller = AimdRateController(
+                initial_rate=controller.initial_rate, min_rate=controller.min_rate, max_rate=controller.max_rate,
+                increase=controller.increase, decrease=controller.decrease, key_depth=controller.key_depth,
+                prefixes=controller.prefixes, overload_codes=controller.overload_codes, clock=clock)
+        error_policy = self._clocked_policy(clock)
+        deliveries: List[List[tuple]] = []  # per query (simulated time, status)
+        queries = []
+        for i in range(self.queries):
+            delivered = []
+            deliveries.append(delivered)
+            request = ValueRequest(address=f'sim.device.value_{i}', time_of_data=clock.time())
+            cq = ConditionalCycleQuery(crs=solver, list_request=[request], delay=self.delay,
+                                       request_timeout=self.request_timeout, max_missed_msg=self.max_missed_msg,
+                                       error_policy=error_policy, query_name=f'sim {i}', clock=clock,
+                                       **self.query_kwargs)
+            cq.add_callback_method(lambda responses, d=delivered: d.append(
+                (clock.now, bool(responses) and all(r.status for r in responses))))
+            queries.append(cq)
+            cq.start()
+        await asyncio.sleep(self.duration)
+        running = [not cq.is_stopped() for cq in queries]
+        for cq in queries:
+            await cq.stop_and_wait()
+
+        report = SimulationReport(duration=self.duration, queries=self.queries, requests=solver.requests,
+                                  retries=solver.retries, stopped=running.count(False))
+        report.peak_retry_rate = max(solver.retries_per_second.values(), default=0)
+        outage_seconds = sum(min(o.end, self.duration) - o.start for o in self.outages if o.start < self.duration)
+        if outage_seconds > 0:
+            in_outages = sum(n for second, n in solver.retries_per_second.items()
+                             if any(o.start <= second < o.end for o in self.outages))
+            report.mean_retry_rate = in_outages / outage_seconds
+        report.callbacks = sum(len(d) for d in deliveries)
+        report.error_callbacks = sum(1 for d in deliveries for _, ok in d if not ok)
+        for i, o in enumerate(self.outages):
+            limit = self.outages[i + 1].start if i + 1 < len(self.outages) else self.duration
+            report.recovery_times.append(
+                self._recovery_time(o, limit, [d for d, r in zip(deliveries, running) if r]))
+        return report
+
+    def _clocked_policy(self, clock: VirtualClock) -> ErrorPolicy:
+        """`error_policy` with its retry limiter and circuit breakers created again on `clock`."""
+        policy = self.error_policy
+        limiter = policy.retry_limiter
+        if limiter is not None:
+            policy = policy.with_retry_limiter(RetryLimiter(rate=limiter.rate, burst=limiter.burst, clock=clock))
+        registry = policy.circuit_breakers
+        if registry is not None:
+            policy = policy.with_circuit_breakers(CircuitBreakerRegistry(
+                failure_threshold=registry.failure_threshold, reset_timeout=registry.reset_timeout,
+                key_depth=registry.key_depth, prefixes=registry.prefixes,
+                failure_severities=registry.failure_severities, clock=clock))
+        return policy
+
+    @staticmethod
+    def _recovery_time(outage: Outage, limit: float, deliveries: List[List[tuple]]) -> Optional[float]:
+        """Seconds from the end of the outage until every one of `deliveries` got a value, None if not by `limit`."""
+        if outage.end > limit or not deliveries:
+            return None
+        recovered = outage.end
+        for delivered in deliveries:
+            first = next((t for t, ok in delivered if ok and t >= outage.end), None)
+            if first is None or first > limit:
+                return None
+            recovered = max(recovered, first)
+        return recovered - outage.end
@@ -0,0 +1,232 @@
+"""Client-side congestion control of the request rate (AIMD).
+
+A busy device answers with errors of the TEMPORARY severity, the busy code
+4008 or the 4004 "time to generate the value has been exceeded", or does
+not answer at all. Clients sending at full rate keep it overloaded, and
+hundreds of clients retrying together bring the router down.
+
+:class:`AimdRateController` paces the requests of a client per endpoint
+(an address prefix, as in :class:`.error_policy.CircuitBreakerRegistry`)
+with an additive-increase / multiplicative-decrease rate, like TCP:
+
+* every request of an endpoint takes the next free slot of its rate, the
+  requests are spread ``1 / rate`` seconds apart,
+* an overload signal (error above, timeout) multiplies the rate by
+  ``decrease``, once for the requests sent at the old rate,
+* every successful response adds ``increase / rate``, so the rate grows by
+  about ``increase`` requests per second each second at full load.
+
+Many clients controlled this way converge to an equal share of the
+capacity of the device instead of oscillating into collapse.
+
+The controller is attached to the request solver
+(:attr:`.base_client_request_solver.BaseClientRequestSolver.rate_controller`)
+and paces the ``ConditionalCycleQuery`` subscriptions and single requests
+(``get_async``, ``send_multi``) of a client using it::
+
+    crs.rate_controller = AimdRateController(key_depth=2)
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import ClassVar, Dict, Iterable, List, Optional, Tuple
+
+from obcom.comunication.error_policy import _AddressKeys
+from obcom.data_colection.address import Address
+from obcom.data_colection.response_error import ResponseError
+
+__all__ = ['AimdRateController', 'EndpointRate']
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+class EndpointRate:
+    """AIMD request rate of one endpoint of an :class:`AimdRateController`."""
+
+    def __init__(self, key: str, rate: float, min_rate: float, max_rate: float, increase: float,
+                 decrease: float, clock=time) -> None:
+        self.key: str = key
+        self.min_rate: float = min_rate
+        self.max_rate: float = max_rate
+        self.increase: float = increase
+        self.decrease: float = decrease
+        self._rate: float = rate
+        self._clock = clock
+        self._next_slot: float = -float('inf')
+        self._last_slot: Optional[float] = None  # slot taken last, `_next_slot` follows it
+        self._returned: List[float] = []  # heap of slots given back before the next free one
+        self._decreased_at: float = -float('inf')
+
+    @property
+    def rate(self) -> float:
+        """Allowed requests per second."""
+        return self._rate
+
+    def reserve(self) -> float:
+        """Take the next free slot, return its monotonic time (now if the endpoint is idle)."""
+        now = self._clock.monotonic()
+        while self._returned:
+            slot = heapq.heappop(self._returned)
+            if slot >= now:
+                return slot
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1.0 / self._rate
+        self._last_slot = slot
+        return slot
+
+    def release(self, slot: float) -> None:
+        """Give back a slot which was reserved but not used, the next request takes it."""
+        if slot == self._last_slot:
+            self._next_slot = slot
+            self._last_slot = None
+        else:
+            heapq.heappush(self._returned, slot)
+
+    def record_success(self) -> None:
+        self._rate = min(self.max_rate, self._rate + self.increase / self._rate)
+
+    def record_overload(self, sent_at: float) -> None:
+        """Cut the rate, unless the request was sent before the last cut (it was paced by the old rate)."""
+        if sent_at <= self._decreased_at:
+            return
+        old = self._rate
+        self._rate = max(self.min_rate, self._rate * self.decrease)
+        self._decreased_at = self._clock.monotonic()
+        # the slots already taken stay, the next ones follow the new rate
+        logger.info(f'rate of {self.key}: {old:.1f} -> {self._rate:.1f} requests/s')
+
+
+class AimdRateController:
+    """
+    Request rates of many endpoints, see the module description.
+
+    :param initial_rate: rate of an endpoint seen for the first time, requests per second
+    :param min_rate: the rate is never cut below it
+    :param max_rate: the rate never grows above it
+    :param increase: growth of the rate per second of successful requests at full rate, requests per second
+    :param decrease: factor of the rate after an overload signal, between 0 and 1
+    :param key_depth: endpoint of an address is its first `key_depth` components (if not in `prefixes`)
+    :param prefixes: explicit endpoints, the longest one an address belongs to is its endpoint
+    :param overload_codes: error codes which signal overload
+    :param clock: source of `monotonic()`, default - the `time` module
+    """
+
+    DEFAULT_INITIAL_RATE: ClassVar[float] = 100.0
+    DEFAULT_MIN_RATE: ClassVar[float] = 1.0
+    DEFAULT_MAX_RATE: ClassVar[float] = 1000.0
+    DEFAULT_INCREASE: ClassVar[float] = 10.0
+    DEFAULT_DECREASE: ClassVar[float] = 0.5
+    #: 4004 - the time to generate the value has been exceeded, 4008 - device busy
+    DEFAULT_OVERLOAD_CODES: ClassVar[Tuple[int, ...]] = (4004, 4008)
+
+    def __init__(self, initial_rate: float = DEFAULT_INITIAL_RATE, min_rate: float = DEFAULT_MIN_RATE,
+                 max_rate: float = DEFAULT_MAX_RATE, increase: float = DEFAULT_INCREASE,
+                 decrease: float = DEFAULT_DECREASE, key_depth: Optional[int] = None, prefixes: Iterable[str] = (),
+                 overload_codes: Iterable[int] = DEFAULT_OVERLOAD_CODES, clock=time) -> None:
+        if not 0 < min_rate <= initial_rate <= max_rate:
+            raise ValueError(f"rates must satisfy 0 < min_rate <= initial_rate <= max_rate, got "
+                             f"{min_rate}, {initial_rate}, {max_rate}")
+        if increase <= 0:
+            raise ValueError(f"increase must be positive, got {increase}")
+        if not 0 < decrease < 1:
+            raise ValueError(f"decrease must be between 0 and 1, got {decrease}")
+        prefixes = tuple(prefixes)
+        self._keys = _AddressKeys(key_depth, prefixes)
+        self.key_depth: Optional[int] = key_depth
+        self.prefixes: Tuple[str, ...] = prefixes
+        self.initial_rate: float = initial_rate
+        self.min_rate: float = min_rate
+        self.max_rate: float = max_rate
+        self.increase: float = increase
+        self.decrease: float = decrease
+        self.overload_codes: frozenset = frozenset(overload_codes)
+        self._clock = clock
+        self._endpoints: Dict[str, EndpointRate] = {}
+
+    def key_for(self, address: str or Address) -> str:
+        return self._keys(address)
+
+    def endpoint(self, address: str or Address) -> EndpointRate:
+        """Return the rate of the endpoint of the address, created with `initial_rate` on first use."""
+        key = self.key_for(address)
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            endpoint = self._endpoints[key] = EndpointRate(key, self.initial_rate, self.min_rate, self.max_rate,
+                                                           self.increase, self.decrease, self._clock)
+        return endpoint
+
+    def rates(self) -> Dict[str, float]:
+        """Return the rate of every known endpoint."""
+        return {key: e.rate for key, e in self._endpoints.items()}
+
+    def reserve(self, addresses: Iterable[str or Address]) -> Tuple[float, List[Tuple[EndpointRate, float]]]:
+        """
+        Take a slot of every endpoint of the addresses.
+
+        :return: seconds to wait before sending and the taken slots, to pass to `record`
+        """
+        endpoints = {}
+        for a in addresses:
+            e = self.endpoint(a)
+            endpoints[e.key] = e
+        slots = [(e, e.reserve()) for e in endpoints.values()]
+        wait = max((slot for _, slot in slots), default=0.0) - self._clock.monotonic()
+        return max(0.0, wait), slots
+
+    @staticmethod
+    def release(slots: List[Tuple[EndpointRate, float]]) -> None:
+        """Give back slots taken by `reserve` for a request which was not sent."""
+        for e, slot in slots:
+            e.release(slot)
+
+    async def acquire(self, addresses: Iterable[str or Address]) -> List[Tuple[EndpointRate, float]]:
+        """Wait for the slots of the endpoints of the addresses, return them. The slots are given back if cancelled."""
+        wait, slots = self.reserve(addresses)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                self.release(slots)
+                raise
+        return slots
+
+    def is_overload(self, response, long_poll: bool = False) -> bool:
+        """
+        Return True if the response signals an overloaded endpoint.
+
+        :param response: response
+        :param long_poll: response of a conditional long-poll, its 4004 is the expiry of the subscription
+        """
+        error = response.error if not response.status else None
+        if error is None:
+            return False
+        if error.code == 4004 and long_poll:
+            return False
+        return error.code in self.overload_codes or error.severity == ResponseError.SEVERITY_TEMPORARY
+
+    def record(self, slots: List[Tuple[EndpointRate, float]], responses: Iterable, long_poll: bool = False) -> None:
+        """Feed the responses of a request sent in `slots`."""
+        signals: Dict[str, Optional[bool]] = {}  # True - overload, False - success, None - expired long-poll
+        for r in responses:
+            if self.is_overload(r, long_poll):
+                signal = True
+            elif long_poll and not r.status and r.error is not None and r.error.code == 4004:
+                signal = None
+            else:
+                signal = False
+            key = self.key_for(r.address)
+            known = signals.get(key)
+            signals[key] = signal if known is None else known or bool(signal)
+        for e, sent_at in slots:
+            signal = signals.get(e.key)
+            if signal:
+                e.record_overload(sent_at)
+            elif signal is not None:
+                e.record_success()
+
+    @staticmethod
+    def record_timeout(slots: List[Tuple[EndpointRate, float]]) -> None:
+        for e, sent_at in slots:
+            e.record_overload(sent_at)
@@ -0,0 +1,191 @@
+"""Per-consumer delivery of cycle query responses.
+
+``BaseCycleQuery.get_response()`` wakes every waiting task with one shared
+event, so a consumer which is slow to await again silently misses updates.
+:class:`ResponseSubscription` gives every consumer its own bounded queue
+instead, filled by the cycle query for each published response::
+
+    async for responses in cq.iterate(maxsize=32, overflow=OverflowPolicy.DROP_OLDEST):
+        ...
+
+What happens when a consumer falls behind is chosen with
+:class:`OverflowPolicy`; updates that are thrown away are counted in
+:attr:`ResponseSubscription.dropped`.
+"""
+
+import asyncio
+import weakref
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, List, Optional, Tuple
+
+from obcom.comunication.change_set import ChangeSet
+from obcom.comunication.comunication_error import CommunicationRuntimeError
+from obcom.data_colection.value_call import ValueResponse
+
+__all__ = ['OverflowPolicy', 'ResponseSubscription']
+
+# responses, error and the change set of the responses (None if not known)
+_Item = Tuple[List[ValueResponse], Optional[CommunicationRuntimeError], Optional[ChangeSet]]
+
+
+class OverflowPolicy(str, Enum):
+    """What a full consumer queue does with a new response."""
+
+    BLOCK = 'block'  # the cycle query waits until the consumer takes a response, nothing is lost
+    DROP_OLDEST = 'drop_oldest'  # the oldest queued response is dropped
+    KEEP_LATEST = 'keep_latest'  # only the newest response is kept, the queue size is 1
+
+
+class _ResponseQueue:
+    """Bounded FIFO of ``(responses, error)`` items shared by one cycle query and one consumer."""
+
+    __slots__ = ('maxsize', 'overflow', 'dropped', '_items', '_closed', '_getter', '_putter', '__weakref__')
+
+    def __init__(self, maxsize: int, overflow: OverflowPolicy):
+        if overflow == OverflowPolicy.KEEP_LATEST:
+            maxsize = 1
+        if maxsize < 1:
+            raise ValueError(f"queue size must be at least 1, got {maxsize}")
+        self.maxsize: int = maxsize
+        self.overflow: OverflowPolicy = overflow
+        self.dropped: int = 0
+        self._items: Deque[_Item] = deque()
+        self._closed: bool = False
+        self._getter: Optional[asyncio.Future] = None
+        self._putter: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @staticmethod
+    def _wake(waiter: Optional[asyncio.Future]):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def put(self, item: _Item):
+        while len(self._items) >= self.maxsize and not self._closed:
+            if self.overflow != OverflowPolicy.BLOCK:
+                self._items.popleft()
+                self.dropped += 1
+                continue
+            self._putter = asyncio.get_running_loop().create_future()
+            try:
+                await self._putter
+            finally:
+                self._putter = None
+        if self._closed:
+            return
+        self._items.append(item)
+        self._wake(self._getter)
+
+    async def get(self) -> Optional[_Item]:
+        """Return the next item, None when the queue is closed and empty."""
+        while not self._items:
+            if self._closed:
+                return None
+            self._getter = asyncio.get_running_loop().create_future()
+            try:
+                await self._getter
+            finally:
+                self._getter = None
+        item = self._items.popleft()
+        self._wake(self._putter)
+        return item
+
+    def close(self):
+        """No more items will be added, waiting consumer and blocked producer are released."""
+        self._closed = True
+        self._wake(self._getter)
+        self._wake(self._putter)
+
+
+class ResponseSubscription:
+    """
+    Asynchronous iterator over the responses of one cycle query, with its own bounded queue.
+
+    Objects of this class are created by :meth:`.cycle_query.BaseCycleQuery.iterate`, do not create them directly.
+    The iteration ends when the cycle query is stopped (after the queued responses are delivered) and raises
+    `CommunicationRuntimeError` when the query finished with an error. A subscription no longer used should be
+    closed, it is also closed automatically when garbage collected.
+
+    :param queue: queue filled by the cycle query
+    :param is_stopped: function telling if the cycle query is stopped
+    :param detach: function removing the queue from the cycle query
+    """
+
+    def __init__(self, queue: _ResponseQueue, is_stopped: Callable[[], bool],
+                 detach: Callable[[_ResponseQueue], None]):
+        self._queue: _ResponseQueue = queue
+        self._is_stopped: Callable[[], bool] = is_stopped
+        self._last_changes: Optional[ChangeSet] = None
+        self._finalizer = weakref.finalize(self, ResponseSubscription._release, queue, detach)
+
+    @staticmethod
+    def _release(queue: _ResponseQueue, detach: Callable[[_ResponseQueue], None]):
+        queue.close()
+        detach(queue)
+
+    @property
+    def last_changes(self) -> Optional[ChangeSet]:
+        """Change set of the response returned last by this subscription, see :class:`.change_set.ChangeSet`."""
+        return self._last_changes
+
+    @property
+    def dropped(self) -> int:
+        """Number of responses thrown away because this consumer was too slow."""
+        return self._queue.dropped
+
+    @property
+    def pending(self) -> int:
+        """Number of responses waiting in the queue."""
+        return len(self._queue)
+
+    @property
+    def overflow(self) -> OverflowPolicy:
+        return self._queue.overflow
+
+    @property
+    def closed(self) -> bool:
+        return self._queue.closed
+
+    def close(self):
+        """Stop receiving responses, the cycle query itself is not stopped."""
+        self._finalizer()
+
+    def __aiter__(self) -> 'ResponseSubscription':
+        return self
+
+    async def __anext__(self) -> List[ValueResponse]:
+        if not len(self._queue) and self._is_stopped():
+            self.close()
+        item = await self._queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        response, error, self._last_changes = item
+        if error is not None:
+            self.close()
+            raise error
+        return response
+
+    async def get(self) -> List[ValueResponse]:
+        """
+        Wait for the next response of this consumer.
+
+        :raise CommunicationRuntimeError: when the cycle query finished with an error or was stopped
+        :return: next response
+        """
+        try:
+            return await self.__anext__()
+        except StopAsyncIteration:
+            raise CommunicationRuntimeError(message="Query was stopped") from None
+
+    def __enter__(self) -> 'ResponseSubscription':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,492 @@
+"""Reference-counted sharing of subscriptions inside one process.
+
+Several components of one process (GUI panels, daemon modules) often
+subscribe to the very same address. Without sharing, every one of them
+creates its own :class:`ConditionalCycleQuery` and its own server-side
+subscription. :class:`SubscriptionHub` keeps one underlying query per
+distinct subscription and hands out lightweight :class:`SharedCycleQuery`
+handles instead.
+
+* Subscriptions with the same address, tolerance, parameters and error
+  handling share a single underlying cycle query.
+* The underlying query runs at the fastest ``delay`` requested by its
+  consumers; slower consumers are downsampled, each one receiving the
+  most recent response not more often than its own ``delay``.
+* The underlying query is torn down when the last consumer stops.
+
+With ``max_batch_size > 1`` the hub additionally packs distinct
+subscriptions with compatible ``delay`` and tolerance into shared
+multi-request queries (up to ``max_batch_size`` addresses each), so 1000
+subscriptions no longer mean 1000 concurrent long-polls. Every consumer
+still receives only the response of its own address, and only when it
+changed (status or ``Value.ts``). Batches are re-packed as subscriptions
+come and go; re-packing is deferred to the next loop iteration so a burst
+of subscriptions costs one rebuild.
+
+Handles are full :class:`BaseCycleQuery` objects, so ``get_response``,
+callbacks, ``start`` / ``stop`` work exactly as for a private query.
+"""
+
+import asyncio
+import logging
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+from obcom.comunication.base_client_request_solver import BaseClientRequestSolver
+from obcom.comunication.change_set import _signature
+from obcom.comunication.comunication_error import CommunicationRuntimeError
+from obcom.comunication.cycle_query import BaseCycleQuery, ConditionalCycleQuery
+from obcom.comunication.error_policy import ErrorPolicy
+from obcom.comunication.message_serializer import MessageSerializer
+from obcom.comunication.response_queue import OverflowPolicy, ResponseSubscription
+from obcom.data_colection.address import Address
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+logger = logging.getLogger(__name__.rsplit('.', maxsplit=1)[-1])
+
+
+class _SharedEntry:
+    """One distinct subscription, its consumers and the batch serving it."""
+
+    __slots__ = ('key', 'address', 'time_of_data_tolerance', 'parameters', 'max_missed_msg', 'request_timeout',
+                 'error_policy', 'consumers', 'request', 'batch', 'current')
+
+    def __init__(self, key: tuple, address: Address, time_of_data_tolerance: Optional[float], parameters: dict,
+                 max_missed_msg: Optional[int], request_timeout: Optional[float],
+                 error_policy: Optional[ErrorPolicy]) -> None:
+        self.key = key
+        self.address = address
+        self.time_of_data_tolerance = time_of_data_tolerance
+        self.parameters = parameters
+        self.max_missed_msg = max_missed_msg
+        self.request_timeout = request_timeout
+        self.error_policy = error_policy
+        self.consumers: Set['SharedCycleQuery'] = set()
+        # Request object reused by every underlying query serving this entry, so the conditional state
+        # (``time_of_known_change``) survives re-packing into another batch.
+        self.request: Optional[ValueRequest] = None
+        self.batch: Optional['_Batch'] = None
+        self.current: Optional[ValueResponse] = None  # last response routed to the consumers
+
+    def fastest_delay(self) -> float:
+        return min(c.get_delay() for c in self.consumers)
+
+    def batch_key(self) -> tuple:
+        """Entries with equal batch keys may be served by one multi-request query."""
+        delay = self.fastest_delay()
+        tolerance = self.time_of_data_tolerance if self.time_of_data_tolerance is not None else float(delay)
+        return delay, tolerance, self.max_missed_msg, self.request_timeout, self.error_policy
+
+
+class _Batch:
+    """Group of entries served by one underlying query."""
+
+    __slots__ = ('key', 'entries', 'members', 'source', 'watcher')
+
+    def __init__(self, key: tuple) -> None:
+        self.key = key
+        self.entries: List[_SharedEntry] = []
+        # entries in the order of requests of the running ``source``
+        self.members: Tuple[_SharedEntry, ...] = ()
+        self.source: Optional[ConditionalCycleQuery] = None
+        self.watcher: Optional[asyncio.Task] = None
+
+
+class SharedCycleQuery(BaseCycleQuery):
+    """
+    Consumer handle on a subscription shared through :class:`SubscriptionHub`. It does not talk to the server
+    itself, it waits for responses of the underlying query and republishes them not more often than its own `delay`
+    (the most recent response wins).
+
+    Objects of this class are created by :meth:`SubscriptionHub.subscribe`, do not create them directly.
+
+    :param hub: hub owning the underlying query
+    :param entry: shared subscription in the hub
+    :param request: request describing the subscription (used for logs only)
+    :param delay: minimum interval between responses delivered to this consumer
+    :param loop: async loop
+    :param query_name: cycle query name used to distinguish queries in logs
+    """
+
+    def __init__(self, hub: 'SubscriptionHub', entry: _SharedEntry, request: ValueRequest,
+                 delay: float or None = None, loop=None, query_name: str = 'Default shared query', **kwargs):
+        super().__init__(crs=hub.crs, list_request=[request], delay=delay, loop=loop, query_name=query_name,
+                         **kwargs)
+        self._hub: 'SubscriptionHub' = hub
+        self._entry: _SharedEntry = entry
+        self._feed_event: asyncio.Event = asyncio.Event()
+        self._pending_response: List[ValueResponse] = []
+        self._pending_error: CommunicationRuntimeError or None = None
+        self._last_emit: float = -math.inf
+
+    def _feed(self, response: List[ValueResponse], error: CommunicationRuntimeError or None = None):
+        """Called by the hub for every response (or final error) of the underlying query."""
+        self._pending_response = response
+        self._pending_error = error
+        self._feed_event.set()
+
+    def _run(self):
+        self._hub._attach(self)
+        super()._run()
+
+    async def _send_message(self):
+        self._errors = None
+        while True:
+            await self._feed_event.wait()
+            await self._wait_resumed()
+            # downsample: deliver the newest response not more often than own delay
+            wait_range = self._last_emit + self._delay - self._loop.time()
+            if wait_range > 0 and self._pending_error is None:
+                logger.debug(f"{self}: Wait {wait_range} before delivering next response")
+                await asyncio.sleep(wait_range)
+            self._feed_event.clear()
+            self._last_emit = self._loop.time()
+            self._last_response = self._pending_response
+            self._errors = self._pending_error
+            await self._publish()
+            if self._errors:
+                self._hub._detach(self)
+                break
+            await asyncio.sleep(0)
+            self._event.clear()
+
+    def _driver_unsupported(self) -> Optional[str]:
+        return "it is fed by the subscription hub"
+
+    def set_delay(self, delay: float):
+        """Change the delay of this consumer, the underlying query follows the fastest consumer."""
+        super().set_delay(delay)
+        if self in self._entry.consumers:
+            self._hub._rekey(self._entry)
+            self._hub._schedule_flush()
+
+    def stop(self):
+        """Method stop this consumer. The underlying query is stopped when it was the last consumer."""
+        super().stop()
+        self._hub._detach(self)
+
+    async def stop_and_wait(self):
+        await super().stop_and_wait()
+        await self._hub._wait_retired()
+
+
+class SubscriptionHub:
+    """
+    Registry of shared subscriptions for one request solver. Use :meth:`subscribe` instead of creating
+    :class:`ConditionalCycleQuery` directly when several consumers in the process may subscribe to the same address.
+
+    :param crs: request solver used by the underlying queries
+    :param max_batch_size: maximum number of distinct subscriptions packed into one underlying query. Default 1 means
+        that only subscriptions to the same address are shared
+    """
+
+    DEFAULT_MAX_BATCH_SIZE = 1
+
+    def __init__(self, crs: BaseClientRequestSolver, max_batch_size: int = None):
+        if max_batch_size is None:
+            max_batch_size = self.DEFAULT_MAX_BATCH_SIZE
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self._crs: BaseClientRequestSolver = crs
+        self._max_batch_size: int = max_batch_size
+        self._entries: Dict[tuple, _SharedEntry] = {}
+        self._buckets: Dict[tuple, List[_Batch]] = {}
+        self._dirty: Set[_Batch] = set()
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._retired: List[Tuple[ConditionalCycleQuery, Optional[asyncio.Task]]] = []
+        self._loop = None
+
+    @property
+    def crs(self) -> BaseClientRequestSolver:
+        return self._crs
+
+    @property
+    def max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    @max_batch_size.setter
+    def max_batch_size(self, value: int):
+        """New size is respected when subscriptions are packed from now on, running batches are not split."""
+        if value < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {value}")
+        self._max_batch_size = value
+
+    @staticmethod
+    def make_key(address: str or Address, time_of_data_tolerance: float or None = None,
+                 parameters_dict: dict = None, max_missed_msg: int = None, request_timeout: float = None,
+                 error_policy: Optional[ErrorPolicy] = None) -> tuple:
+        """
+        Method returns the key under which subscriptions are shared. Two subscriptions share the underlying query when
+        their keys are equal.
+        """
+        if parameters_dict is None:
+            parameters_dict = {}
+        parameters_b = MessageSerializer.pack_b(dict(sorted(parameters_dict.items())))
+        return (str(address), time_of_data_tolerance, parameters_b, max_missed_msg, request_timeout, error_policy)
+
+    def subscribe(self, address: str or Address, time_of_data_tolerance: float or None = None,
+                  delay: float or None = None, parameters_dict: dict = None, name: str = 'Default_subscription',
+                  max_missed_msg: int = None, request_timeout: float = None,
+                  error_policy: Optional[ErrorPolicy] = None, user=None) -> SharedCycleQuery:
+        """
+        This method returns a new consumer handle for the given subscription. The handle is not started, call
+        `start()` on it (the underlying query is created or re-packed at this moment).
+
+        :param address: address
+        :param time_of_data_tolerance: how old data can be returned. If not set the fastest consumer `delay` is used
+        :param delay: minimum interval between responses delivered to this consumer
+        :param parameters_dict: dict of parameters to send witch request
+        :param name: name of the consumer
+        :param max_missed_msg: more information in :class:`.cycle_query.ConditionalCycleQuery`
+        :param request_timeout: more information in :class:`.cycle_query.ConditionalCycleQuery`
+        :param error_policy: per-severity error-handling policy of the underlying query
+        :param user: user sending the underlying requests
+        :return: object `SharedCycleQuery`
+        """
+        if parameters_dict is None:
+            parameters_dict = {}
+        key = self.make_key(address=address, time_of_data_tolerance=time_of_data_tolerance,
+                            parameters_dict=parameters_dict, max_missed_msg=max_missed_msg,
+                            request_timeout=request_timeout, error_policy=error_policy)
+        entry = self._entries.get(key)
+        if entry is None:
+            # registered in the hub only when the first consumer starts
+            entry = _SharedEntry(key=key, address=Address.as_address(address),
+                                 time_of_data_tolerance=time_of_data_tolerance, parameters=dict(parameters_dict),
+                                 max_missed_msg=max_missed_msg, request_timeout=request_timeout,
+                                 error_policy=error_policy)
+        request = ValueRequest(address=entry.address, time_of_data_tolerance=time_of_data_tolerance,
+                               request_data=dict(parameters_dict), user=user)
+        return SharedCycleQuery(hub=self, entry=entry, request=request, delay=delay, query_name=name)
+
+    def consumers_count(self, address: str or Address = None) -> int:
+        """Number of started consumers, for all subscriptions or only for the given address."""
+        return sum(len(e.consumers) for e in self._entries.values()
+                   if address is None or str(e.address) == str(address))
+
+    def sources_count(self) -> int:
+        """Number of running underlying queries."""
+        self._flush()
+        return sum(1 for batches in self._buckets.values() for b in batches if b.source is not None)
+
+    def sources(self) -> List[ConditionalCycleQuery]:
+        """Running underlying queries."""
+        self._flush()
+        return [b.source for batches in self._buckets.values() for b in batches if b.source is not None]
+
+    async def close(self):
+        """Stop all consumers and underlying queries and wait for them."""
+        for entry in list(self._entries.values()):
+            for consumer in list(entry.consumers):
+                await consumer.stop_and_wait()
+        await self._wait_retired()
+
+    # ----- consumers -----
+
+    def _attach(self, consumer: SharedCycleQuery):
+        self._loop = consumer._loop
+        entry = self._entries.get(consumer._entry.key)
+        if entry is None:
+            entry = consumer._entry
+            self._entries[entry.key] = entry
+            entry.request = ValueRequest(address=entry.address, request_data=dict(entry.parameters),
+                                         user=consumer._list_request[0].user)
+        consumer._entry = entry
+        entry.consumers.add(consumer)
+        if entry.current is not None:
+            # a consumer joining a running subscription gets its current value at once, without any request
+            consumer._feed([entry.current])
+        if entry.batch is None:
+            self._place(entry)
+        else:
+            self._rekey(entry)
+        self._schedule_flush()
+
+    def _detach(self, consumer: SharedCycleQuery):
+        entry = consumer._entry
+        if consumer not in entry.consumers:
+            return
+        entry.consumers.discard(consumer)
+        if entry.consumers:
+            self._rekey(entry)
+        else:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+            self._remove_from_batch(entry)
+        self._schedule_flush()
+
+    # ----- packing -----
+
+    def _place(self, entry: _SharedEntry):
+        """Put entry into a batch with free room (the fullest one) or into a new batch."""
+        key = entry.batch_key()
+        entry.request.time_of_data_tolerance = float(key[1])
+        bucket = self._buckets.setdefault(key, [])
+        candidates = [b for b in bucket if len(b.entries) < self._max_batch_size]
+        if candidates:
+            batch = max(candidates, key=lambda b: len(b.entries))
+        else:
+            batch = _Batch(key)
+            bucket.append(batch)
+        batch.entries.append(entry)
+        entry.batch = batch
+        self._dirty.add(batch)
+
+    def _remove_from_batch(self, entry: _SharedEntry):
+        batch = entry.batch
+        if batch is None:
+            return
+        entry.batch = None
+        if entry in batch.entries:
+            batch.entries.remove(entry)
+        self._dirty.add(batch)
+        bucket = self._buckets.get(batch.key, [])
+        if not batch.entries:
+            return
+        # merge with another partially filled batch of the same bucket when both fit into one
+        for other in bucket:
+            if other is not batch and other.entries \
+                    and len(other.entries) + len(batch.entries) <= self._max_batch_size:
+                for e in batch.entries:
+                    e.batch = other
+                other.entries.extend(batch.entries)
+                batch.entries = []
+                self._dirty.add(other)
+                return
+
+    def _rekey(self, entry: _SharedEntry):
+        """Follow a change of the fastest consumer delay of the entry."""
+        old = entry.batch
+        new_key = entry.batch_key()
+        if old is None or old.key == new_key:
+            return
+        bucket = self._buckets.get(new_key, [])
+        if len(old.entries) == 1 and not any(len(b.entries) < self._max_batch_size for b in bucket):
+            # alone in its batch: retune the running query in place (a waiting request is re-sent)
+            self._buckets[old.key].remove(old)
+            if not self._buckets[old.key]:
+                del self._buckets[old.key]
+            old.key = new_key
+            self._buckets.setdefault(new_key, []).append(old)
+            entry.request.time_of_data_tolerance = float(new_key[1])
+            if old.source is not None:
+                old.source.set_delay(new_key[0])
+            return
+        self._remove_from_batch(entry)
+        self._place(entry)
+
+    def _schedule_flush(self):
+        if self._flush_handle is None and self._dirty and self._loop is not None and not self._loop.is_closed():
+            self._flush_handle = self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        """Rebuild the underlying queries of all batches changed since the last flush."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        dirty, self._dirty = self._dirty, set()
+        for batch in dirty:
+            if tuple(batch.entries) == batch.members and batch.source is not None:
+                continue
+            self._retire(batch)
+            if not batch.entries:
+                bucket = self._buckets.get(batch.key)
+                if bucket is not None and batch in bucket:
+                    bucket.remove(batch)
+                    if not bucket:
+                        del self._buckets[batch.key]
+                continue
+            self._start_source(batch)
+
+    def _retire(self, batch: _Batch):
+        source, watcher = batch.source, batch.watcher
+        batch.source = None
+        batch.watcher = None
+        batch.members = ()
+        if watcher is not None and not watcher.done():
+            watcher.cancel()
+        if source is not None:
+            logger.debug(f"{source}: retiring shared query")
+            source.stop()
+            self._retired.append((source, watcher))
+
+    async def _wait_retired(self):
+        self._flush()
+        retired, self._retired = self._retired, []
+        for source, watcher in retired:
+            await source.stop_and_wait()
+            if watcher is not None:
+                try:
+                    await watcher
+                except asyncio.CancelledError:
+                    pass
+
+    def _start_source(self, batch: _Batch):
+        delay, _, max_missed_msg, request_timeout, error_policy = batch.key
+        batch.members = tuple(batch.entries)
+        name = f'Shared {batch.members[0].address}' if len(batch.members) == 1 else 'Shared batch'
+        source = ConditionalCycleQuery(crs=self._crs, list_request=[e.request for e in batch.members], delay=delay,
+                                       loop=self._loop, query_name=name, max_missed_msg=max_missed_msg,
+                                       request_timeout=request_timeout, error_policy=error_policy)
+        batch.source = source
+        source.start()
+        # routing is fast, a blocking queue never loses a response of any address
+        updates = source.iterate(maxsize=1, overflow=OverflowPolicy.BLOCK)
+        batch.watcher = self._loop.create_task(self._watch(batch, source, batch.members, updates))
+
+    @staticmethod
+    def _failed_indexes(responses: List[ValueResponse], size: int) -> List[int]:
+        """Indexes of responses that made the underlying query stop. All of them if it can not be told."""
+        failed = [i for i, r in enumerate(responses)
+                  if not r.status or r.value is None or 'from_cf' not in r.value.tags]
+        if len(responses) != size or not failed:
+            return list(range(size))
+        return failed
+
+    async def _watch(self, batch: _Batch, source: ConditionalCycleQuery, members: Tuple[_SharedEntry, ...],
+                     updates: ResponseSubscription):
+        """Route every response of the underlying query to the consumers of its address."""
+        error = None
+        try:
+            async for result in updates:
+                if len(result) != len(members):
+                    logger.warning(f"{source}: got {len(result)} responses for {len(members)} requests, skipping")
+                    continue
+                for entry, response in zip(members, result):
+                    # a batch update carries every address, feed only the consumers of the changed ones
+                    if entry.current is not None and _signature(entry.current) == _signature(response):
+                        continue
+                    entry.current = response
+                    for consumer in list(entry.consumers):
+                        consumer._feed([response])
+        except CommunicationRuntimeError as e:
+            error = e
+        finally:
+            updates.close()
+        if batch.source is not source:
+            return
+        if error is None:
+            error = CommunicationRuntimeError(message=f"{source}: Query was stopped")
+        batch.source = None
+        batch.watcher = None
+        batch.members = ()
+        last = source._last_response
+        failed = self._failed_indexes(last, len(members))
+        for i in failed:
+            entry = members[i]
+            response = [last[i]] if len(last) == len(members) else []
+            for consumer in list(entry.consumers):
+                consumer._feed(response, error)
+            # consumers detach themselves after delivering the error, drop the entry from packing now
+            if entry.batch is batch:
+                batch.entries.remove(entry)
+                entry.batch = None
+        # remaining subscriptions of the batch are restarted without the failed ones
+        self._dirty.add(batch)
+        self._schedule_flush()
+
+
+__all__ = [
+    'SharedCycleQuery',
+    'SubscriptionHub',
+]
@@ -0,0 +1,164 @@
+"""Bookkeeping of many cycle queries of one client.
+
+A daemon can hold thousands of cycle queries. Finding the running ones by
+scanning ``asyncio.all_tasks()`` costs O(number of tasks) per query, so
+shutdown and health checks become quadratic. :class:`SubscriptionManager`
+keeps the queries indexed by lifecycle state, name and address instead and
+updates the indexes from the state changes reported by every
+:class:`BaseCycleQuery` (see :attr:`BaseCycleQuery.state`).
+
+Queries are held by weak references: a query dropped by its owner also
+disappears from the manager.
+"""
+
+import asyncio
+import logging
+import weakref
+from typing import Dict, List
+
+from obcom.comunication.cycle_query import BaseCycleQuery, CycleQueryState
+
+__all__ = ['SubscriptionManager']
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+class SubscriptionManager:
+    """
+    Registry of cycle queries with O(1) state tracking.
+
+    Queries created by :class:`.base_client_api.BaseClientAPI` are registered automatically, others can be added
+    with :meth:`register`.
+    """
+
+    def __init__(self):
+        self._by_state: Dict[CycleQueryState, weakref.WeakSet] = {s: weakref.WeakSet() for s in CycleQueryState}
+        self._by_name: Dict[str, weakref.WeakSet] = {}
+        self._by_address: Dict[str, weakref.WeakSet] = {}
+        self._all: weakref.WeakSet = weakref.WeakSet()
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def __contains__(self, cq: BaseCycleQuery) -> bool:
+        return cq in self._all
+
+    @staticmethod
+    def _addresses_of(cq: BaseCycleQuery) -> List[str]:
+        return [str(r.address) for r in cq._list_request]
+
+    @staticmethod
+    def _lookup(index: Dict[str, weakref.WeakSet], key: str) -> List[BaseCycleQuery]:
+        found = index.get(key)
+        if not found:
+            index.pop(key, None)
+            return []
+        return list(found)
+
+    def register(self, cq: BaseCycleQuery) -> BaseCycleQuery:
+        """
+        Start tracking a cycle query. Registering the same query twice has no effect.
+
+        :param cq: cycle query
+        :return: the same cycle query
+        """
+        if cq in self._all:
+            return cq
+        self._all.add(cq)
+        self._by_state[cq.state].add(cq)
+        self._by_name.setdefault(cq.get_name(), weakref.WeakSet()).add(cq)
+        for address in self._addresses_of(cq):
+            self._by_address.setdefault(address, weakref.WeakSet()).add(cq)
+        cq.add_state_listener(self._on_state_change)
+        cq.add_requests_listener(self._on_requests_change)
+        return cq
+
+    def unregister(self, cq: BaseCycleQuery):
+        """Stop tracking a cycle query, the query itself is not stopped."""
+        if cq not in self._all:
+            return
+        cq.remove_state_listener(self._on_state_change)
+        cq.remove_requests_listener(self._on_requests_change)
+        self._all.discard(cq)
+        for queries in self._by_state.values():
+            queries.discard(cq)
+        for index, keys in ((self._by_name, [cq.get_name()]), (self._by_address, self._addresses_of(cq))):
+            for key in keys:
+                queries = index.get(key)
+                if queries is not None:
+                    queries.discard(cq)
+                    if not queries:
+                        del index[key]
+
+    def _on_state_change(self, cq: BaseCycleQuery, old: CycleQueryState, new: CycleQueryState):
+        self._by_state[old].discard(cq)
+        self._by_state[new].add(cq)
+
+    def _on_requests_change(self, cq: BaseCycleQuery, added: List[str], removed: List[str]):
+        for address in added:
+            self._by_address.setdefault(address, weakref.WeakSet()).add(cq)
+        for address in removed:
+            queries = self._by_address.get(address)
+            if queries is not None:
+                queries.discard(cq)
+                if not queries:
+                    del self._by_address[address]
+
+    def by_name(self, name: str) -> List[BaseCycleQuery]:
+        """Return the tracked cycle queries with given name."""
+        return self._lookup(self._by_name, name)
+
+    def by_address(self, address) -> List[BaseCycleQuery]:
+        """Return the tracked cycle queries requesting given address."""
+        return self._lookup(self._by_address, str(address))
+
+    def by_state(self, state: CycleQueryState) -> List[BaseCycleQuery]:
+        """Return the tracked cycle queries in given state."""
+        return list(self._by_state[state])
+
+    def count(self, state: CycleQueryState or None = None) -> int:
+        """Return number of tracked cycle queries, all or in given state."""
+        if state is None:
+            return len(self._all)
+        return len(self._by_state[state])
+
+    def health(self) -> Dict[str, int]:
+        """Return number of tracked cycle queries per state, e.g. ``{'running': 998, 'stopped': 2, ...}``."""
+        return {state.value: len(queries) for state, queries in self._by_state.items()}
+
+    def pause_all(self, name: str = None):
+        """Pause every tracked cycle query, or the ones with given name, see `BaseCycleQuery.pause`."""
+        for cq in (self.by_name(name) if name is not None else list(self._all)):
+            cq.pause()
+
+    def resume_all(self, name: str = None):
+        """Resume every paused cycle query, or the ones with given name."""
+        for cq in (self.by_name(name) if name is not None else list(self._all)):
+            cq.resume()
+
+    def start_all(self):
+        """Start every tracked cycle query which is stopped."""
+        for cq in list(self._by_state[CycleQueryState.STOPPED]):
+            cq.start()
+
+    def stop_all(self):
+        """Request stop of every tracked cycle query, see :meth:`stop_all_and_wait`."""
+        for cq in self._active():
+            cq.stop()
+
+    async def stop_all_and_wait(self):
+        """Stop every tracked cycle query and wait until all of them are finished."""
+        queries = self._active()
+        for cq in queries:
+            cq.stop()
+        results = await asyncio.gather(*(cq.stop_and_wait() for cq in queries), return_exceptions=True)
+        for cq, result in zip(queries, results):
+            if isinstance(result, Exception):
+                logger.warning(f"{cq}: stop raised {type(result).__name__}: {result}")
+
+    def _active(self) -> List[BaseCycleQuery]:
+        active: List[BaseCycleQuery] = []
+        for state in (CycleQueryState.STARTING, CycleQueryState.RUNNING, CycleQueryState.PAUSED,
+                      CycleQueryState.STOPPING):
+            active += list(self._by_state[state])
+        return active
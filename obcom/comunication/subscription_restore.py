@@ -0,0 +1,239 @@
+"""Bulk restore of subscriptions after the connection to the router comes back.
+
+Without it every ``ConditionalCycleQuery`` finds out about a lost
+connection on its own: its long-poll waits until ``request_timeout``, the
+``max_missed_msg`` counter climbs and the request is sent again, on the
+schedule of that query. After a router restart the subscriptions come back
+one by one, within minutes for long horizons.
+
+:class:`SubscriptionRestorer` follows the connection events of the request
+solver (:meth:`.base_client_request_solver.BaseClientRequestSolver.add_connection_listener`):
+
+* when the connection is lost, the long-polls of the restored queries are
+  abandoned and their next requests are held by the restorer, nothing is sent
+  and no timeout is counted,
+* when it comes back, the held requests of all queries are packed into a few
+  multi-requests (up to ``max_batch_size`` requests each), still carrying
+  the ``time_of_known_change`` of every subscription, with a short lease
+  (``restore_timeout``). Values changed during the outage are delivered from
+  these responses, then every query continues with its own long-poll.
+
+::
+
+    restorer = SubscriptionRestorer(crs=crs, queries=lambda: manager.by_state(CycleQueryState.RUNNING))
+
+Only ``ConditionalCycleQuery`` objects are restored, other queries are
+skipped. A streaming query closes its stream when the connection is lost
+and hands its subscribed requests to the restore, then opens the stream
+again from the restored values.
+"""
+
+import asyncio
+import copy
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from obcom.comunication.base_client_request_solver import BaseClientRequestSolver, ConnectionState
+from obcom.comunication.comunication_error import CommunicationRuntimeError, CommunicationTimeoutError
+from obcom.comunication.cycle_query import BaseCycleQuery
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+__all__ = ['SubscriptionRestorer']
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+class _Round:
+    """Requests held by the restorer until the connection is back."""
+
+    __slots__ = ('expected', 'held', 'flush')
+
+    def __init__(self):
+        self.expected: Set[BaseCycleQuery] = set()
+        self.held: Dict[BaseCycleQuery, Tuple[List[ValueRequest], asyncio.Future]] = {}
+        self.flush: Optional[asyncio.TimerHandle] = None
+
+
+class SubscriptionRestorer:
+    """
+    Restore of the subscriptions of one request solver, see the module description.
+
+    :param crs: request solver reporting its connection state
+    :param queries: function returning the cycle queries to restore, e.g. the running queries of a client
+    :param max_batch_size: maximum number of requests in one restore request. Requests of one query are never split,
+        a query with more requests is restored alone
+    :param restore_timeout: lease of the restore requests. A batch without a change is answered after it expires
+    :param collect_time: maximum time to wait for the queries to hand over their requests after the reconnect
+    """
+
+    DEFAULT_MAX_BATCH_SIZE = 100
+    DEFAULT_RESTORE_TIMEOUT = 0.5
+    DEFAULT_COLLECT_TIME = 0.05
+
+    def __init__(self, crs: BaseClientRequestSolver, queries: Callable[[], Iterable[BaseCycleQuery]],
+                 max_batch_size: int = None, restore_timeout: float = None, collect_time: float = None):
+        if max_batch_size is None:
+            max_batch_size = self.DEFAULT_MAX_BATCH_SIZE
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self._crs: BaseClientRequestSolver = crs
+        self._queries: Callable[[], Iterable[BaseCycleQuery]] = queries
+        self._max_batch_size: int = max_batch_size
+        self._restore_timeout: float = self.DEFAULT_RESTORE_TIMEOUT if restore_timeout is None else restore_timeout
+        self._collect_time: float = self.DEFAULT_COLLECT_TIME if collect_time is None else collect_time
+        self._round: Optional[_Round] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._restores: int = 0
+        self._restore_requests: int = 0
+        crs.add_connection_listener(self._on_connection)
+
+    @property
+    def restores(self) -> int:
+        """Number of finished restores."""
+        return self._restores
+
+    @property
+    def restore_requests(self) -> int:
+        """Number of requests sent by all restores, one per batch."""
+        return self._restore_requests
+
+    def is_holding(self) -> bool:
+        """Return True if requests of the queries are held until the connection is back."""
+        return self._round is not None
+
+    def close(self):
+        """Stop following the connection events, the held requests are sent as usual."""
+        self._crs.remove_connection_listener(self._on_connection)
+        round_, self._round = self._round, None
+        if round_ is not None:
+            self._release(round_)
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _on_connection(self, crs: BaseClientRequestSolver, old: ConnectionState, new: ConnectionState):
+        if new == ConnectionState.DISCONNECTED:
+            self._hold()
+        elif new == ConnectionState.CONNECTED:
+            # also a reconnect which was not preceded by a reported disconnect
+            self._hold()
+            self._schedule_flush(self._round)
+
+    def _hold(self):
+        """Abandon the long-polls of the queries, their next requests come to `_submit`."""
+        if self._round is None:
+            self._round = _Round()
+        round_ = self._round
+        for cq in list(self._queries()):
+            if cq in round_.expected or cq in round_.held:
+                continue
+            if cq._restore_through(self):
+                if not cq.is_paused():
+                    round_.expected.add(cq)
+        logger.debug(f"holding requests of {len(round_.expected)} queries until the connection is back")
+
+    def _schedule_flush(self, round_: _Round):
+        if round_.flush is None:
+            round_.flush = asyncio.get_running_loop().call_later(self._collect_time, self._flush, round_)
+        self._flush_if_complete(round_)
+
+    def _flush_if_complete(self, round_: _Round):
+        if self._crs.connection_state != ConnectionState.CONNECTED or round_.flush is None:
+            return
+        if all(cq in round_.held or cq.is_stopped() or cq.is_paused() for cq in round_.expected):
+            self._flush(round_)
+
+    def _flush(self, round_: _Round):
+        if self._round is not round_:
+            return
+        self._round = None
+        round_.flush.cancel()
+        held = [(cq, requests, future) for cq, (requests, future) in round_.held.items() if not future.done()]
+        if not held:
+            return
+        task = asyncio.get_running_loop().create_task(self._restore(held))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _release(round_: _Round):
+        if round_.flush is not None:
+            round_.flush.cancel()
+        for _, future in round_.held.values():
+            if not future.done():
+                future.set_result(None)
+
+    async def _submit(self, cq: BaseCycleQuery, requests: List[ValueRequest]) -> Optional[List[ValueResponse]]:
+        """
+        Called by a query with its next requests. Wait for the restore and return the responses of the requests, or
+        None if the query has to send them itself (no restore in progress, no change of its values).
+        """
+        round_ = self._round
+        if round_ is None:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        round_.held[cq] = (requests, future)
+        self._flush_if_complete(round_)
+        return await future
+
+    def _batches(self, held: List[Tuple[BaseCycleQuery, List[ValueRequest], asyncio.Future]]):
+        batch, size = [], 0
+        for item in held:
+            if batch and size + len(item[1]) > self._max_batch_size:
+                yield batch
+                batch, size = [], 0
+            batch.append(item)
+            size += len(item[1])
+        if batch:
+            yield batch
+
+    async def _restore(self, held: List[Tuple[BaseCycleQuery, List[ValueRequest], asyncio.Future]]):
+        start = time.monotonic()
+        batches = list(self._batches(held))
+        try:
+            await asyncio.gather(*(self._restore_batch(batch) for batch in batches))
+        finally:
+            for _, _, future in held:
+                if not future.done():
+                    future.set_result(None)
+        self._restores += 1
+        logger.info(f"restored {len(held)} queries in {len(batches)} requests, {time.monotonic() - start:.3f} s")
+
+    async def _restore_batch(self, batch: List[Tuple[BaseCycleQuery, List[ValueRequest], asyncio.Future]]):
+        requests = []
+        for _, query_requests, _ in batch:
+            for r in query_requests:
+                r = copy.copy(r)
+                r.request_timeout = self._restore_timeout
+                requests.append(r)
+        self._restore_requests += 1
+        try:
+            result = await self._crs.send_request(requests=requests, timeout=time.time() + self._restore_timeout,
+                                                  no_wait=False)
+        except (CommunicationTimeoutError, CommunicationRuntimeError) as e:
+            logger.warning(f"restore of {len(batch)} queries failed, they send their requests: {e}")
+            return
+        if result is None or len(result) != len(requests):
+            logger.warning(f"restore of {len(batch)} queries got a wrong number of responses, they send their requests")
+            return
+        i = 0
+        for _, query_requests, future in batch:
+            responses = result[i:i + len(query_requests)]
+            i += len(query_requests)
+            if not future.done():
+                future.set_result(responses if self._changed(query_requests, responses) else None)
+
+    @staticmethod
+    def _changed(requests: List[ValueRequest], responses: List[ValueResponse]) -> bool:
+        """
+        Return True if the responses carry a value of every request and one of them is newer than known. Otherwise
+        (nothing changed, expired lease, error) the query sends its requests itself and handles the outcome as usual.
+        """
+        changed = False
+        for request, response in zip(requests, responses):
+            if not response.status or response.value is None:
+                return False
+            known = request.request_data.get('time_of_known_change')
+            if known is None or response.value.ts > known:
+                changed = True
+        return changed
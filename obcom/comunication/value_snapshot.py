@@ -0,0 +1,223 @@
+"""On-disk snapshot of the last known values for a warm start.
+
+After a restart a client knows nothing until the first response of each
+address comes back, and its first subscriptions transfer every value in
+full. :class:`ValueSnapshot` keeps the last ``Value`` (its ``ts`` is the
+``time_of_known_change`` of a conditional subscription) of every recorded
+address in a sqlite file:
+
+* recording (:meth:`ValueSnapshot.put`, or :meth:`ValueSnapshot.track` of
+  a cycle query) only updates memory, the changed values are written every
+  ``flush_interval`` seconds in a worker thread, off the event loop,
+* the file is read lazily, in one query at the first :meth:`ValueSnapshot.get`,
+* values read from the snapshot are marked with the ``from_snapshot`` tag,
+  they may be stale.
+
+::
+
+    snapshot = ValueSnapshot('values.sqlite')
+    cq = ConditionalCycleQuery(crs=crs, list_request=[request],
+                               resume_from=[snapshot.get(request.address)])
+    snapshot.track(cq)
+    ...
+    await snapshot.close()
+
+A ``ConditionalCycleQuery`` resumed from the snapshot gets only values
+changed since, see :meth:`.cycle_query.ConditionalCycleQuery.set_resume_point`.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from obcom.comunication.cycle_query import BaseCycleQuery
+from obcom.comunication.message_serializer import MessageSerializer
+from obcom.data_colection.address import Address
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueResponse
+
+__all__ = ['ValueSnapshot']
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+_Key = Tuple[str, bytes]
+
+
+class ValueSnapshot:
+    """
+    Last known values of addresses, kept in a sqlite file.
+
+    Values are stored per address and request parameters (`parameters_dict` of a subscription), a value read with
+    other parameters is a different one.
+
+    :param path: path of the sqlite file, created if it does not exist
+    :param flush_interval: seconds between two writes of the changed values to the file
+    """
+
+    TAG = 'from_snapshot'
+    DEFAULT_FLUSH_INTERVAL = 5.0
+
+    def __init__(self, path: str, flush_interval: float = None):
+        if flush_interval is None:
+            flush_interval = self.DEFAULT_FLUSH_INTERVAL
+        if flush_interval <= 0:
+            raise ValueError(f"flush_interval must be positive, got {flush_interval}")
+        self._path: str = path
+        self._flush_interval: float = flush_interval
+        self._values: Optional[Dict[_Key, Value]] = None  # None - not loaded yet
+        self._dirty: Set[_Key] = set()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._writes: int = 0
+        self._closed: bool = False
+        self._loop = None
+
+    @staticmethod
+    def _key(address: str or Address, parameters: dict = None) -> _Key:
+        return str(address), MessageSerializer.pack_b(dict(sorted((parameters or {}).items())))
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            # written by a worker thread, one at a time
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS last_value (address TEXT NOT NULL, parameters BLOB NOT NULL, '
+                             'time_of_known_change REAL NOT NULL, value BLOB NOT NULL, '
+                             'PRIMARY KEY (address, parameters))')
+        return self._db
+
+    def _load(self) -> Dict[_Key, Value]:
+        if self._values is None:
+            values = {}
+            with self._db_lock:
+                rows = self._connect().execute('SELECT address, parameters, value FROM last_value').fetchall()
+            for address, parameters, value_b in rows:
+                try:
+                    values[(address, parameters)] = Value(**MessageSerializer.unpack_b(value_b))
+                except Exception as e:
+                    logger.warning(f"can not read the snapshot of {address}: {type(e).__name__}: {e}")
+            logger.debug(f"loaded {len(values)} values from {self._path}")
+            self._values = values
+        return self._values
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    @property
+    def writes(self) -> int:
+        """Number of writes of changed values to the file."""
+        return self._writes
+
+    def get(self, address: str or Address, parameters: dict = None) -> Optional[ValueResponse]:
+        """
+        Return the last known value of the address as a response, marked with the ``from_snapshot`` tag.
+
+        :param address: address
+        :param parameters: request parameters of the value
+        :return: response or None if the address is not in the snapshot
+        """
+        value = self._load().get(self._key(address, parameters))
+        if value is None:
+            return None
+        tags = dict(value.tags)
+        tags[self.TAG] = True
+        return ValueResponse(address=str(address), value=Value(v=value.v, ts=value.ts, value_type=value.type,
+                                                               tags=tags),
+                             status=True)
+
+    def put(self, response: ValueResponse, parameters: dict = None):
+        """
+        Record a value, it is written to the file with the next flush. Responses without a value are ignored.
+
+        :param response: response
+        :param parameters: request parameters of the value
+        """
+        value = response.value
+        if not response.status or value is None or value.tags.get(self.TAG):
+            return
+        key = self._key(response.address, parameters)
+        values = self._load()
+        known = values.get(key)
+        if known is not None and known.ts >= value.ts:
+            return
+        values[key] = value
+        self._dirty.add(key)
+        self._schedule_flush()
+
+    def track(self, cq: BaseCycleQuery, parameters: dict = None):
+        """
+        Record every response delivered by the cycle query.
+
+        :param cq: cycle query
+        :param parameters: request parameters of its requests
+        """
+        self._loop = cq._loop
+        parameters = dict(parameters or {})  # the query adds its conditional state to the request data
+        cq.add_callback_method(lambda responses: self._put_all(responses, parameters))
+
+    def _put_all(self, responses: List[ValueResponse], parameters: Optional[dict]):
+        for r in responses:
+            self.put(r, parameters)
+
+    def _schedule_flush(self):
+        if self._closed or self._flush_handle is not None:
+            return
+        if self._flush_task is not None and not self._flush_task.done():
+            return  # scheduled again when the running flush is done
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # recorded by a callback run in an executor thread
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._schedule_flush)
+            return
+        self._loop = loop
+        self._flush_handle = loop.call_later(self._flush_interval, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+        self._flush_task.add_done_callback(lambda task: self._schedule_flush() if self._dirty else None)
+
+    def _take_dirty(self) -> list:
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        for key in dirty:
+            value = self._values[key]
+            rows.append((key[0], key[1], value.ts, MessageSerializer.pack_b(
+                {'v': value.v, 'ts': value.ts, 'value_type': value.type, 'tags': value.tags})))
+        return rows
+
+    def _write(self, rows: list):
+        with self._db_lock:
+            db = self._connect()
+            with db:
+                db.executemany('INSERT OR REPLACE INTO last_value VALUES (?, ?, ?, ?)', rows)
+        self._writes += 1
+
+    async def flush(self):
+        """Write the changed values to the file now."""
+        if not self._dirty:
+            return
+        rows = self._take_dirty()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+        except Exception as e:
+            logger.error(f"can not write the snapshot to {self._path}: {type(e).__name__}: {e}")
+
+    async def close(self):
+        """Write the changed values and close the file."""
+        self._closed = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
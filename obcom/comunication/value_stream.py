@@ -0,0 +1,63 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import List
+
+from obcom.data_colection.value_call import ValueResponse
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+class BaseValueStream(ABC):
+    """
+    Client end of a server-pushed subscription stream, opened by
+    :meth:`.base_client_request_solver.BaseClientRequestSolver.open_stream`. One subscribe request opens the stream on
+    a dedicated socket and the server pushes a new list of `ValueResponse` (one per subscribed request) every time a
+    value changes, instead of the client sending a new request after every change.
+
+    Flow control: the server may push only as many updates as the client granted credits, every received update
+    consumes one credit. The stream is opened with an initial number of credits and the client tops them up with
+    :meth:`grant`.
+
+    Lease: the server drops the stream when it was not renewed for `lease` seconds. The client renews it in the
+    background with :meth:`renew`, which is a lightweight message that does not carry the subscribed requests.
+    """
+
+    @property
+    @abstractmethod
+    def lease(self) -> float:
+        """Lease time in seconds granted by the server."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def receive(self) -> List[ValueResponse]:
+        """
+        Wait for the next pushed update.
+
+        :raise CommunicationRuntimeError: when the stream was closed (by the client or the server)
+        :raise CommunicationTimeoutError: when the connection to the router was lost
+        :return: list of responses, one per subscribed request
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def grant(self, credits: int) -> None:
+        """
+        Allow the server to push `credits` more updates.
+
+        :param credits: number of additional updates
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def renew(self) -> None:
+        """
+        Renew the lease of the stream.
+
+        :raise CommunicationTimeoutError: when the server did not confirm the renewal
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Close the stream and release the server-side subscription."""
+        raise NotImplementedError
@@ -2,7 +2,7 @@ import copy
 import logging
 import time
 from dataclasses import dataclass, fields, field
-from typing import ClassVar
+from typing import ClassVar, Optional
 
 from obcom.comunication.message_serializer import MessageSerializer
 from obcom.data_colection.address import Address
@@ -146,6 +146,69 @@ class ValueRequest(ValueExchange):
     def copy(self):
         return copy.deepcopy(self)
 
+    def to_dict(self) -> dict:
+        # requests built by ValueRequestTemplate carry their static fields already converted
+        encoded = self.__dict__.get('_encoded_static')
+        if encoded is not None:
+            signature, static_dict = encoded
+            if signature == ValueRequestTemplate.signature_of(self):
+                d = dict(static_dict)
+                d['time_of_data'] = self.time_of_data
+                d['request_timeout'] = self.request_timeout
+                d['request_data'] = self.request_data
+                return d
+        return super().to_dict()
+
+
+class ValueRequestTemplate:
+    """
+    Immutable base of a request which is sent many times with only the per-send fields changed (cycle queries).
+
+    The static fields (address, user, type, tolerance, cycle flag) are converted to their dictionary form once.
+    :meth:`build` returns a cheap shallow copy of the source request sharing the address and user objects and carrying
+    the pre-encoded static fields, only `time_of_data`, `request_timeout` and `request_data` are set per send. Address
+    and user of the source request are treated as immutable, replacing them (or changing any other static field) makes
+    :meth:`matches` return False, so the owner knows to create a new template.
+
+    :param request: source request
+    """
+    STATIC_KEYS: ClassVar[list] = ['address', 'time_of_data_tolerance', 'request_type', 'user', 'cycle_query']
+
+    __slots__ = ('_source', '_encoded')
+
+    def __init__(self, request: ValueRequest):
+        self._source: ValueRequest = request
+        full = ValueExchange.to_dict(request)
+        static_dict = {k: full[k] for k in self.STATIC_KEYS if k in full}
+        self._encoded: tuple = (self.signature_of(request), static_dict)
+
+    @staticmethod
+    def signature_of(request: ValueRequest) -> tuple:
+        """Cheap fingerprint of the static fields of the request."""
+        return (id(request.address), id(request.user), request.time_of_data_tolerance, request.request_type,
+                request.cycle_query)
+
+    def matches(self, request: ValueRequest) -> bool:
+        """Return True if this template was made from the given request and its static fields did not change."""
+        return self._source is request and self._encoded[0] == self.signature_of(request)
+
+    def build(self, time_of_data: Optional[float] = None, request_data: Optional[dict] = None) -> ValueRequest:
+        """
+        Make a request to send.
+
+        :param time_of_data: time of data, default is taken from the source request
+        :param request_data: request data, must be a new dict (it is not copied), default is a copy of the source
+            request data
+        :return: new request object
+        """
+        source = self._source
+        new_r = object.__new__(ValueRequest)
+        new_r.__dict__.update(source.__dict__)
+        new_r.time_of_data = source.time_of_data if time_of_data is None else time_of_data
+        new_r.request_data = dict(source.request_data) if request_data is None else request_data
+        new_r._encoded_static = self._encoded
+        return new_r
+
 
 @dataclass
 class ValueResponse(ValueExchange):
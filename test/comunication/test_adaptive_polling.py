@@ -0,0 +1,99 @@
+"""Tests of the adaptive polling interval of PeriodicCycleQuery."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.cycle_query import AdaptiveRate, PeriodicCycleQuery
+from obcom.comunication.periodic_scheduler import PeriodicScheduler
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from test.comunication.test_periodic_scheduler import _BatchSolver
+from test.comunication.test_periodic_schedule import _LatencySolver
+
+
+class _ValueSolver(_LatencySolver):
+    """Answers immediately with the current ``value``, records send times."""
+
+    def __init__(self):
+        super().__init__(latency=0.0)
+        self.value = 1
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.sent_loop.append(asyncio.get_running_loop().time())
+        return [ValueResponse(address=r.address, value=Value(v=self.value, ts=0.0), status=True) for r in requests]
+
+
+def _adaptive(crs, delay=0.01, **kwargs):
+    return PeriodicCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=delay,
+                              adaptive=AdaptiveRate(**kwargs))
+
+
+class TestAdaptivePolling(unittest.IsolatedAsyncioTestCase):
+
+    async def test_interval_backs_off_while_unchanged(self):
+        crs = _ValueSolver()
+        cq = _adaptive(crs, max_delay=0.08)
+        cq.start()
+        await asyncio.sleep(0.3)
+        await cq.stop_and_wait()
+        intervals = [b - a for a, b in zip(crs.sent_loop, crs.sent_loop[1:])]
+        # 0.01, 0.02, 0.04, 0.08, 0.08 ... instead of 30 requests with the fixed delay
+        self.assertLess(len(crs.sent_loop), 10)
+        self.assertAlmostEqual(intervals[1], 0.02, delta=0.008)
+        self.assertAlmostEqual(intervals[-1], 0.08, delta=0.01)
+        self.assertEqual(cq.tick_stats.current_period, 0.08)
+
+    async def test_change_snaps_back_to_minimum(self):
+        crs = _ValueSolver()
+        cq = _adaptive(crs, max_delay=0.04)
+        cq.start()
+        await asyncio.sleep(0.15)
+        self.assertEqual(cq.get_current_delay(), 0.04)
+        crs.value = 2
+        await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(cq.get_current_delay(), 0.01)
+        await cq.stop_and_wait()
+
+    async def test_new_timestamp_is_a_change_unless_ignored(self):
+        cq = _adaptive(_ValueSolver(), max_delay=1.0)
+        ignoring = _adaptive(_ValueSolver(), max_delay=1.0, compare_ts=False)
+        for query in (cq, ignoring):
+            for ts in (1.0, 2.0, 3.0):
+                query._adapt([ValueResponse(address='test.subject', value=Value(v=1, ts=ts), status=True)])
+        self.assertEqual(cq.get_current_delay(), 0.01)
+        self.assertEqual(ignoring.get_current_delay(), 0.04)
+
+    async def test_pin_wakes_pending_wait(self):
+        crs = _ValueSolver()
+        cq = _adaptive(crs, max_delay=10.0)
+        cq.start()
+        await asyncio.sleep(0.2)
+        sent = len(crs.sent_loop)
+        # the query is waiting seconds for the next tick now
+        with cq.pinned_rate():
+            await asyncio.sleep(0.055)
+            self.assertGreaterEqual(len(crs.sent_loop) - sent, 4)
+            self.assertEqual(cq.tick_stats.current_period, 0.01)
+        self.assertEqual(cq.get_current_delay(), 0.01)
+        await cq.stop_and_wait()
+
+    async def test_pin_with_custom_delay(self):
+        cq = _adaptive(_ValueSolver(), max_delay=1.0)
+        cq.pin_rate(0.5)
+        cq._adapt([ValueResponse(address='test.subject', value=Value(v=1, ts=0.0), status=True)])
+        self.assertEqual(cq.get_current_delay(), 0.5)
+        with self.assertRaises(ValueError):
+            cq.pin_rate(0)
+
+    async def test_invalid_configuration(self):
+        with self.assertRaises(ValueError):
+            AdaptiveRate(max_delay=1.0, factor=1.0)
+        with self.assertRaises(ValueError):
+            AdaptiveRate(max_delay=1.0, min_delay=2.0)
+        with self.assertRaises(ValueError):
+            PeriodicCycleQuery(crs=_BatchSolver(), list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                               adaptive=AdaptiveRate(max_delay=1.0), scheduler=PeriodicScheduler(crs=_BatchSolver()))
+
+
+if __name__ == '__main__':
+    unittest.main()
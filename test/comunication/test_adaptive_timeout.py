@@ -0,0 +1,123 @@
+"""Tests of the adaptive long-poll horizon and the renewal of expired long-polls of conditional cycle queries."""
+
+import asyncio
+import time
+import unittest
+
+from obcom.comunication.cycle_query import AdaptiveTimeout, ConditionalCycleQuery
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+
+class _ExpiringSolver:
+    """
+    Long-poll answering all values at once if one of them changed, otherwise after the shortest `request_timeout` of
+    the requests with the 4004 expiry (carrying ``kwargs``). Values change by `set`. Records every sent request and its
+    `request_timeout`.
+    """
+
+    def __init__(self, kwargs: dict = None, **values):
+        self.values = {f'test.{k}': (v, 1.0) for k, v in values.items()}
+        self.kwargs = kwargs or {}
+        self.sent = []
+        self.timeouts = []
+
+    def set(self, name, v):
+        address = f'test.{name}'
+        self.values[address] = (v, time.time())
+
+    def _changed(self, r):
+        return self.values[str(r.address)][1] > (r.request_data.get('time_of_known_change') or 0)
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.sent.append(list(requests))
+        self.timeouts.append(requests[0].request_timeout)
+        deadline = asyncio.get_running_loop().time() + min(r.request_timeout for r in requests)
+        while not any(self._changed(r) for r in requests) and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.002)
+        if not any(self._changed(r) for r in requests):
+            return [ValueResponse(address=r.address, value=None, status=False,
+                                  error=ResponseError(code=4004, message='expired', component_name='test',
+                                                      **self.kwargs))
+                    for r in requests]
+        return [ValueResponse(address=r.address, value=Value(v=self.values[str(r.address)][0],
+                                                             ts=self.values[str(r.address)][1],
+                                                             tags={'from_cf': True}), status=True)
+                for r in requests]
+
+
+def _cq(crs, *names, adaptive_timeout=None, request_timeout=0.01):
+    return ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address=f'test.{n}') for n in names],
+                                 delay=0.001, request_timeout=request_timeout, adaptive_timeout=adaptive_timeout)
+
+
+class TestAdaptiveTimeout(unittest.IsolatedAsyncioTestCase):
+
+    async def test_quiet_address_horizon_grows_to_max(self):
+        crs = _ExpiringSolver(a=1)
+        cq = _cq(crs, 'a', adaptive_timeout=AdaptiveTimeout(min_timeout=0.01, max_timeout=0.08))
+        cq.start()
+        await asyncio.sleep(0.3)
+        await cq.stop_and_wait()
+        timeouts = crs.timeouts
+        # the first request gets the value, then every expiry makes the horizon about twice longer
+        self.assertEqual(timeouts[:2], [0.01, 0.01])
+        self.assertEqual(timeouts, sorted(timeouts))
+        self.assertEqual(timeouts[-1], 0.08)
+        self.assertEqual(cq.get_request_timeout('test.a'), 0.08)
+        self.assertEqual(cq.renewals, len(crs.sent) - 2)
+
+    async def test_changing_address_keeps_short_horizon(self):
+        crs = _ExpiringSolver(a=1, b=1)
+        crs.set('a', 1)
+        cq = _cq(crs, 'a', 'b', adaptive_timeout=AdaptiveTimeout(min_timeout=0.01, max_timeout=1.0))
+        cq.start()
+        for i in range(10):
+            await asyncio.sleep(0.01)
+            crs.set('a', i)
+        await asyncio.sleep(0.01)
+        await cq.stop_and_wait()
+        # `a` changes every ~10 ms, its horizon stays about twice that; nothing expired
+        self.assertLess(cq.get_request_timeout('test.a'), 0.05)
+        self.assertEqual(cq.renewals, 0)
+
+    async def test_server_bounds(self):
+        crs = _ExpiringSolver(kwargs={'max_request_timeout': 0.03}, a=1)
+        cq = _cq(crs, 'a', adaptive_timeout=AdaptiveTimeout(min_timeout=0.01, max_timeout=10.0))
+        cq.start()
+        await asyncio.sleep(0.2)
+        await cq.stop_and_wait()
+        self.assertEqual(max(crs.timeouts), 0.03)
+
+    async def test_renewal_copies_sent_requests(self):
+        crs = _ExpiringSolver(kwargs={'subscription': 7}, a=1)
+        cq = _cq(crs, 'a')
+        cq.start()
+        await asyncio.sleep(0.06)
+        crs.set('a', 2)
+        await asyncio.sleep(0.02)
+        await cq.stop_and_wait()
+        self.assertGreater(cq.renewals, 1)
+        first_poll, renewed = crs.sent[1][0], crs.sent[2][0]
+        # the expired long-poll is renewed with a copy carrying the subscription parameters, the sent one is untouched
+        self.assertIsNot(renewed, first_poll)
+        self.assertNotIn('subscription', first_poll.request_data)
+        self.assertEqual(renewed.request_data['subscription'], 7)
+        self.assertEqual(renewed.request_data['time_of_known_change'], 1.0)
+        self.assertEqual(crs.sent[3][0].request_data, renewed.request_data)
+        # fixed horizon without `adaptive_timeout`
+        self.assertEqual(set(crs.timeouts), {0.01})
+        # after the change the request is built again with the new conditional state
+        self.assertIsNot(crs.sent[-1][0], first_poll)
+        self.assertGreater(crs.sent[-1][0].request_data['time_of_known_change'], 1.0)
+
+    def test_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            AdaptiveTimeout(min_timeout=5, max_timeout=1)
+        with self.assertRaises(ValueError):
+            AdaptiveTimeout(smoothing=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
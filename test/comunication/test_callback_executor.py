@@ -0,0 +1,181 @@
+"""Tests of running sync callbacks of cycle queries in a thread pool (CallbackExecutor)."""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from obcom.comunication.callback_executor import CallbackDispatch, CallbackExecutor
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.data_colection.value_call import ValueRequest
+from test.comunication.test_cycle_query_iteration import _SequenceSolver
+
+
+def _cq(crs, executor=None, dispatch=CallbackDispatch.SEQUENTIAL):
+    return ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                 callback_executor=executor, callback_dispatch=dispatch)
+
+
+class TestCallbackExecutor(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.executor = CallbackExecutor(max_workers=4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    async def test_slow_callback_does_not_block_event_loop(self):
+        cq = _cq(_SequenceSolver(limit=3), self.executor)
+        cq.add_callback_method(lambda responses: time.sleep(0.05))
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        ticker_task = asyncio.create_task(ticker())
+        cq.start()
+        await asyncio.wait_for(cq._callback_task, 2.0)
+        ticker_task.cancel()
+        # 4 callbacks x 50 ms in a thread, the loop kept ticking meanwhile
+        self.assertGreater(ticks, 20)
+
+    async def test_order_is_preserved_per_subscription(self):
+        cq = _cq(_SequenceSolver(limit=8), self.executor)
+        values = []
+
+        def callback(responses):
+            if responses[0].status:
+                time.sleep(0.01 if responses[0].value.v % 2 else 0.001)
+                values.append(responses[0].value.v)
+
+        cq.add_callback_method(callback)
+        cq.start()
+        await asyncio.wait_for(cq._callback_task, 2.0)
+        self.assertEqual(values, list(range(1, 9)))
+
+    async def test_concurrency_of_one_callback_is_limited(self):
+        running = 0
+        most = 0
+        lock = threading.Lock()
+
+        def callback(responses):
+            nonlocal running, most
+            with lock:
+                running += 1
+                most = max(most, running)
+            time.sleep(0.005)
+            with lock:
+                running -= 1
+
+        queries = [_cq(_SequenceSolver(limit=5), self.executor) for _ in range(3)]
+        for cq in queries:
+            cq.add_callback_method(callback)
+            cq.start()
+        await asyncio.wait_for(asyncio.gather(*(cq._callback_task for cq in queries)), 2.0)
+        self.assertEqual(most, 1)
+        self.assertEqual(self.executor._limits, {})
+
+    async def test_long_callback_is_logged(self):
+        executor = CallbackExecutor(timeout=0.01)
+        cq = _cq(_SequenceSolver(limit=1), executor)
+        cq.add_callback_method(lambda responses: time.sleep(0.03))
+        with self.assertLogs('callback_executor', level='WARNING') as logs:
+            cq.start()
+            await asyncio.wait_for(cq._callback_task, 2.0)
+        self.assertIn('running longer than 0.01 s', logs.output[0])
+        executor.shutdown()
+
+    async def test_failing_callback_is_isolated(self):
+        cq = _cq(_SequenceSolver(limit=3), self.executor)
+        values = []
+
+        def broken(responses):
+            raise RuntimeError('broken callback')
+
+        cq.add_callback_method(broken)
+        cq.add_callback_method(lambda responses: values.append(responses[0].status))
+        with self.assertLogs('cycle_query', level='ERROR'):
+            cq.start()
+            await asyncio.wait_for(cq._callback_task, 2.0)
+        self.assertEqual(values, [True, True, True, False])
+
+
+class TestCallbackDispatch(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_dispatch_runs_callbacks_together(self):
+        cq = _cq(_SequenceSolver(limit=2), dispatch=CallbackDispatch.CONCURRENT)
+        running = 0
+        most = 0
+        calls = []
+
+        async def callback(responses):
+            nonlocal running, most
+            running += 1
+            most = max(most, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            calls.append(responses[0].status)
+
+        async def broken(responses):
+            raise RuntimeError('broken callback')
+
+        for method in (callback, broken, callback):
+            cq.add_callback_async_method(method)
+        with self.assertLogs('cycle_query', level='ERROR'):
+            cq.start()
+            await asyncio.wait_for(cq._callback_task, 2.0)
+        self.assertEqual(most, 2)
+        # the broken callback did not stop the others: 3 responses x 2 callbacks
+        self.assertEqual(len(calls), 6)
+
+    async def test_per_callback_dispatch_keeps_order_per_callback(self):
+        cq = _cq(_SequenceSolver(limit=6), dispatch=CallbackDispatch.PER_CALLBACK)
+        slow_values, fast_values = [], []
+        fast_done = asyncio.Event()
+        fast_done_first = asyncio.Event()
+
+        async def slow(responses):
+            if not slow_values:
+                # held until the fast callback got every response, it would never come if they shared a worker
+                await asyncio.wait_for(fast_done.wait(), 2.0)
+                fast_done_first.set()
+            if responses[0].status:
+                slow_values.append(responses[0].value.v)
+
+        async def fast(responses):
+            if responses[0].status:
+                fast_values.append(responses[0].value.v)
+            if len(fast_values) == 6:
+                fast_done.set()
+
+        cq.add_callback_async_method(slow)
+        cq.add_callback_async_method(fast)
+        cq.start()
+        await asyncio.wait_for(cq._callback_task, 2.0)
+        # the runner waits for the workers to deliver the last responses
+        self.assertEqual(slow_values, list(range(1, 7)))
+        self.assertEqual(fast_values, list(range(1, 7)))
+        # the fast callback was not held back by the slow one
+        self.assertTrue(fast_done_first.is_set())
+
+    async def test_per_callback_workers_are_cancelled_on_stop(self):
+        cq = _cq(_SequenceSolver(), dispatch=CallbackDispatch.PER_CALLBACK)
+        started = asyncio.Event()
+
+        async def endless(responses):
+            started.set()
+            await asyncio.sleep(10)
+
+        cq.add_callback_async_method(endless)
+        cq.start()
+        await asyncio.wait_for(started.wait(), 1.0)
+        await cq.stop_and_wait()
+        await asyncio.sleep(0)
+        self.assertFalse([t for t in asyncio.all_tasks() if t.get_coro().__qualname__.endswith('_callback_worker')])
+
+
+if __name__ == '__main__':
+    unittest.main()
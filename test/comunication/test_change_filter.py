@@ -0,0 +1,136 @@
+"""Tests of the client-side change filter (deadband, minimum interval, changed fields) of cycle queries."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.change_filter import ChangeFilter
+from obcom.comunication.comunication_error import CommunicationRuntimeError
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from test.comunication.test_subscription_hub import _StubClientAPI
+
+
+class _ListSolver:
+    """Answers with the given values one by one (``pause`` seconds apart), then with a stopping error."""
+
+    def __init__(self, values, pause: float = 0.0):
+        self.values = list(values)
+        self.pause = pause
+        self.calls = 0
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.calls += 1
+        await asyncio.sleep(self.pause)
+        if self.calls > len(self.values):
+            return [ValueResponse(address=r.address, value=None, status=False,
+                                  error=ResponseError(code=2003, message='end', component_name='test'))
+                    for r in requests]
+        return [ValueResponse(address=r.address, value=Value(v=self.values[self.calls - 1], ts=float(self.calls),
+                                                             tags={'from_cf': True}),
+                              status=True)
+                for r in requests]
+
+
+def _cq(crs, change_filter):
+    return ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                 change_filter=change_filter)
+
+
+async def _collect(cq):
+    delivered = []
+    cq.add_callback_method(lambda responses: delivered.append(responses[0].value.v if responses[0].status else None))
+    cq.start()
+    await asyncio.wait_for(cq._callback_task, 2.0)
+    return delivered
+
+
+class TestChangeFilter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_absolute_deadband_accumulates_small_moves(self):
+        cq = _cq(_ListSolver([20.0, 20.0001, 20.0002, 20.05, 20.06, 20.12, 19.9]), ChangeFilter(abs_deadband=0.1))
+        delivered = await _collect(cq)
+        # 20.05 and 20.06 are within 0.1 of the delivered 20.0, 20.12 is not; the error always passes
+        self.assertEqual(delivered, [20.0, 20.12, 19.9, None])
+        self.assertEqual(cq.filtered_updates, 4)
+
+    async def test_relative_deadband(self):
+        cq = _cq(_ListSolver([100, 100.5, 102, 102.5, 0]), ChangeFilter(rel_deadband=0.01))
+        self.assertEqual(await _collect(cq), [100, 102, 0, None])
+
+    async def test_without_deadband_only_repeated_values_are_filtered(self):
+        cq = _cq(_ListSolver(['open', 'open', 'closed', 'closed', 'open']), ChangeFilter())
+        self.assertEqual(await _collect(cq), ['open', 'closed', 'open', None])
+
+    async def test_filtered_update_does_not_wake_consumers(self):
+        cq = _cq(_ListSolver([1, 1, 1, 1, 2], pause=0.005), ChangeFilter())
+        woken = []
+        cq.start()
+
+        async def waiter():
+            while True:
+                woken.append((await cq.get_response())[0].value.v)
+
+        task = asyncio.create_task(waiter())
+        received = []
+        with cq.iterate() as updates:
+            with self.assertRaises(CommunicationRuntimeError):
+                async for r in updates:
+                    received.append(r[0].value.v)
+        task.cancel()
+        self.assertEqual(received, [1, 2])
+        self.assertEqual(woken, [1, 2])
+
+    async def test_min_interval_holds_newest_update(self):
+        crs = _ListSolver(list(range(1, 11)), pause=0.005)
+        cq = _cq(crs, ChangeFilter(min_interval=0.03))
+        delivered = []
+        times = []
+
+        def callback(responses):
+            if responses[0].status:
+                delivered.append(responses[0].value.v)
+                times.append(asyncio.get_running_loop().time())
+
+        cq.add_callback_method(callback)
+        cq.start()
+        await asyncio.sleep(0.2)
+        await cq.stop_and_wait()
+        # 10 values over ~50 ms, delivered at most every 30 ms and the last one is not lost (the final error of the
+        # solver flushes it at once)
+        self.assertLess(len(delivered), 5)
+        self.assertEqual(delivered[0], 1)
+        self.assertEqual(delivered[-1], 10)
+        for a, b in zip(times[:-2], times[1:-1]):
+            self.assertGreaterEqual(b - a, 0.025)
+
+    async def test_held_update_replaced_only_by_significant_one(self):
+        cq = _cq(_ListSolver([1.0, 5.0, 1.01], pause=0.005), ChangeFilter(abs_deadband=0.5, min_interval=0.05))
+        # 1.01 is within the deadband of the delivered 1.0, the held 5.0 stays
+        self.assertEqual(await _collect(cq), [1.0, 5.0, None])
+        self.assertEqual(cq.filtered_updates, 1)
+
+    async def test_changed_fields_only(self):
+        values = [{'ra': 10.0, 'dec': 20.0, 'state': 'tracking'},
+                  {'ra': 10.00001, 'dec': 20.0, 'state': 'tracking'},
+                  {'ra': 10.00002, 'dec': 20.0, 'state': 'slewing'},
+                  {'ra': 11.0, 'dec': 20.0, 'state': 'slewing'}]
+        cq = _cq(_ListSolver(values), ChangeFilter(abs_deadband=0.001, changed_fields_only=True))
+        self.assertEqual(await _collect(cq), [values[0], {'state': 'slewing'}, {'ra': 11.0}, None])
+
+    async def test_subscribe_with_filter(self):
+        api = _StubClientAPI(_ListSolver([1.0, 1.01, 2.0]))
+        cq = await api.subscribe('test.subject', delay=0.01, change_filter=ChangeFilter(abs_deadband=0.5))
+        self.assertEqual(await _collect(cq), [1.0, 2.0, None])
+        shared = await api.subscribe('test.other', delay=0.01, shared=True, change_filter=ChangeFilter())
+        self.assertIsNotNone(shared._filter_state)
+        await api.subscription_manager.stop_all_and_wait()
+
+    def test_negative_deadband_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ChangeFilter(abs_deadband=-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
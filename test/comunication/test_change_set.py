@@ -0,0 +1,102 @@
+"""Tests of per-address change sets and routed callbacks of multi-address cycle queries."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.comunication_error import CommunicationRuntimeError
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+
+class _RoundRobinSolver:
+    """Every answer changes the value (and `ts`) of one address only, in turn; stops after ``limit`` answers."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.calls = 0
+        self.ts = {}
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.calls > self.limit:
+            return [ValueResponse(address=r.address, value=None, status=False,
+                                  error=ResponseError(code=2003, message='end', component_name='test'))
+                    for r in requests]
+        if self.calls == 1:
+            self.ts = {str(r.address): 1.0 for r in requests}
+        else:
+            self.ts[str(requests[(self.calls - 2) % len(requests)].address)] = float(self.calls)
+        return [ValueResponse(address=r.address, value=Value(v=self.ts[str(r.address)], ts=self.ts[str(r.address)],
+                                                             tags={'from_cf': True}), status=True)
+                for r in requests]
+
+
+def _cq(crs, count):
+    requests = [ValueRequest(address=f'test.subject_{i}') for i in range(count)]
+    return ConditionalCycleQuery(crs=crs, list_request=requests, delay=0.01)
+
+
+class TestChangeSet(unittest.IsolatedAsyncioTestCase):
+
+    async def test_iterator_gets_changed_addresses(self):
+        cq = _cq(_RoundRobinSolver(limit=4), 3)
+        changes = []
+        cq.start()
+        with cq.iterate() as updates:
+            with self.assertRaises(CommunicationRuntimeError):
+                async for _ in updates:
+                    changes.append(updates.last_changes.addresses)
+        self.assertEqual(changes, [['test.subject_0', 'test.subject_1', 'test.subject_2'],
+                                   ['test.subject_0'], ['test.subject_1'], ['test.subject_2']])
+
+    async def test_address_callbacks_run_only_for_changed_addresses(self):
+        cq = _cq(_RoundRobinSolver(limit=7), 3)
+        routed = []
+        whole = []
+
+        async def on_first(response):
+            routed.append(('a', str(response.address), response.value.v))
+
+        cq.add_address_callback_async_method('test.subject_0', on_first)
+        cq.add_address_callback_method('test.subject_2',
+                                       lambda response: routed.append(('s', str(response.address), response.value.v)))
+        cq.add_callback_method(lambda responses: whole.append(len(responses)))
+        cq.start()
+        await asyncio.wait_for(cq._callback_task, 2.0)
+        self.assertEqual(routed, [('a', 'test.subject_0', 1.0), ('s', 'test.subject_2', 1.0),
+                                  ('a', 'test.subject_0', 2.0), ('s', 'test.subject_2', 4.0),
+                                  ('a', 'test.subject_0', 5.0), ('s', 'test.subject_2', 7.0)])
+        # the whole-list callbacks are not affected, the final error is not routed
+        self.assertEqual(len(whole), 8)
+
+    async def test_remove_address_callback(self):
+        cq = _cq(_RoundRobinSolver(limit=1), 2)
+        calls = []
+        method = calls.append
+        cq.add_address_callback_method('test.subject_1', method)
+        cq.remove_address_callback('test.subject_1', method)
+        self.assertEqual(cq._address_callbacks, {})
+        cq.start()
+        await asyncio.wait_for(cq._callback_task, 2.0)
+        self.assertEqual(calls, [])
+
+    async def test_change_set_lookup(self):
+        cq = _cq(_RoundRobinSolver(limit=2), 2)
+        cq.start()
+        with cq.iterate() as updates:
+            await updates.get()
+            await updates.get()
+            changes = updates.last_changes
+        self.assertEqual(len(changes), 1)
+        self.assertIn('test.subject_0', changes)
+        self.assertIsNone(changes.get('test.subject_1'))
+        self.assertEqual(changes.get('test.subject_0').value.v, 2.0)
+        self.assertEqual(changes.indexes, (0,))
+        self.assertEqual(len(changes.responses), 2)
+        await cq.stop_and_wait()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+"""Tests of cycle queries run by a shared driver instead of their own tasks."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.callback_executor import CallbackDispatch
+from obcom.comunication.comunication_error import CommunicationRuntimeError
+from obcom.comunication.cycle_driver import CycleQueryDriver
+from obcom.comunication.cycle_query import ConditionalCycleQuery, CycleQueryState, PeriodicCycleQuery
+from obcom.comunication.periodic_scheduler import PeriodicScheduler
+from obcom.comunication.subscription_hub import SubscriptionHub
+from obcom.data_colection.value_call import ValueRequest
+from test.comunication.test_change_filter import _ListSolver
+from test.comunication.test_cycle_query_iteration import _SequenceSolver
+from test.comunication.test_periodic_schedule import _LatencySolver
+from test.comunication.test_runtime_requests import _LongPollSolver
+from test.comunication.test_subscription_hub import _StubClientAPI, _wait_for
+
+
+def _periodic(crs, delay, driver, name='subject'):
+    return PeriodicCycleQuery(crs=crs, list_request=[ValueRequest(address=f'test.{name}')], delay=delay,
+                              driver=driver)
+
+
+def _conditional(crs, driver, *names):
+    return ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address=f'test.{n}') for n in names],
+                                 delay=0.01, request_timeout=5, driver=driver)
+
+
+class TestCycleQueryDriver(unittest.IsolatedAsyncioTestCase):
+
+    async def test_idle_periodic_queries_have_no_tasks(self):
+        driver = CycleQueryDriver()
+        crs = _LatencySolver(latency=0.0)
+        queries = [_periodic(crs, 0.5, driver, name=f's{i}') for i in range(200)]
+        baseline = len(asyncio.all_tasks())
+        for cq in queries:
+            cq.start()
+        self.assertEqual(driver.queries_count(), 200)
+        self.assertEqual(queries[0].state, CycleQueryState.RUNNING)
+        self.assertEqual(len(asyncio.all_tasks()), baseline)
+        await _wait_for(lambda: len(crs.sent_loop) == 200 and not driver.is_running())
+        # every query was polled once and waits for its next tick
+        self.assertEqual(len(asyncio.all_tasks()), baseline)
+        self.assertEqual(driver.in_flight_count(), 0)
+        driver.close()
+        self.assertTrue(all(cq.state == CycleQueryState.STOPPED for cq in queries))
+        self.assertEqual(driver.queries_count(), 0)
+
+    async def test_periodic_consumers(self):
+        driver = CycleQueryDriver()
+        cq = _periodic(_LatencySolver(latency=0.0), 0.01, driver)
+        received = []
+        cq.add_callback_method(lambda responses: received.append(responses[0].value.v))
+        cq.start()
+        response = await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(response[0].value.v, 1)
+        with cq.iterate() as updates:
+            await asyncio.wait_for(updates.get(), 1.0)
+        await asyncio.sleep(0.03)
+        self.assertGreater(len(received), 2)
+        self.assertGreater(cq.tick_stats.ticks, 2)
+        await cq.stop_and_wait()
+        self.assertTrue(cq.is_stopped())
+        with self.assertRaises(CommunicationRuntimeError):
+            await cq.get_response()
+
+    async def test_conditional_long_poll(self):
+        driver = CycleQueryDriver()
+        crs = _LongPollSolver(a=1, b=2)
+        cq = _conditional(crs, driver, 'a')
+        received = []
+        cq.add_callback_method(lambda responses: received.append([r.value.v for r in responses]))
+        cq.start()
+        await asyncio.sleep(0.03)
+        self.assertEqual(received, [[1]])
+        # waiting for a change in a long-poll, only the request is a task
+        self.assertEqual(driver.in_flight_count(), 1)
+        self.assertFalse(driver.is_running())
+        crs.set('a', 3)
+        await asyncio.sleep(0.03)
+        self.assertEqual(received, [[1], [3]])
+        self.assertEqual(crs.sent[1], {'test.a': 1.0})
+        cq.add_request(ValueRequest(address='test.b'))
+        await asyncio.sleep(0.03)
+        self.assertEqual(crs.cancelled, 1)
+        self.assertEqual(received[-1], [3, 2])
+        await cq.stop_and_wait()
+        self.assertEqual(crs.cancelled, 2)
+
+    async def test_pause_and_resume(self):
+        driver = CycleQueryDriver()
+        crs = _LongPollSolver(a=1)
+        cq = _conditional(crs, driver, 'a')
+        cq.start()
+        await asyncio.wait_for(cq.get_response(), 1.0)
+        cq.pause()
+        self.assertEqual(cq.state, CycleQueryState.PAUSED)
+        await asyncio.sleep(0.01)
+        sent = len(crs.sent)
+        crs.set('a', 2)
+        await asyncio.sleep(0.03)
+        self.assertEqual(len(crs.sent), sent)
+        self.assertEqual(driver.in_flight_count(), 0)
+        cq.resume()
+        response = await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(response[0].value.v, 2)
+        await cq.stop_and_wait()
+
+    async def test_final_error_stops_query(self):
+        driver = CycleQueryDriver()
+        cq = ConditionalCycleQuery(crs=_ListSolver([1, 2]), list_request=[ValueRequest(address='test.subject')],
+                                   delay=0.01, driver=driver)
+        delivered = []
+        cq.add_callback_method(lambda responses: delivered.append(responses[0].status))
+        cq.start()
+        received = []
+        with cq.iterate() as updates:
+            with self.assertRaises(CommunicationRuntimeError):
+                async for r in updates:
+                    received.append(r[0].value.v)
+        await asyncio.wait_for(cq._callback_task, 1.0)
+        self.assertEqual(received, [1, 2])
+        # the callbacks get the last response once more with the error
+        self.assertEqual(delivered, [True, True, False])
+        self.assertEqual(cq.state, CycleQueryState.STOPPED)
+        self.assertEqual(driver.queries_count(), 0)
+
+    async def test_not_driven_configurations(self):
+        driver = CycleQueryDriver()
+        crs = _LatencySolver(latency=0.0)
+        scheduler = PeriodicScheduler(crs=crs)
+        scheduled = PeriodicCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=1,
+                                       scheduler=scheduler)
+        with self.assertRaises(ValueError):
+            scheduled.set_driver(driver)
+        cq = _periodic(crs, 1, None)
+        cq.start()
+        with self.assertRaises(ValueError):
+            cq.set_driver(driver)
+        await cq.stop_and_wait()
+        cq.set_driver(driver)
+        self.assertIs(cq.driver, driver)
+        with self.assertRaises(ValueError):
+            SubscriptionHub(crs=crs).subscribe('test.subject').set_driver(driver)
+
+    async def test_per_callback_dispatch(self):
+        driver = CycleQueryDriver()
+        cq = ConditionalCycleQuery(crs=_SequenceSolver(limit=6), list_request=[ValueRequest(address='test.subject')],
+                                   delay=0.01, callback_dispatch=CallbackDispatch.PER_CALLBACK, driver=driver)
+        slow_values, fast_values = [], []
+        fast_done = asyncio.Event()
+        fast_done_first = asyncio.Event()
+
+        async def slow(responses):
+            if not slow_values:
+                # held until the fast callback got every response, it would never come if they shared a task
+                await asyncio.wait_for(fast_done.wait(), 2.0)
+                fast_done_first.set()
+            if responses[0].status:
+                slow_values.append(responses[0].value.v)
+
+        async def fast(responses):
+            if responses[0].status:
+                fast_values.append(responses[0].value.v)
+            if len(fast_values) == 6:
+                fast_done.set()
+
+        cq.add_callback_async_method(slow)
+        cq.add_callback_async_method(fast)
+        cq.start()
+        await _wait_for(lambda: len(slow_values) == 6)
+        self.assertEqual(slow_values, list(range(1, 7)))
+        self.assertEqual(fast_values, list(range(1, 7)))
+        self.assertTrue(fast_done_first.is_set())
+        await cq.stop_and_wait()
+
+    async def test_client_applies_driver(self):
+        api = _StubClientAPI(_LongPollSolver(a=1))
+        api.cycle_driver = CycleQueryDriver()
+        cq = await api.subscribe('test.a', delay=0.01)
+        self.assertIs(cq.driver, api.cycle_driver)
+        shared = await api.subscribe('test.a', delay=0.01, shared=True)
+        self.assertIsNone(shared.driver)
+
+
+if __name__ == '__main__':
+    unittest.main()
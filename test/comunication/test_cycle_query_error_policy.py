@@ -17,18 +17,25 @@ from unittest.mock import patch
 
 from obcom.comunication.cycle_query import ConditionalCycleQuery, PeriodicCycleQuery
 import obcom.comunication.cycle_query as cq_mod
+from obcom.comunication.comunication_error import CircuitOpenError
 from obcom.comunication.error_policy import (
     Backoff,
     Budget,
+    CircuitBreakerRegistry,
+    CircuitState,
     ErrorPolicy,
     LogPolicy,
+    RetryLimiter,
+    RetryThrottle,
     SeverityAction,
     SeverityRule,
 )
+from obcom.comunication.rate_control import AimdRateController
 from obcom.data_colection.address import Address
 from obcom.data_colection.response_error import ResponseError
 from obcom.data_colection.value import Value
 from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from test.comunication.test_subscription_hub import _StubClientAPI
 
 
 # ---------------------------------------------------------------------------
@@ -410,5 +417,178 @@ class TestLegacyIgnoreErrorsCompat(unittest.IsolatedAsyncioTestCase):
                         "ignore_errors=True must keep retrying NORMAL silently — no error callback expected first")
 
 
+
+class TestRetryLimiterIntegration(unittest.IsolatedAsyncioTestCase):
+    """Retries of many subscriptions drawing from one shared RetryLimiter."""
+
+    async def test_retries_of_all_queries_are_spread_by_limiter(self):
+        rate = 200.0
+        policy = ErrorPolicy.SERVICE.with_overrides(
+            temporary=SeverityRule(action=SeverityAction.RETRY, backoff=Backoff.immediate()),
+        ).with_retry_limiter(RetryLimiter(rate=rate, burst=1))
+        send_times = []
+
+        class _TimedSolver(StubRequestSolver):
+            async def send_request(self, requests, timeout=None, no_wait=False):
+                send_times.append(asyncio.get_running_loop().time())
+                return await super().send_request(requests, timeout, no_wait)
+
+        queries = [ConditionalCycleQuery(
+            crs=_TimedSolver([[make_error_response(severity=ResponseError.SEVERITY_TEMPORARY)]]),
+            list_request=[make_request()], delay=0.01, error_policy=policy) for _ in range(10)]
+        for q in queries:
+            q.start()
+        await asyncio.sleep(0.2)
+        for q in queries:
+            await q.stop_and_wait()
+        retries = len(send_times) - len(queries)  # first request of every query is not a retry
+        # ~rate * 0.2 s = 40 retries in total, not 10 queries spinning freely
+        self.assertGreater(retries, 10)
+        self.assertLess(retries, rate * 0.2 * 1.5 + 1)
+
+    async def test_expired_long_polls_take_no_tokens(self):
+        limiter = RetryLimiter(rate=1.0, burst=1)
+        crs = StubRequestSolver([[make_error_response(code=4004)]])
+        q = ConditionalCycleQuery(crs=crs, list_request=[make_request()], delay=0.001,
+                                  error_policy=ErrorPolicy.SERVICE.with_retry_limiter(limiter))
+        q.start()
+        await asyncio.sleep(0.05)
+        await q.stop_and_wait()
+        # a renewal of an expired subscription is not a retry, it is neither held nor charged by the limiter
+        self.assertGreater(crs.observed_call_count, 5)
+        self.assertEqual(limiter.reserve(), 0.0)
+
+    async def test_token_taken_at_retry_send(self):
+        limiter = RetryLimiter(rate=1.0, burst=1)
+        policy = ErrorPolicy.SERVICE.with_overrides(
+            temporary=SeverityRule(action=SeverityAction.RETRY, backoff=Backoff.fixed(10.0)),
+        ).with_retry_limiter(limiter)
+        crs = StubRequestSolver([[make_error_response(severity=ResponseError.SEVERITY_TEMPORARY)]])
+        q = ConditionalCycleQuery(crs=crs, list_request=[make_request()], delay=0.01, error_policy=policy)
+        q.start()
+        await asyncio.sleep(0.05)
+        await q.stop_and_wait()
+        # stopped during the backoff, the retry was never sent and took no token
+        self.assertEqual(crs.observed_call_count, 1)
+        self.assertEqual(limiter.reserve(), 0.0)
+
+    async def test_stopped_retry_gives_token_back(self):
+        limiter = RetryLimiter(rate=1.0, burst=1)
+        limiter.reserve()
+        policy = ErrorPolicy.SERVICE.with_overrides(
+            temporary=SeverityRule(action=SeverityAction.RETRY, backoff=Backoff.immediate()),
+        ).with_retry_limiter(limiter)
+        crs = StubRequestSolver([[make_error_response(severity=ResponseError.SEVERITY_TEMPORARY)]])
+        q = ConditionalCycleQuery(crs=crs, list_request=[make_request()], delay=0.01, error_policy=policy)
+        q.start()
+        await asyncio.sleep(0.05)
+        await q.stop_and_wait()
+        # the retry waiting for a token was abandoned, its token is not left queued
+        self.assertEqual(crs.observed_call_count, 1)
+        self.assertLess(limiter.reserve(), 1.0)
+
+
+class TestRetryThrottleIntegration(unittest.IsolatedAsyncioTestCase):
+    """Retries of failing subscriptions bounded by successes of the whole process."""
+
+    async def test_retries_suppressed_until_successes_refill(self):
+        throttle = RetryThrottle(max_tokens=10, token_ratio=1.0, suppressed_delay=0.1)
+        policy = ErrorPolicy.SERVICE.with_overrides(
+            temporary=SeverityRule(action=SeverityAction.RETRY, backoff=Backoff.immediate()),
+        ).with_retry_throttle(throttle)
+        failing = StubRequestSolver([[make_error_response(severity=ResponseError.SEVERITY_TEMPORARY)]])
+        queries = [ConditionalCycleQuery(crs=failing, list_request=[make_request()], delay=0.001,
+                                         error_policy=policy) for _ in range(5)]
+        for q in queries:
+            q.start()
+        await asyncio.sleep(0.15)
+        # 5 tokens of retries, then every query waits suppressed_delay once or twice
+        self.assertGreater(throttle.suppressed, 0)
+        self.assertLess(failing.observed_call_count, 5 + 5 + 2 * 5 + 1)
+        self.assertTrue(throttle.is_suppressing())
+        # successful traffic of another subscription sharing the throttle lets retries through again
+        healthy = ConditionalCycleQuery(crs=StubRequestSolver([[make_ok_response(v=i)] for i in range(20)]),
+                                        list_request=[make_request()], delay=0.001, error_policy=policy)
+        received = []
+        healthy.add_callback_method(received.append)
+        await _run_cq_until(healthy, callback_calls=received, target_calls=10)
+        self.assertFalse(throttle.is_suppressing())
+        await healthy.stop_and_wait()
+        for q in queries:
+            await q.stop_and_wait()
+
+
+class TestCircuitBreakerIntegration(unittest.IsolatedAsyncioTestCase):
+    """Subscriptions of one dead device sharing a CircuitBreakerRegistry."""
+
+    async def test_open_circuit_lets_single_probe_through(self):
+        registry = CircuitBreakerRegistry(failure_threshold=3, reset_timeout=0.05, key_depth=2)
+        policy = ErrorPolicy.SERVICE.with_overrides(
+            temporary=SeverityRule(action=SeverityAction.RETRY, backoff=Backoff.immediate()),
+        ).with_circuit_breakers(registry)
+        dead = [True]
+        sent = []
+
+        class _DeviceSolver(StubRequestSolver):
+            async def send_request(self, requests, timeout=None, no_wait=False):
+                sent.append(str(requests[0].address))
+                await asyncio.sleep(0.001)
+                if dead[0]:
+                    return [make_error_response(str(requests[0].address), severity=ResponseError.SEVERITY_TEMPORARY)]
+                return [make_ok_response(str(requests[0].address))]
+
+        received = []
+        queries = []
+        for i in range(20):
+            q = ConditionalCycleQuery(crs=_DeviceSolver([]), list_request=[make_request(f'dev.mount.v{i}')],
+                                      delay=0.001, error_policy=policy)
+            q.add_callback_method(received.append)
+            queries.append(q)
+            q.start()
+        await asyncio.sleep(0.3)
+        # open, or half-open while a probe is in flight
+        self.assertEqual(set(registry.states()), {'dev.mount'})
+        self.assertNotEqual(registry.breaker('dev.mount').state, CircuitState.CLOSED)
+        # 20 first requests, then about one probe per reset_timeout instead of 20 queries retrying freely
+        self.assertLess(len(sent), 20 + 0.3 / 0.05 + 3)
+        dead[0] = False
+        await asyncio.sleep(0.15)
+        self.assertEqual(registry.breaker('dev.mount').state, CircuitState.CLOSED)
+        # one successful probe resumes all of them
+        self.assertEqual({str(r[0].address) for r in received}, {f'dev.mount.v{i}' for i in range(20)})
+        for q in queries:
+            await q.stop_and_wait()
+
+    async def test_stop_while_waiting_for_rate_slot_gives_probe_back(self):
+        registry = CircuitBreakerRegistry(failure_threshold=1, reset_timeout=0.01)
+        registry.record_timeout(registry.check(['dev.a']))
+        await asyncio.sleep(0.02)
+        crs = StubRequestSolver([[make_ok_response('dev.a')]])
+        crs.rate_controller = AimdRateController(initial_rate=1.0, key_depth=1)
+        crs.rate_controller.reserve(['dev.a'])
+        q = ConditionalCycleQuery(crs=crs, list_request=[make_request('dev.a')], delay=0.001,
+                                  error_policy=ErrorPolicy.SERVICE.with_circuit_breakers(registry))
+        q.start()
+        await asyncio.sleep(0.02)
+        # the query took the probe of the half-open circuit and waits for its rate slot
+        self.assertEqual(registry.breaker('dev.a').state, CircuitState.HALF_OPEN)
+        await q.stop_and_wait()
+        self.assertEqual(crs.observed_call_count, 0)
+        # the next request probes at once and gets the slot the query did not use
+        self.assertTrue(registry.breaker('dev.a').allow())
+        self.assertLess(crs.rate_controller.reserve(['dev.a'])[0], 1.0)
+
+    async def test_single_request_fails_fast_when_open(self):
+        crs = StubRequestSolver([[make_error_response('dev.mount.ra')]])
+        api = _StubClientAPI(crs)
+        api.circuit_breakers = CircuitBreakerRegistry(failure_threshold=2, reset_timeout=60.0, key_depth=2)
+        for _ in range(2):
+            response = await api.get_async('dev.mount.ra', request_timeout=1.0)
+            self.assertFalse(response.status)
+        with self.assertRaises(CircuitOpenError):
+            await api.get_async('dev.mount.dec', request_timeout=1.0)
+        self.assertEqual(crs.observed_call_count, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,118 @@
+"""Tests of per-consumer response queues (``async for responses in cq``)."""
+
+import asyncio
+import gc
+import unittest
+
+from obcom.comunication.comunication_error import CommunicationRuntimeError
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.comunication.response_queue import OverflowPolicy
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+
+class _SequenceSolver:
+    """Answers immediately with values 1, 2, 3, ... up to ``limit``, then with a stopping error."""
+
+    def __init__(self, limit: int = 1000):
+        self.limit = limit
+        self.calls = 0
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.calls > self.limit:
+            return [ValueResponse(address=r.address, value=None, status=False,
+                                  error=ResponseError(code=2003, message='end', component_name='test'))
+                    for r in requests]
+        return [ValueResponse(address=r.address, value=Value(v=self.calls, ts=float(self.calls),
+                                                             tags={'from_cf': True}), status=True)
+                for r in requests]
+
+
+def _cq(crs):
+    return ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01)
+
+
+class TestCycleQueryIteration(unittest.IsolatedAsyncioTestCase):
+
+    async def test_blocking_consumer_receives_every_response_in_order(self):
+        cq = _cq(_SequenceSolver(limit=20))
+        values = []
+        with self.assertRaises(CommunicationRuntimeError):
+            with cq.iterate(maxsize=2, overflow=OverflowPolicy.BLOCK) as updates:
+                cq.start()
+                async for responses in updates:
+                    values.append(responses[0].value.v)
+                    await asyncio.sleep(0.002)  # slower than the producer
+        self.assertEqual(values, list(range(1, 21)))
+        self.assertEqual(updates.dropped, 0)
+        await cq.stop_and_wait()
+
+    async def test_drop_oldest_counts_dropped_updates(self):
+        cq = _cq(_SequenceSolver(limit=30))
+        updates = cq.iterate(maxsize=3, overflow=OverflowPolicy.DROP_OLDEST)
+        cq.start()
+        await asyncio.wait_for(cq._task, 1.0)
+        values = []
+        with self.assertRaises(CommunicationRuntimeError):
+            async for responses in updates:
+                values.append(responses[0].value.v)
+        # the queue holds 3 items, the last one is the final error
+        self.assertEqual(values, [29, 30])
+        self.assertEqual(updates.dropped, 28)
+        # total of all consumers, the callback runner queue included
+        self.assertGreaterEqual(cq.dropped_updates, updates.dropped)
+
+    async def test_keep_latest_delivers_newest_response(self):
+        cq = _cq(_SequenceSolver())
+        updates = cq.iterate(overflow=OverflowPolicy.KEEP_LATEST)
+        cq.start()
+        await asyncio.sleep(0.02)
+        first = (await updates.get())[0].value.v
+        await asyncio.sleep(0.02)
+        second = (await updates.get())[0].value.v
+        self.assertGreater(second, first + 1)
+        self.assertGreater(updates.dropped, 0)
+        self.assertEqual(updates.pending, 0)
+        await cq.stop_and_wait()
+
+    async def test_iteration_ends_when_query_is_stopped(self):
+        cq = _cq(_SequenceSolver())
+        cq.start()
+        received = 0
+        async for _ in cq:
+            received += 1
+            if received == 3:
+                cq.stop()
+        self.assertGreaterEqual(received, 3)
+        with self.assertRaises(CommunicationRuntimeError):
+            await cq.iterate().get()
+
+    async def test_abandoned_iterator_is_detached(self):
+        cq = _cq(_SequenceSolver())
+        cq.start()
+        consumers = len(cq._queues)  # the callback runner has one
+        async for _ in cq:
+            break
+        gc.collect()
+        self.assertEqual(len(cq._queues), consumers)
+        await cq.stop_and_wait()
+
+    async def test_slow_callback_does_not_miss_updates(self):
+        cq = _cq(_SequenceSolver(limit=10))
+        values = []
+
+        async def slow_callback(responses):
+            values.append(responses[0].value.v)
+            await asyncio.sleep(0.002)
+
+        cq.add_callback_async_method(slow_callback)
+        cq.start()
+        await asyncio.wait_for(cq._callback_task, 1.0)
+        self.assertEqual(values[:10], list(range(1, 11)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Tests of the requests a cycle query actually sends.
+
+A recording stub solver keeps every batch of requests it was given, so
+the tests can check the per-cycle fields (``time_of_known_change``,
+``no_send_before``, additional error kwargs) without a running server.
+"""
+
+import asyncio
+import unittest
+
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.comunication.error_policy import Backoff, ErrorPolicy, SeverityAction, SeverityRule
+from obcom.data_colection.address import Address
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+
+class _RecordingSolver:
+    """Serves scripted responses (last one repeated) and records every request batch."""
+
+    def __init__(self, script):
+        self._script = script
+        self.sent = []
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.sent.append(requests)
+        idx = min(len(self.sent) - 1, len(self._script) - 1)
+        await asyncio.sleep(0.001)
+        return list(self._script[idx])
+
+
+def _ok(ts: float, addr: str = 'test.subject') -> ValueResponse:
+    return ValueResponse(address=Address(addr), value=Value(v=ts, ts=ts, tags={'from_cf': True}), status=True)
+
+
+async def _run_until(cq, predicate, timeout: float = 1.0):
+    cq.start()
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not predicate() and asyncio.get_event_loop().time() < deadline:
+        await asyncio.sleep(0.002)
+    await cq.stop_and_wait()
+
+
+class TestConditionalRequests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_known_change_is_patched_into_each_send(self):
+        crs = _RecordingSolver([[_ok(100.0)], [_ok(200.0)], [_ok(300.0)]])
+        request = ValueRequest(address='test.subject', time_of_data_tolerance=1.0, request_data={'param': 1})
+        cq = ConditionalCycleQuery(crs=crs, list_request=[request], delay=0.5)
+        await _run_until(cq, lambda: len(crs.sent) >= 3)
+        first, second, third = (s[0] for s in crs.sent[:3])
+        self.assertEqual(first.request_data, {'param': 1})
+        self.assertEqual(second.request_data, {'param': 1, 'time_of_known_change': 100.0, 'no_send_before': 100.5})
+        self.assertEqual(third.request_data['time_of_known_change'], 200.0)
+        self.assertEqual(third.to_dict()['time_of_data'], 200.5)
+        self.assertTrue(third.to_dict()['cycle_query'])
+        # sent requests never alias the template request data
+        self.assertIsNot(second.request_data, request.request_data)
+        self.assertIs(second.address, request.address)
+
+    async def test_error_kwargs_are_sent_once(self):
+        error = ValueResponse(address=Address('test.subject'), status=False,
+                              error=ResponseError(code=2003, message='x', component_name='test',
+                                                  severity=ResponseError.SEVERITY_TEMPORARY, resume_token=7))
+        crs = _RecordingSolver([[error], [_ok(100.0)], [_ok(200.0)]])
+        policy = ErrorPolicy.INTERACTIVE.with_overrides(
+            temporary=SeverityRule(action=SeverityAction.RETRY, backoff=Backoff.immediate()))
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.5,
+                                   error_policy=policy)
+        await _run_until(cq, lambda: len(crs.sent) >= 3)
+        self.assertEqual(crs.sent[1][0].request_data.get('resume_token'), 7)
+        self.assertNotIn('resume_token', crs.sent[2][0].request_data)
+
+    async def test_template_is_reused_between_cycles(self):
+        crs = _RecordingSolver([[_ok(float(i))] for i in range(1, 6)])
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.5)
+        cq.start()
+        await asyncio.sleep(0.005)
+        template = cq._templates[0]
+        await _run_until(cq, lambda: len(crs.sent) >= 4)
+        self.assertIs(cq._templates[0], template)
+        # a changed static field is picked up by a fresh template
+        cq._list_request[0].time_of_data_tolerance = 42.0
+        self.assertEqual(cq._get_list_request_with_extinction()[0].to_dict()['time_of_data_tolerance'], 42.0)
+        self.assertIsNot(cq._templates[0], template)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+"""Tests for the streaming mode of ConditionalCycleQuery.
+
+A fake solver implements ``open_stream`` with an in-memory stream the
+test pushes updates into, and counts opened streams, granted credits and
+lease renewals.
+"""
+
+import asyncio
+import unittest
+
+from obcom.comunication.base_client_request_solver import BaseClientRequestSolver
+from obcom.comunication.comunication_error import CommunicationRuntimeError, CommunicationTimeoutError
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.comunication.error_policy import (
+    Backoff,
+    CircuitBreakerRegistry,
+    CircuitState,
+    ErrorPolicy,
+    SeverityAction,
+    SeverityRule,
+)
+from obcom.comunication.rate_control import AimdRateController
+from obcom.comunication.value_stream import BaseValueStream
+from obcom.data_colection.address import Address
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+
+def _ok(ts: float) -> ValueResponse:
+    return ValueResponse(address=Address('test.subject'), value=Value(v=ts, ts=ts, tags={'from_cf': True}))
+
+
+class _FakeStream(BaseValueStream):
+
+    def __init__(self, requests, credits, lease, fail_renew=False):
+        self.requests = requests
+        self.credits = credits
+        self.granted = []
+        self.renewals = 0
+        self.closed = False
+        self._lease = lease
+        self._fail_renew = fail_renew
+        self._queue = asyncio.Queue()
+
+    @property
+    def lease(self) -> float:
+        return self._lease
+
+    def push(self, responses):
+        self._queue.put_nowait(responses)
+
+    async def receive(self):
+        item = await self._queue.get()
+        if isinstance(item, Exception):
+            raise item
+        self.credits -= 1
+        return item
+
+    def grant(self, credits: int) -> None:
+        self.granted.append(credits)
+        self.credits += credits
+
+    async def renew(self) -> None:
+        self.renewals += 1
+        if self._fail_renew:
+            raise CommunicationTimeoutError()
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class _StreamingSolver(BaseClientRequestSolver):
+
+    def __init__(self, fail_renew=False, fail_open=False):
+        self.streams = []
+        self.requests_sent = 0
+        self.open_attempts = 0
+        self._fail_renew = fail_renew
+        self._fail_open = fail_open
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.requests_sent += 1
+        raise AssertionError('long-poll must not be used when streaming')
+
+    def supports_streaming(self) -> bool:
+        return True
+
+    async def open_stream(self, requests, credits, lease, min_interval=0):
+        self.open_attempts += 1
+        if self._fail_open:
+            raise CommunicationTimeoutError()
+        stream = _FakeStream(requests, credits, lease, fail_renew=self._fail_renew)
+        self.streams.append(stream)
+        return stream
+
+
+async def _wait_for(predicate, timeout: float = 1.0):
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not predicate() and asyncio.get_event_loop().time() < deadline:
+        await asyncio.sleep(0.002)
+
+
+class TestStreamingConditionalQuery(unittest.IsolatedAsyncioTestCase):
+
+    async def test_pushed_updates_are_delivered_without_requests(self):
+        crs = _StreamingSolver()
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   streaming=True, stream_credits=4)
+        received = []
+        cq.add_callback_method(lambda resp: received.append(resp[0].value.v))
+        cq.start()
+        await _wait_for(lambda: crs.streams)
+        stream = crs.streams[0]
+        for i in range(1, 11):
+            stream.push([_ok(float(i))])
+            await _wait_for(lambda: len(received) >= i)
+        await cq.stop_and_wait()
+        self.assertEqual(received, [float(i) for i in range(1, 11)])
+        self.assertEqual(len(crs.streams), 1)
+        self.assertEqual(crs.requests_sent, 0)
+        # credits are topped up, the server never runs out of them
+        self.assertTrue(stream.granted)
+        self.assertGreater(stream.credits, 0)
+        self.assertTrue(stream.closed)
+
+    async def test_expired_stream_is_reopened_with_known_change(self):
+        crs = _StreamingSolver()
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   streaming=True)
+        cq.start()
+        await _wait_for(lambda: crs.streams)
+        crs.streams[0].push([_ok(5.0)])
+        await asyncio.wait_for(cq.get_response(), 1.0)
+        crs.streams[0].push([ValueResponse(address=Address('test.subject'), status=False,
+                                           error=ResponseError(code=4004, message='expired', component_name='t'))])
+        await _wait_for(lambda: len(crs.streams) == 2)
+        await cq.stop_and_wait()
+        self.assertTrue(crs.streams[0].closed)
+        self.assertEqual(crs.streams[1].requests[0].request_data['time_of_known_change'], 5.0)
+
+    async def test_lease_is_renewed_in_background(self):
+        crs = _StreamingSolver()
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   request_timeout=0.02, streaming=True)
+        cq.start()
+        await asyncio.sleep(0.1)
+        await cq.stop_and_wait()
+        self.assertGreaterEqual(crs.streams[0].renewals, 3)
+        self.assertEqual(len(crs.streams), 1)
+
+    async def test_failed_renewal_counts_as_missed_message(self):
+        crs = _StreamingSolver(fail_renew=True)
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   request_timeout=0.01, max_missed_msg=2, streaming=True)
+        cq.start()
+        with self.assertRaises(CommunicationRuntimeError):
+            await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(len(crs.streams), 2)
+        self.assertTrue(all(s.closed for s in crs.streams))
+
+    async def test_opening_passes_circuit_breakers_and_rate_controller(self):
+        crs = _StreamingSolver(fail_open=True)
+        crs.rate_controller = AimdRateController()
+        registry = CircuitBreakerRegistry(failure_threshold=2, reset_timeout=10.0)
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   max_missed_msg=-1, streaming=True,
+                                   error_policy=ErrorPolicy.SERVICE.with_circuit_breakers(registry))
+        cq.start()
+        await asyncio.sleep(0.1)
+        await cq.stop_and_wait()
+        # the open circuit holds further attempts, the timeouts cut the rate of the endpoint
+        self.assertEqual(crs.open_attempts, 2)
+        self.assertEqual(registry.states(), {'test.subject': CircuitState.OPEN})
+        self.assertLess(crs.rate_controller.rates()['test.subject'], AimdRateController.DEFAULT_INITIAL_RATE)
+
+    async def test_opened_stream_is_a_success(self):
+        crs = _StreamingSolver()
+        crs.rate_controller = AimdRateController()
+        registry = CircuitBreakerRegistry(failure_threshold=2, reset_timeout=10.0)
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   streaming=True, error_policy=ErrorPolicy.SERVICE.with_circuit_breakers(registry))
+        registry.breaker('test.subject').record_failure()
+        cq.start()
+        await _wait_for(lambda: crs.streams)
+        await cq.stop_and_wait()
+        self.assertEqual(registry.breaker('test.subject').failures, 0)
+        self.assertGreater(crs.rate_controller.rates()['test.subject'], AimdRateController.DEFAULT_INITIAL_RATE)
+
+    async def test_error_policy_applies_to_pushed_errors(self):
+        crs = _StreamingSolver()
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   streaming=True, error_policy=ErrorPolicy.INTERACTIVE)
+        cq.start()
+        await _wait_for(lambda: crs.streams)
+        crs.streams[0].push([ValueResponse(address=Address('test.subject'), status=False,
+                                           error=ResponseError(code=2003, message='x', component_name='t'))])
+        with self.assertRaises(CommunicationRuntimeError):
+            await asyncio.wait_for(cq.get_response(), 1.0)
+        await _wait_for(lambda: cq.is_stopped())
+        self.assertTrue(cq.is_stopped())
+
+    async def test_stream_closed_by_server_is_reopened(self):
+        crs = _StreamingSolver()
+        policy = ErrorPolicy.SERVICE.with_overrides(
+            normal=SeverityRule(action=SeverityAction.RETRY, backoff=Backoff.fixed(0.01)))
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   streaming=True, error_policy=policy)
+        cq.start()
+        await _wait_for(lambda: crs.streams)
+        crs.streams[0].push([_ok(5.0)])
+        await asyncio.wait_for(cq.get_response(), 1.0)
+        crs.streams[0].push(CommunicationRuntimeError(message='closed by the server'))
+        await _wait_for(lambda: len(crs.streams) == 2)
+        crs.streams[1].push([_ok(6.0)])
+        resp = await asyncio.wait_for(cq.get_response(), 1.0)
+        await cq.stop_and_wait()
+        self.assertEqual(resp[0].value.v, 6.0)
+        self.assertTrue(crs.streams[0].closed)
+        self.assertEqual(crs.streams[1].requests[0].request_data['time_of_known_change'], 5.0)
+
+    async def test_stream_closed_by_server_stops_interactive_query(self):
+        crs = _StreamingSolver()
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   streaming=True, error_policy=ErrorPolicy.INTERACTIVE)
+        cq.start()
+        await _wait_for(lambda: crs.streams)
+        crs.streams[0].push(CommunicationRuntimeError(message='closed by the server'))
+        with self.assertRaises(CommunicationRuntimeError):
+            await asyncio.wait_for(cq.get_response(), 1.0)
+        await _wait_for(lambda: cq.is_stopped())
+        self.assertEqual(len(crs.streams), 1)
+
+    async def test_falls_back_to_long_poll_without_streaming_support(self):
+
+        class _LongPollSolver:
+            def __init__(self):
+                self.calls = 0
+
+            async def send_request(self, requests, timeout=None, no_wait=False):
+                self.calls += 1
+                await asyncio.sleep(0.001)
+                return [_ok(float(self.calls))]
+
+        crs = _LongPollSolver()
+        cq = ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=0.01,
+                                   streaming=True)
+        cq.start()
+        resp = await asyncio.wait_for(cq.get_response(), 1.0)
+        await cq.stop_and_wait()
+        self.assertTrue(resp[0].status)
+        self.assertGreaterEqual(crs.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,19 +5,28 @@ ErrorPolicy) and presets. Cycle-query integration is tested separately
 in test_cycle_query_error_policy.py.
 """
 
+import asyncio
+import random
 import time
 import unittest
+from unittest.mock import patch
 
 from obcom.comunication.error_policy import (
     Backoff,
     Budget,
+    CircuitBreakerRegistry,
+    CircuitState,
     ErrorPolicy,
     LogPolicy,
+    RetryLimiter,
+    RetryThrottle,
     SeverityAction,
     SeverityRule,
     _LogPolicyState,
 )
+from obcom.comunication.comunication_error import CircuitOpenError
 from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value_call import ValueResponse
 
 
 class TestBackoff(unittest.TestCase):
@@ -71,6 +80,213 @@ class TestBackoff(unittest.TestCase):
         self.assertEqual(bo.delay(99), 5.0)
 
 
+class TestJitterBackoff(unittest.TestCase):
+    def setUp(self):
+        random.seed(1234)
+
+    def test_full_jitter_stays_within_base_delay(self):
+        bo = Backoff.full_jitter(Backoff.exponential(initial=1.0, ceiling=8.0))
+        for attempt in range(1, 10):
+            delays = [bo.delay(attempt) for _ in range(50)]
+            cap = min(2.0 ** (attempt - 1), 8.0)
+            self.assertTrue(all(0.0 <= d <= cap for d in delays))
+            # not a constant schedule any more
+            self.assertGreater(max(delays) - min(delays), cap / 4)
+
+    def test_full_jitter_of_immediate_is_zero(self):
+        self.assertEqual(Backoff.full_jitter(Backoff.immediate()).delay(5), 0.0)
+
+    def test_decorrelated_jitter_grows_from_previous_delay(self):
+        bo = Backoff.decorrelated_jitter(initial=1.0, ceiling=30.0)
+        previous = None
+        for attempt in range(1, 30):
+            d = bo.next_delay(attempt, previous)
+            low = 1.0
+            high = min(30.0, 3 * (previous if previous is not None else 1.0))
+            self.assertGreaterEqual(d, low)
+            self.assertLessEqual(d, high)
+            previous = d
+        # first step without history
+        self.assertTrue(1.0 <= bo.delay(1) <= 3.0)
+
+    def test_stateless_backoffs_ignore_previous(self):
+        bo = Backoff.staged([(2.0, 3), (10.0, None)])
+        self.assertEqual(bo.next_delay(4, 2.0), 10.0)
+
+
+class TestRetryLimiter(unittest.TestCase):
+    def test_burst_then_steady_rate(self):
+        now = [100.0]
+        with patch('obcom.comunication.error_policy.time.monotonic', side_effect=lambda: now[0]):
+            limiter = RetryLimiter(rate=10.0, burst=3)
+            waits = [limiter.reserve() for _ in range(6)]
+            self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+            # queued retries are spread 1/rate apart
+            self.assertAlmostEqual(waits[3], 0.1)
+            self.assertAlmostEqual(waits[4], 0.2)
+            self.assertAlmostEqual(waits[5], 0.3)
+            now[0] += 1.0
+            # refill never exceeds the burst
+            self.assertEqual([limiter.reserve() for _ in range(2)], [0.0, 0.0])
+
+    def test_release_returns_token(self):
+        with patch('obcom.comunication.error_policy.time.monotonic', return_value=0.0):
+            limiter = RetryLimiter(rate=1.0, burst=1)
+            self.assertEqual(limiter.reserve(), 0.0)
+            self.assertEqual(limiter.reserve(), 1.0)
+            limiter.release()
+            self.assertEqual(limiter.reserve(), 1.0)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            RetryLimiter(rate=0)
+        with self.assertRaises(ValueError):
+            RetryLimiter(rate=1.0, burst=0)
+
+    def test_shared_is_one_instance(self):
+        self.assertIs(RetryLimiter.shared(), RetryLimiter.shared())
+
+
+class TestRetryThrottle(unittest.TestCase):
+    def test_suppresses_below_half_and_recovers_by_successes(self):
+        throttle = RetryThrottle(max_tokens=10, token_ratio=0.5, suppressed_delay=3.0)
+        # 10 -> 6 tokens, every failure retried
+        self.assertEqual([throttle.retry() for _ in range(4)], [True] * 4)
+        self.assertFalse(throttle.retry())  # 5 tokens, at half
+        self.assertTrue(throttle.is_suppressing())
+        self.assertEqual(throttle.retry_delay(1.0), 3.0)
+        self.assertEqual((throttle.retries, throttle.suppressed), (4, 2))
+        for _ in range(5):
+            throttle.record_success()
+        self.assertAlmostEqual(throttle.tokens, 6.5)
+        self.assertEqual(throttle.retry_delay(1.0), 1.0)
+
+    def test_tokens_bounded(self):
+        throttle = RetryThrottle(max_tokens=2, token_ratio=1.0)
+        for _ in range(5):
+            throttle.retry()
+        self.assertEqual(throttle.tokens, 0.0)
+        for _ in range(5):
+            throttle.record_success()
+        self.assertEqual(throttle.tokens, 2.0)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            RetryThrottle(max_tokens=0)
+        with self.assertRaises(ValueError):
+            RetryThrottle(token_ratio=0)
+        with self.assertRaises(ValueError):
+            RetryThrottle(suppressed_delay=-1)
+
+    def test_shared_is_one_instance(self):
+        self.assertIs(RetryThrottle.shared(), RetryThrottle.shared())
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    @staticmethod
+    def _error(addr, severity=ResponseError.SEVERITY_NORMAL, code=2003):
+        return ValueResponse(address=addr, value=None, status=False,
+                             error=ResponseError(code=code, message='err', severity=severity, component_name='test'))
+
+    def test_opens_after_threshold_then_single_probe(self):
+        now = [100.0]
+        with patch('obcom.comunication.error_policy.time.monotonic', side_effect=lambda: now[0]):
+            registry = CircuitBreakerRegistry(failure_threshold=3, reset_timeout=10.0, key_depth=2)
+            for _ in range(3):
+                registry.record(registry.check(['dev.mount.ra']), [self._error('dev.mount.ra')])
+            # the failures of one address open the circuit of its whole prefix
+            self.assertEqual(registry.states(), {'dev.mount': CircuitState.OPEN})
+            with self.assertRaises(CircuitOpenError) as cm:
+                registry.check(['dev.mount.dec'])
+            self.assertAlmostEqual(cm.exception.retry_after, 10.0)
+            now[0] += 10.0
+            probe = registry.check(['dev.mount.dec'])
+            self.assertEqual(registry.breaker('dev.mount').state, CircuitState.HALF_OPEN)
+            # only one probe at a time
+            with self.assertRaises(CircuitOpenError):
+                registry.check(['dev.mount.ra'])
+            registry.record(probe, [self._error('dev.mount.dec')])
+            self.assertEqual(registry.breaker('dev.mount').state, CircuitState.OPEN)
+            now[0] += 10.0
+            registry.record(registry.check(['dev.mount.ra']),
+                            [self._error('dev.mount.ra', code=4004)])  # long-poll expiry, the device answers
+            self.assertEqual(registry.breaker('dev.mount').state, CircuitState.CLOSED)
+            self.assertEqual(registry.breaker('dev.mount').failures, 0)
+
+    def test_timeout_and_abandoned_probe(self):
+        now = [0.0]
+        with patch('obcom.comunication.error_policy.time.monotonic', side_effect=lambda: now[0]):
+            registry = CircuitBreakerRegistry(failure_threshold=1, reset_timeout=1.0)
+            registry.record_timeout(registry.check(['dev.a']))
+            self.assertEqual(registry.breaker('dev.a').state, CircuitState.OPEN)
+            now[0] += 1.0
+            registry.abandon(registry.check(['dev.a']))
+            # the probe got no outcome, the next request probes at once
+            self.assertEqual(registry.breaker('dev.a').state, CircuitState.OPEN)
+            registry.check(['dev.a'])
+            self.assertEqual(registry.breaker('dev.a').state, CircuitState.HALF_OPEN)
+
+    def test_failure_severities(self):
+        registry = CircuitBreakerRegistry(failure_threshold=1)
+        registry.record(registry.check(['dev.a']), [self._error('dev.a', ResponseError.SEVERITY_CRITICAL)])
+        self.assertEqual(registry.breaker('dev.a').state, CircuitState.CLOSED)
+        # a check of several circuits which fails does not leave the allowed ones half-open
+        registry.record(registry.check(['dev.b']), [self._error('dev.b')])
+        with self.assertRaises(CircuitOpenError):
+            registry.check(['dev.a', 'dev.b'])
+
+    def test_keys(self):
+        registry = CircuitBreakerRegistry(key_depth=2, prefixes=['dev.mount', 'dev.mount.axis'])
+        self.assertEqual(registry.key_for('dev.mount.axis.ra'), 'dev.mount.axis')
+        self.assertEqual(registry.key_for('dev.mount.ra'), 'dev.mount')
+        self.assertEqual(registry.key_for('dev.mountain.x'), 'dev.mountain')
+        self.assertEqual(registry.key_for('dev'), 'dev')
+        self.assertEqual(CircuitBreakerRegistry().key_for('dev.mount.ra'), 'dev.mount.ra')
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            CircuitBreakerRegistry(failure_threshold=0)
+        with self.assertRaises(ValueError):
+            CircuitBreakerRegistry(reset_timeout=0)
+        with self.assertRaises(ValueError):
+            CircuitBreakerRegistry(key_depth=0)
+
+
+class TestCircuitBreakerAcquire(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def _registry(reset_timeout: float) -> CircuitBreakerRegistry:
+        return CircuitBreakerRegistry(failure_threshold=1, reset_timeout=reset_timeout, key_depth=1)
+
+    async def test_no_probe_taken_while_another_circuit_refuses(self):
+        registry = self._registry(0.01)
+        registry.record_timeout(registry.check(['a.x']))
+        await asyncio.sleep(0.02)
+        # `a` may be probed, `b` was opened just now
+        registry.record_timeout(registry.check(['b.x']))
+        registry.breaker('b').reset_timeout = 10.0
+        waiter = asyncio.create_task(registry.acquire(['a.x', 'b.x']))
+        await asyncio.sleep(0.02)
+        self.assertEqual(registry.states(), {'a': CircuitState.OPEN, 'b': CircuitState.OPEN})
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        # another subscriber of `a` is not held by the cancelled multi-request
+        self.assertTrue(registry.breaker('a').ready())
+        registry.check(['a.y'])
+        self.assertEqual(registry.breaker('a').state, CircuitState.HALF_OPEN)
+
+    async def test_lost_probe_expires(self):
+        registry = self._registry(0.05)
+        registry.record_timeout(registry.check(['a.x']))
+        await asyncio.sleep(0.06)
+        registry.check(['a.x'])  # the probe never gets an outcome
+        start = asyncio.get_running_loop().time()
+        breakers = await asyncio.wait_for(registry.acquire(['a.y']), 1.0)
+        self.assertGreaterEqual(asyncio.get_running_loop().time() - start, 0.04)
+        self.assertEqual(registry.breaker('a').state, CircuitState.HALF_OPEN)
+        registry.record(breakers, [])
+
 class TestBudget(unittest.TestCase):
     def test_unbounded_never_exhausted(self):
         b = Budget()
@@ -163,6 +379,26 @@ class TestErrorPolicy(unittest.TestCase):
         delays = [policy.normal.backoff.delay(n) for n in (1, 4, 10)]
         self.assertEqual(delays, [2.0, 10.0, 60.0])
 
+    def test_with_retry_limiter(self):
+        limiter = RetryLimiter(rate=5.0)
+        policy = ErrorPolicy.SERVICE.with_retry_limiter(limiter)
+        self.assertIs(policy.retry_limiter, limiter)
+        self.assertIs(policy.normal, ErrorPolicy.SERVICE.normal)
+        self.assertIsNone(ErrorPolicy.SERVICE.retry_limiter)
+
+    def test_with_retry_throttle(self):
+        throttle = RetryThrottle()
+        policy = ErrorPolicy.SERVICE.with_retry_throttle(throttle)
+        self.assertIs(policy.retry_throttle, throttle)
+        self.assertIsNone(ErrorPolicy.SERVICE.retry_throttle)
+
+    def test_with_circuit_breakers(self):
+        registry = CircuitBreakerRegistry()
+        policy = ErrorPolicy.SERVICE.with_circuit_breakers(registry)
+        self.assertIs(policy.circuit_breakers, registry)
+        self.assertIsNone(policy.with_circuit_breakers(None).circuit_breakers)
+        self.assertIsNone(ErrorPolicy.SERVICE.circuit_breakers)
+
     def test_fail_fast_preset_has_bounded_temporary(self):
         policy = ErrorPolicy.FAIL_FAST
         self.assertIsNotNone(policy.temporary.budget)
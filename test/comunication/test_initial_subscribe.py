@@ -0,0 +1,68 @@
+"""Tests of the subscriptions returning the current value from their first response and resuming from a cache."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from test.comunication.test_runtime_requests import _LongPollSolver
+from test.comunication.test_subscription_hub import _StubClientAPI
+
+
+class TestInitialSubscribe(unittest.IsolatedAsyncioTestCase):
+
+    async def test_initial_value_in_one_request(self):
+        crs = _LongPollSolver(a=1)
+        api = _StubClientAPI(crs)
+        cq = await api.subscribe('test.a', delay=0.01, initial=True)
+        self.assertEqual(cq.current_response[0].value.v, 1)
+        self.assertEqual(crs.sent, [{'test.a': None}])
+        # a consumer created right after the call gets the next change, continued from the first response
+        with cq.iterate() as updates:
+            crs.set('a', 2)
+            response = await asyncio.wait_for(updates.get(), 1.0)
+        self.assertEqual(response[0].value.v, 2)
+        self.assertEqual(crs.sent[1], {'test.a': 1.0})
+        await cq.stop_and_wait()
+
+    async def test_resume_from_cached_value(self):
+        crs = _LongPollSolver(a=1)
+        api = _StubClientAPI(crs)
+        cached = ValueResponse(address='test.a', value=Value(v=1, ts=1.0, tags={'from_cf': True}), status=True)
+        cq = await api.subscribe('test.a', delay=0.01, initial=True, resume_from=cached)
+        # returned at once, the cached value is not transferred again
+        self.assertEqual(cq.current_response, [cached])
+        await asyncio.sleep(0.03)
+        self.assertEqual(crs.sent, [{'test.a': 1.0}])
+        crs.set('a', 2)
+        response = await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(response[0].value.v, 2)
+        await cq.stop_and_wait()
+        with self.assertRaises(ValueError):
+            await api.subscribe('test.a', shared=True, resume_from=cached)
+
+    async def test_shared_late_joiner_gets_current_value(self):
+        crs = _LongPollSolver(a=1)
+        api = _StubClientAPI(crs)
+        first = await api.subscribe('test.a', delay=0.01, shared=True, initial=True)
+        self.assertEqual(first.current_response[0].value.v, 1)
+        await asyncio.sleep(0.03)
+        sent = len(crs.sent)
+        late = await asyncio.wait_for(api.subscribe('test.a', delay=0.01, shared=True, initial=True), 1.0)
+        self.assertEqual(late.current_response[0].value.v, 1)
+        self.assertEqual(len(crs.sent), sent)
+        await api.subscription_hub.close()
+
+    async def test_invalid_resume_point(self):
+        cq = ConditionalCycleQuery(crs=_LongPollSolver(a=1), list_request=[ValueRequest(address='test.a')],
+                                   delay=0.01)
+        other = ValueResponse(address='test.b', value=Value(v=1, ts=1.0), status=True)
+        with self.assertRaises(ValueError):
+            cq.set_resume_point([other])
+        with self.assertRaises(ValueError):
+            cq.set_resume_point([])
+
+
+if __name__ == '__main__':
+    unittest.main()
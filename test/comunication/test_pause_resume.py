@@ -0,0 +1,139 @@
+"""Tests of live delay changes and pause/resume of cycle queries."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.cycle_query import ConditionalCycleQuery, CycleQueryState, PeriodicCycleQuery
+from obcom.comunication.periodic_scheduler import PeriodicScheduler
+from obcom.comunication.subscription_manager import SubscriptionManager
+from obcom.data_colection.value_call import ValueRequest
+from test.comunication.test_periodic_schedule import _LatencySolver
+from test.comunication.test_periodic_scheduler import _BatchSolver
+from test.comunication.test_runtime_requests import _LongPollSolver, _cq
+
+
+def _periodic(crs, delay, **kwargs):
+    return PeriodicCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=delay, **kwargs)
+
+
+class TestPauseResume(unittest.IsolatedAsyncioTestCase):
+
+    async def test_conditional_resumes_from_known_change(self):
+        crs = _LongPollSolver(a=1)
+        cq = _cq(crs, 'a')
+        received = []
+        cq.add_callback_method(lambda responses: received.append(responses[0].value.v))
+        cq.start()
+        await asyncio.sleep(0.03)
+        cq.pause()
+        self.assertEqual(cq.state, CycleQueryState.PAUSED)
+        await asyncio.sleep(0.01)
+        # the waiting long-poll was abandoned and nothing is sent while paused
+        self.assertEqual(crs.cancelled, 1)
+        sent = len(crs.sent)
+        crs.set('a', 2)
+        await asyncio.sleep(0.03)
+        self.assertEqual(len(crs.sent), sent)
+        self.assertEqual(received, [1])
+        cq.resume()
+        self.assertEqual(cq.state, CycleQueryState.RUNNING)
+        await asyncio.sleep(0.03)
+        self.assertEqual(received, [1, 2])
+        # resumed with the conditional state, not a full transfer
+        self.assertEqual(crs.sent[sent], {'test.a': 1.0})
+        await cq.stop_and_wait()
+
+    async def test_set_delay_of_running_periodic_query(self):
+        crs = _LatencySolver(latency=0.0)
+        cq = _periodic(crs, delay=0.1)
+        cq.start()
+        await asyncio.sleep(0.15)
+        sent = len(crs.sent_loop)
+        cq.set_delay(0.01)
+        await asyncio.sleep(0.1)
+        # the pending 0.1 s wait was shortened, ~10 requests at the new delay
+        self.assertGreater(len(crs.sent_loop) - sent, 6)
+        self.assertEqual(cq.get_delay(), 0.01)
+        self.assertEqual(cq.tick_stats.period, 0.01)
+        with self.assertRaises(ValueError):
+            cq.set_delay(0)
+        await cq.stop_and_wait()
+
+    async def test_paused_periodic_query_polls_at_once_on_resume(self):
+        crs = _LatencySolver(latency=0.0)
+        cq = _periodic(crs, delay=0.02)
+        cq.start()
+        await asyncio.sleep(0.05)
+        cq.pause()
+        await asyncio.sleep(0.03)
+        sent = len(crs.sent_loop)
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(crs.sent_loop), sent)
+        cq.resume()
+        await asyncio.sleep(0.005)
+        self.assertEqual(len(crs.sent_loop), sent + 1)
+        await asyncio.sleep(0.05)
+        # no burst of the ticks missed while paused
+        self.assertLessEqual(len(crs.sent_loop), sent + 4)
+        await cq.stop_and_wait()
+
+    async def test_scheduled_query_leaves_tick(self):
+        crs = _BatchSolver()
+        scheduler = PeriodicScheduler(crs=crs)
+        cq = _periodic(crs, delay=0.02, scheduler=scheduler)
+        cq.start()
+        await asyncio.wait_for(cq.get_response(), 1.0)
+        cq.set_delay(0.03)
+        await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(scheduler.periods(), [0.03])
+        cq.pause()
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.periods(), [])
+        cq.resume()
+        await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(scheduler.members_count(0.03), 1)
+        await cq.stop_and_wait()
+        await scheduler.close()
+
+    async def test_paused_before_start(self):
+        crs = _LatencySolver(latency=0.0)
+        cq = _periodic(crs, delay=0.01)
+        cq.pause()
+        cq.start()
+        await asyncio.sleep(0.05)
+        self.assertEqual(cq.state, CycleQueryState.PAUSED)
+        self.assertEqual(crs.sent_loop, [])
+        await cq.stop_and_wait()
+        self.assertEqual(cq.state, CycleQueryState.STOPPED)
+
+    async def test_manager_pauses_by_name(self):
+        manager = SubscriptionManager()
+        # the manager keeps weak references only
+        hidden = [manager.register(ConditionalCycleQuery(crs=_LongPollSolver(a=1),
+                                                         list_request=[ValueRequest(address='test.a')],
+                                                         query_name='hidden_tab'))
+                  for _ in range(3)]
+        shown = manager.register(_cq(_LongPollSolver(a=1), 'a'))
+        manager.start_all()
+        await asyncio.sleep(0)
+        manager.pause_all('hidden_tab')
+        self.assertEqual(manager.health()['paused'], len(hidden))
+        self.assertEqual(shown.state, CycleQueryState.RUNNING)
+        manager.resume_all()
+        self.assertEqual(manager.health()['running'], 4)
+        await manager.stop_all_and_wait()
+
+    async def test_manager_stops_paused_queries(self):
+        manager = SubscriptionManager()
+        queries = [manager.register(_cq(_LongPollSolver(a=1), 'a')) for _ in range(2)]
+        manager.start_all()
+        await asyncio.sleep(0)
+        manager.pause_all()
+        self.assertEqual(manager.health()['paused'], 2)
+        await manager.stop_all_and_wait()
+        self.assertEqual(manager.count(CycleQueryState.STOPPED), 2)
+        self.assertTrue(all(q.is_stopped() for q in queries))
+
+
+if __name__ == '__main__':
+    unittest.main()
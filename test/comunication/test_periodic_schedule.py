@@ -0,0 +1,99 @@
+"""Tests of the fixed-phase monotonic schedule of PeriodicCycleQuery."""
+
+import asyncio
+import time
+import unittest
+
+from obcom.comunication.cycle_query import MissedTickPolicy, PeriodicCycleQuery
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+
+class _LatencySolver:
+    """Answers after ``latency`` seconds (``first_latency`` for the first request) and records send times."""
+
+    def __init__(self, latency: float, first_latency: float = None):
+        self.latency = latency
+        self.first_latency = latency if first_latency is None else first_latency
+        self.sent_loop = []
+        self.sent_wall = []
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.sent_loop.append(asyncio.get_running_loop().time())
+        self.sent_wall.append(time.time())
+        await asyncio.sleep(self.first_latency if len(self.sent_loop) == 1 else self.latency)
+        return [ValueResponse(address=r.address, value=Value(v=1, ts=0.0), status=True) for r in requests]
+
+
+def _periodic(crs, delay, **kwargs):
+    return PeriodicCycleQuery(crs=crs, list_request=[ValueRequest(address='test.subject')], delay=delay, **kwargs)
+
+
+async def _run(cq, seconds):
+    cq.start()
+    await asyncio.sleep(seconds)
+    await cq.stop_and_wait()
+
+
+class TestPeriodicSchedule(unittest.IsolatedAsyncioTestCase):
+
+    async def test_period_does_not_drift_by_round_trip(self):
+        crs = _LatencySolver(latency=0.01)
+        cq = _periodic(crs, delay=0.03)
+        await _run(cq, 0.35)
+        first = crs.sent_loop[0]
+        # every request is on the grid anchored at the first one, the round trip is not accumulated
+        for n, sent in enumerate(crs.sent_loop):
+            self.assertAlmostEqual(sent - first, n * 0.03, delta=0.012)
+        stats = cq.tick_stats
+        self.assertEqual(stats.period, 0.03)
+        self.assertAlmostEqual(stats.mean_period, 0.03, delta=0.004)
+        self.assertEqual(stats.missed_ticks, 0)
+        self.assertEqual(stats.ticks, len(crs.sent_loop))
+
+    async def test_skip_missed_ticks(self):
+        crs = _LatencySolver(latency=0.05)
+        cq = _periodic(crs, delay=0.02)
+        await _run(cq, 0.3)
+        stats = cq.tick_stats
+        self.assertGreater(stats.missed_ticks, 0)
+        # requests keep to the grid: every interval is a multiple of the period
+        for a, b in zip(crs.sent_loop, crs.sent_loop[1:]):
+            self.assertAlmostEqual(round((b - a) / 0.02) * 0.02, b - a, delta=0.01)
+
+    async def test_catch_up_sends_missed_ticks(self):
+        crs = _LatencySolver(latency=0.0, first_latency=0.1)
+        cq = _periodic(crs, delay=0.02, missed_tick_policy=MissedTickPolicy.CATCH_UP)
+        cq.start()
+        await asyncio.sleep(0.02 + 0.1 + 0.015)
+        # the ticks missed during the slow first request were sent right after it
+        self.assertGreaterEqual(len(crs.sent_loop), 5)
+        self.assertLess(crs.sent_loop[4] - crs.sent_loop[1], 0.01)
+        self.assertEqual(cq.tick_stats.missed_ticks, 0)
+        await cq.stop_and_wait()
+
+    async def test_catch_up_is_limited(self):
+        crs = _LatencySolver(latency=0.0, first_latency=0.1)
+        cq = _periodic(crs, delay=0.005, missed_tick_policy=MissedTickPolicy.CATCH_UP)
+        cq.MAX_CATCH_UP_TICKS = 3
+        await _run(cq, 0.12)
+        self.assertGreater(cq.tick_stats.missed_ticks, 10)
+
+    async def test_report_logs_skipped_ticks(self):
+        crs = _LatencySolver(latency=0.05)
+        cq = _periodic(crs, delay=0.02, missed_tick_policy=MissedTickPolicy.REPORT)
+        with self.assertLogs('cycle_query', level='WARNING') as logs:
+            await _run(cq, 0.15)
+        self.assertTrue(any('tick(s) skipped' in line for line in logs.output))
+
+    async def test_align_to_wall_clock(self):
+        crs = _LatencySolver(latency=0.0)
+        cq = _periodic(crs, delay=0.05, align_to_wall_clock=True)
+        await _run(cq, 0.18)
+        for sent in crs.sent_wall:
+            phase = sent % 0.05
+            self.assertLess(min(phase, 0.05 - phase), 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Tests of PeriodicScheduler — periodic cycle queries sharing one tick and one request."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.comunication_error import CommunicationRuntimeError, CommunicationTimeoutError
+from obcom.comunication.cycle_query import PeriodicCycleQuery
+from obcom.comunication.periodic_scheduler import PeriodicScheduler
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from test.comunication.test_subscription_hub import _StubClientAPI
+
+
+class _BatchSolver:
+    """Answers every request with its address as value and records the size of every batch."""
+
+    def __init__(self):
+        self.batches = []
+        self.fail_with = None
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.batches.append(len(requests))
+        await asyncio.sleep(0.001)
+        if self.fail_with is not None:
+            raise self.fail_with
+        return [ValueResponse(address=r.address, value=Value(v=str(r.address), ts=0.0), status=True)
+                for r in requests]
+
+
+def _periodic(scheduler, address, delay=0.02):
+    return PeriodicCycleQuery(crs=scheduler.crs, list_request=[ValueRequest(address=address)], delay=delay,
+                              scheduler=scheduler)
+
+
+class TestPeriodicScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_period_is_sent_in_one_request_per_tick(self):
+        crs = _BatchSolver()
+        scheduler = PeriodicScheduler(crs=crs)
+        received = {}
+        queries = []
+        for i in range(50):
+            cq = _periodic(scheduler, f'test.subject_{i}')
+            cq.add_callback_method(lambda resp, i=i: received.setdefault(i, []).append(resp[0].value.v))
+            queries.append(cq)
+        for cq in queries:
+            cq.start()
+        await asyncio.sleep(0.1)
+        batches = list(crs.batches)
+        for cq in queries:
+            await cq.stop_and_wait()
+        # ~5 ticks, each one request with all 50 addresses
+        self.assertTrue(all(size == 50 for size in batches))
+        self.assertLessEqual(len(batches), 7)
+        self.assertEqual(len(received), 50)
+        for i, values in received.items():
+            self.assertGreaterEqual(len(values), 2)
+            self.assertTrue(all(v == f'test.subject_{i}' for v in values))
+        self.assertEqual(scheduler.periods(), [])
+
+    async def test_different_periods_have_separate_ticks(self):
+        crs = _BatchSolver()
+        scheduler = PeriodicScheduler(crs=crs)
+        fast = [_periodic(scheduler, f'test.fast_{i}', delay=0.02) for i in range(3)]
+        slow = [_periodic(scheduler, f'test.slow_{i}', delay=0.5) for i in range(2)]
+        for cq in fast + slow:
+            cq.start()
+        await asyncio.sleep(0)
+        self.assertEqual(sorted(scheduler.periods()), [0.02, 0.5])
+        self.assertEqual(scheduler.members_count(0.02), 3)
+        await fast[0].stop_and_wait()
+        self.assertEqual(scheduler.members_count(), 4)
+        await scheduler.close()
+        for cq in fast + slow:
+            await cq.stop_and_wait()
+
+    async def test_max_batch_size_splits_tick(self):
+        crs = _BatchSolver()
+        scheduler = PeriodicScheduler(crs=crs, max_batch_size=4)
+        queries = [_periodic(scheduler, f'test.subject_{i}') for i in range(10)]
+        for cq in queries:
+            cq.start()
+        await asyncio.wait_for(queries[-1].get_response(), 1.0)
+        self.assertEqual(crs.batches[:3], [4, 4, 2])
+        await scheduler.close()
+        for cq in queries:
+            await cq.stop_and_wait()
+
+    async def test_errors_are_handled_by_each_query(self):
+        crs = _BatchSolver()
+        crs.fail_with = CommunicationTimeoutError(message='router down')
+        scheduler = PeriodicScheduler(crs=crs)
+        queries = [PeriodicCycleQuery(crs=crs, list_request=[ValueRequest(address=f'test.subject_{i}')], delay=0.01,
+                                      scheduler=scheduler, max_missed_msg=2) for i in range(3)]
+        for cq in queries:
+            cq.start()
+        for cq in queries:
+            with self.assertRaises(CommunicationRuntimeError):
+                await asyncio.wait_for(cq.get_response(), 1.0)
+        await asyncio.sleep(0)
+        self.assertTrue(all(cq.is_stopped() for cq in queries))
+        self.assertEqual(scheduler.periods(), [])
+
+    async def test_client_api_shared_tick(self):
+        crs = _BatchSolver()
+        api = _StubClientAPI(crs)
+        a = await api.send_cycle_multipart('test.a', delay=0.02, shared_tick=True)
+        b = await api.send_cycle_multipart('test.b', delay=0.02, shared_tick=True)
+        a.start()
+        b.start()
+        resp = await asyncio.wait_for(b.get_response(), 1.0)
+        self.assertEqual(resp[0].value.v, 'test.b')
+        self.assertEqual(crs.batches[0], 2)
+        await api.subscription_manager.stop_all_and_wait()
+
+
+if __name__ == '__main__':
+    unittest.main()
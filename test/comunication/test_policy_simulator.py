@@ -0,0 +1,85 @@
+"""Tests of the offline error policy simulator."""
+
+import time
+import unittest
+
+from obcom.comunication.error_policy import ErrorPolicy, RetryLimiter
+from obcom.comunication.policy_simulator import Outage, PolicySimulator
+from obcom.comunication.rate_control import AimdRateController
+from obcom.data_colection.response_error import ResponseError
+
+
+class TestPolicySimulator(unittest.TestCase):
+
+    def test_long_outage_runs_in_virtual_time(self):
+        simulator = PolicySimulator(ErrorPolicy.SERVICE, queries=20, duration=3 * 3600, change_interval=60,
+                                    outages=[Outage(start=600, end=2 * 3600, severity=ResponseError.SEVERITY_NORMAL)])
+        start = time.perf_counter()
+        report = simulator.run()
+        self.assertLess(time.perf_counter() - start, 10.0)
+        self.assertEqual(report.stopped, 0)
+        # SERVICE backs off to one retry a minute: ~100 retries per query, all queries in lockstep
+        self.assertGreater(report.retries, 20 * 90)
+        self.assertLess(report.retries, 20 * 130)
+        self.assertEqual(report.peak_retry_rate, 20)
+        # recovered within the last backoff step
+        self.assertIsNotNone(report.recovery_times[0])
+        self.assertLessEqual(report.recovery_times[0], 60.0 + 1.0)
+        self.assertGreater(report.warning_lines, 0)
+        self.assertEqual(report.error_callbacks, 0)
+        self.assertIn('time to recover', report.summary())
+
+    def test_stopping_policy(self):
+        report = PolicySimulator(ErrorPolicy.INTERACTIVE, queries=5, duration=600,
+                                 outages=[Outage(start=100, end=200, severity=ResponseError.SEVERITY_NORMAL)]).run()
+        self.assertEqual(report.stopped, 5)
+        self.assertEqual(report.error_callbacks, 5)
+        self.assertEqual(report.recovery_times, [None])
+
+    def test_router_down(self):
+        simulator = PolicySimulator(ErrorPolicy.SERVICE, queries=10, duration=1800, request_timeout=5.0,
+                                    change_interval=20, outages=[Outage(start=300, end=900, timeout=True)])
+        report = simulator.run()
+        # a request times out every request_timeout and is sent again at once
+        self.assertGreater(report.retries, 10 * 600 / 5.0 * 0.9)
+        self.assertLess(report.recovery_times[0], 5.0 + 1.0)
+
+    def test_retry_limiter_on_virtual_clock(self):
+        limiter = RetryLimiter(rate=1.0, burst=1)
+        simulator = PolicySimulator(ErrorPolicy.SERVICE.with_retry_limiter(limiter), queries=20, duration=1800,
+                                    outages=[Outage(start=300, end=900)])
+        report = simulator.run()
+        # the retries of all queries pass one token a second of the simulated time
+        self.assertLessEqual(report.peak_retry_rate, 2)
+        self.assertGreater(report.retries, 600 * 0.9)
+        self.assertIsNotNone(report.recovery_times[0])
+        # the simulation used a limiter of its own, the one of the application was not drawn from
+        self.assertEqual(limiter.reserve(), 0.0)
+
+    def test_rate_controller_on_virtual_clock(self):
+        controller = AimdRateController(initial_rate=5.0, max_rate=5.0, key_depth=1)
+        simulator = PolicySimulator(ErrorPolicy.SERVICE, queries=20, duration=600, change_interval=1,
+                                    rate_controller=controller)
+        report = simulator.run()
+        # 20 queries of values changing every second, paced to 5 requests per simulated second
+        self.assertLessEqual(report.requests, 600 * 5 + 20)
+        self.assertGreater(report.requests, 600 * 5 * 0.9)
+        self.assertEqual(controller.rates(), {})
+
+    def test_same_seed_same_simulation(self):
+        simulator = PolicySimulator(ErrorPolicy.SERVICE, queries=5, duration=900, change_interval=5,
+                                    latency=lambda rng: rng.expovariate(50.0),
+                                    outages=[Outage(start=100, end=300)])
+        first, second = simulator.run(), simulator.run()
+        self.assertEqual((first.requests, first.retries, first.callbacks),
+                         (second.requests, second.retries, second.callbacks))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            Outage(start=10, end=10)
+        with self.assertRaises(ValueError):
+            PolicySimulator(ErrorPolicy.SERVICE, queries=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+"""Tests of the AIMD congestion control of the request rate."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.comunication.rate_control import AimdRateController
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from test.comunication.test_cycle_query_error_policy import StubRequestSolver, make_error_response, make_ok_response
+from test.comunication.test_subscription_hub import _StubClientAPI
+
+
+class _Clock:
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def _busy(address):
+    return ValueResponse(address=address, value=None, status=False,
+                         error=ResponseError(code=4008, message='busy', component_name='test'))
+
+
+class TestAimdRateController(unittest.TestCase):
+
+    def test_slots_spread_by_rate(self):
+        clock = _Clock(10.0)
+        controller = AimdRateController(initial_rate=10.0, key_depth=2, clock=clock)
+        waits = [controller.reserve([f'dev.mount.v{i}'])[0] for i in range(3)]
+        self.assertEqual(waits[0], 0.0)
+        self.assertAlmostEqual(waits[1], 0.1)
+        self.assertAlmostEqual(waits[2], 0.2)
+        # other endpoints have their own rate
+        self.assertEqual(controller.reserve(['dev.dome.az'])[0], 0.0)
+
+    def test_additive_increase_multiplicative_decrease(self):
+        clock = _Clock()
+        controller = AimdRateController(initial_rate=10.0, min_rate=2.0, increase=5.0, key_depth=1, clock=clock)
+        _, early = controller.reserve(['dev.a'])
+        _, late = controller.reserve(['dev.a'])
+        controller.record(late, [_busy('dev.a')])
+        self.assertEqual(controller.rates(), {'dev': 5.0})
+        # sent at the old rate, the same overload is not counted twice
+        controller.record_timeout(early)
+        self.assertEqual(controller.rates(), {'dev': 5.0})
+        clock.now += 1.0
+        _, slots = controller.reserve(['dev.a'])
+        controller.record(slots, [make_ok_response('dev.a')])
+        self.assertAlmostEqual(controller.rates()['dev'], 6.0)
+        for _ in range(5):
+            clock.now += 1.0
+            controller.record_timeout(controller.reserve(['dev.a'])[1])
+        self.assertEqual(controller.rates(), {'dev': 2.0})
+
+    def test_released_slots_are_taken_again(self):
+        clock = _Clock()
+        controller = AimdRateController(initial_rate=10.0, key_depth=1, clock=clock)
+        slots = [controller.reserve(['dev.a'])[1] for _ in range(3)]
+        # the last slot moves the next free one back, an earlier one is kept for the next request
+        controller.release(slots[2])
+        controller.release(slots[1])
+        self.assertAlmostEqual(controller.reserve(['dev.a'])[0], 0.1)
+        self.assertAlmostEqual(controller.reserve(['dev.a'])[0], 0.2)
+        self.assertAlmostEqual(controller.reserve(['dev.a'])[0], 0.3)
+        # a returned slot which already passed is not used
+        controller.release(controller.reserve(['dev.a'])[1])
+        controller.reserve(['dev.a'])
+        controller.release(slots[0])
+        clock.now = 1.0
+        self.assertEqual(controller.reserve(['dev.a'])[0], 0.0)
+
+    def test_overload_signals(self):
+        controller = AimdRateController()
+        temporary = make_error_response('dev.a', severity=ResponseError.SEVERITY_TEMPORARY)
+        expired = make_error_response('dev.a', code=4004)
+        self.assertTrue(controller.is_overload(temporary))
+        self.assertTrue(controller.is_overload(_busy('dev.a')))
+        self.assertTrue(controller.is_overload(expired))
+        # the expiry of a long-poll is no overload, and no success either
+        self.assertFalse(controller.is_overload(expired, long_poll=True))
+        self.assertFalse(controller.is_overload(make_error_response('dev.a')))
+        _, slots = controller.reserve(['dev.a'])
+        controller.record(slots, [expired], long_poll=True)
+        self.assertEqual(controller.rates()['dev.a'], controller.initial_rate)
+
+    def test_clients_settle_at_device_capacity(self):
+        # 50 clients polling one device able to answer 200 requests/s, the excess of every 10 ms is refused as busy
+        clock = _Clock()
+        capacity, tick = 200.0, 0.01
+        clients = [AimdRateController(initial_rate=20.0, max_rate=500.0, key_depth=1, clock=clock) for _ in range(50)]
+        totals = []
+        for _ in range(3000):
+            sent = []
+            for c in clients:
+                e = c.endpoint('dev.a')
+                while e._next_slot < clock.now + tick:
+                    sent.append((c, c.reserve(['dev.a'])[1]))
+            answered = 0
+            for c, slots in sent:
+                if answered < capacity * tick:
+                    answered += 1
+                    c.record(slots, [make_ok_response('dev.a')])
+                else:
+                    c.record(slots, [_busy('dev.a')])
+            totals.append(len(sent) / tick)
+            clock.now += tick
+        # after the first cut the offered load stays around the capacity, it neither collapses nor explodes
+        settled = totals[1000:]
+        average = sum(settled) / len(settled)
+        self.assertGreater(average, 0.7 * capacity)
+        self.assertLess(average, 1.5 * capacity)
+        self.assertLess(max(sum(settled[i:i + 100]) / 100 for i in range(0, len(settled), 100)), 2.0 * capacity)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            AimdRateController(initial_rate=0.5, min_rate=1.0)
+        with self.assertRaises(ValueError):
+            AimdRateController(increase=0)
+        with self.assertRaises(ValueError):
+            AimdRateController(decrease=1.0)
+
+
+class TestPacedRequests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_single_requests_paced_and_slowed_by_busy_device(self):
+        crs = StubRequestSolver([[_busy('dev.a')], [make_ok_response('dev.a')]])
+        crs.rate_controller = AimdRateController(initial_rate=40.0, key_depth=1)
+        api = _StubClientAPI(crs)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await api.get_async('dev.a', request_timeout=1.0)
+        self.assertEqual(crs.rate_controller.rates(), {'dev': 20.0})
+        await asyncio.gather(*(api.get_async('dev.a', request_timeout=1.0) for _ in range(4)))
+        # 1/40 s after the first one, then 1/20 s apart
+        self.assertGreater(loop.time() - start, 0.025 + 3 / 20 - 0.01)
+        self.assertEqual(crs.observed_call_count, 5)
+
+    async def test_cancelled_wait_gives_slot_back(self):
+        controller = AimdRateController(initial_rate=10.0, key_depth=1)
+        controller.reserve(['dev.a'])
+        waiter = asyncio.create_task(controller.acquire(['dev.a']))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        wait, _ = controller.reserve(['dev.a'])
+        self.assertAlmostEqual(wait, 0.09, delta=0.02)
+
+    async def test_subscriptions_of_endpoint_share_rate(self):
+        crs = StubRequestSolver([[make_ok_response(f'dev.v{i}', v=i)] for i in range(1000)])
+        crs.rate_controller = AimdRateController(initial_rate=50.0, max_rate=50.0, key_depth=1)
+        queries = [ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address=f'dev.v{i}')], delay=0.001)
+                   for i in range(4)]
+        for q in queries:
+            q.start()
+        await asyncio.sleep(0.2)
+        for q in queries:
+            await q.stop_and_wait()
+        # 4 queries answered at once, together paced to 50 requests/s
+        self.assertLessEqual(crs.observed_call_count, 0.2 * 50 + 2)
+        self.assertGreaterEqual(crs.observed_call_count, 0.2 * 50 - 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Tests of adding and removing requests of a running cycle query."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.comunication.subscription_manager import SubscriptionManager
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+
+
+class _LongPollSolver:
+    """
+    Conditional long-poll: answers at once if a requested value is newer than its `time_of_known_change`, otherwise
+    waits for a change (`set`). Records the addresses and `time_of_known_change` of every request.
+    """
+
+    def __init__(self, **values):
+        self.values = {f'test.{k}': (v, 1.0) for k, v in values.items()}
+        self.changed = asyncio.Event()
+        self.sent = []
+        self.cancelled = 0
+
+    def set(self, name, v):
+        address = f'test.{name}'
+        self.values[address] = (v, self.values.get(address, (None, 0.0))[1] + 1)
+        self.changed.set()
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.sent.append({str(r.address): r.request_data.get('time_of_known_change') for r in requests})
+        try:
+            while not any(self.values[str(r.address)][1] > (r.request_data.get('time_of_known_change') or 0)
+                          for r in requests):
+                self.changed.clear()
+                await self.changed.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return [ValueResponse(address=r.address, value=Value(v=self.values[str(r.address)][0],
+                                                             ts=self.values[str(r.address)][1],
+                                                             tags={'from_cf': True}), status=True)
+                for r in requests]
+
+
+def _cq(crs, *names):
+    return ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address=f'test.{n}') for n in names],
+                                 delay=0.01, request_timeout=5)
+
+
+class TestRuntimeRequests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_add_request_wakes_long_poll(self):
+        crs = _LongPollSolver(a=1, b=2)
+        cq = _cq(crs, 'a')
+        received = []
+        cq.add_callback_method(lambda responses: received.append([r.value.v for r in responses]))
+        cq.start()
+        await asyncio.sleep(0.05)
+        # the query is waiting in a long-poll for a change of `a`
+        self.assertEqual(received, [[1]])
+        cq.add_request(ValueRequest(address='test.b'))
+        await asyncio.sleep(0.05)
+        self.assertEqual(crs.cancelled, 1)
+        self.assertEqual(received, [[1], [1, 2]])
+        # `a` kept its conditional state, `b` had none
+        self.assertEqual(crs.sent[2], {'test.a': 1.0, 'test.b': None})
+        await cq.stop_and_wait()
+
+    async def test_remove_request_keeps_state_of_others(self):
+        crs = _LongPollSolver(a=1, b=2, c=3)
+        cq = _cq(crs, 'a', 'b', 'c')
+        cq.start()
+        await asyncio.sleep(0.05)
+        self.assertTrue(cq.remove_request('test.b'))
+        crs.set('c', 4)
+        response = await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual([(str(r.address), r.value.v) for r in response], [('test.a', 1), ('test.c', 4)])
+        self.assertEqual(crs.sent[-1], {'test.a': 1.0, 'test.c': 2.0})
+        await cq.stop_and_wait()
+
+    async def test_invalid_changes(self):
+        cq = _cq(_LongPollSolver(a=1), 'a')
+        with self.assertRaises(ValueError):
+            cq.add_request(ValueRequest(address='test.a'))
+        self.assertFalse(cq.remove_request('test.b'))
+        with self.assertRaises(ValueError):
+            cq.remove_request('test.a')
+
+    async def test_list_given_to_constructor_is_not_modified(self):
+        requests = [ValueRequest(address='test.a')]
+        cq = ConditionalCycleQuery(crs=_LongPollSolver(a=1, b=2), list_request=requests, delay=0.01)
+        cq.add_request(ValueRequest(address='test.b'))
+        self.assertEqual(len(requests), 1)
+        self.assertTrue(cq._list_request[1].cycle_query)
+
+    async def test_manager_follows_addresses(self):
+        manager = SubscriptionManager()
+        cq = manager.register(_cq(_LongPollSolver(a=1, b=2), 'a'))
+        cq.add_request(ValueRequest(address='test.b'))
+        self.assertEqual(manager.by_address('test.b'), [cq])
+        cq.remove_request('test.a')
+        self.assertEqual(manager.by_address('test.a'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,324 @@
+"""Tests for SubscriptionHub — shared, reference-counted subscriptions.
+
+A stub request solver answers every long-poll with a fresh value for
+each requested address, so the tests can count how many underlying
+queries actually talk to the "server" and what every consumer sees.
+"""
+
+import asyncio
+import unittest
+
+from obcom.comunication.base_client_api import BaseClientAPI
+from obcom.comunication.comunication_error import CommunicationRuntimeError
+from obcom.comunication.error_policy import ErrorPolicy
+from obcom.comunication.subscription_hub import SharedCycleQuery, SubscriptionHub
+from obcom.data_colection.address import Address
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.tree_user import TreeUser
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueResponse
+
+
+class _CountingSolver:
+    """Answers each request after ``latency`` seconds with a new value per address."""
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.calls = 0
+        self.addresses_per_call = []
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.calls += 1
+        self.addresses_per_call.append([str(r.address) for r in requests])
+        await asyncio.sleep(self.latency)
+        return [ValueResponse(address=r.address,
+                              value=Value(v=self.calls, ts=float(self.calls), tags={'from_cf': True}),
+                              status=True)
+                for r in requests]
+
+
+class _ErrorSolver:
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        await asyncio.sleep(0)
+        return [ValueResponse(address=r.address, value=None, status=False,
+                              error=ResponseError(code=2003, message='broken', component_name='test'))
+                for r in requests]
+
+
+class _StubClientAPI(BaseClientAPI):
+    def __init__(self, crs):
+        self._crs = crs
+
+    @property
+    def user(self):
+        return TreeUser(name='test')
+
+    @property
+    def _CRS(self):
+        return self._crs
+
+    async def server_is_alive(self, request_timeout: float = None):
+        return True
+
+    async def server_reload_nats_config(self, request_timeout: float = None) -> bool:
+        return True
+
+    def get_cfg(self, name_cfg: str, default=None, use_default_settings=True):
+        return default
+
+    def get_cfg_deep(self, name_cfg, default=None, use_default_settings=True):
+        return default
+
+
+async def _wait_for(predicate, timeout: float = 2.0):
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not predicate() and asyncio.get_event_loop().time() < deadline:
+        await asyncio.sleep(0.005)
+
+
+class TestSubscriptionHub(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_address_shares_one_underlying_query(self):
+        crs = _CountingSolver()
+        hub = SubscriptionHub(crs=crs)
+        received = [[] for _ in range(5)]
+        consumers = []
+        for i in range(5):
+            c = hub.subscribe('test.subject', delay=0.01, name=f'consumer {i}')
+            c.add_callback_method(lambda resp, i=i: received[i].append(resp[0].value.v))
+            c.start()
+            consumers.append(c)
+        self.assertEqual(hub.sources_count(), 1)
+        self.assertEqual(hub.consumers_count('test.subject'), 5)
+        await _wait_for(lambda: all(len(r) >= 3 for r in received))
+        for c in consumers:
+            self.assertIsInstance(c, SharedCycleQuery)
+        for r in received:
+            self.assertGreaterEqual(len(r), 3)
+        # every request sent to the server carried the single shared address
+        self.assertTrue(all(a == ['test.subject'] for a in crs.addresses_per_call))
+        await hub.close()
+
+    async def test_different_parameters_are_not_shared(self):
+        hub = SubscriptionHub(crs=_CountingSolver())
+        a = hub.subscribe('test.subject', delay=0.01, parameters_dict={'x': 1})
+        b = hub.subscribe('test.subject', delay=0.01, parameters_dict={'x': 2})
+        c = hub.subscribe('test.subject', delay=0.01, parameters_dict={'x': 1},
+                          error_policy=ErrorPolicy.SERVICE)
+        for q in (a, b, c):
+            q.start()
+        self.assertEqual(hub.sources_count(), 3)
+        await hub.close()
+
+    async def test_slow_consumer_is_downsampled_from_fast_source(self):
+        crs = _CountingSolver(latency=0.005)
+        hub = SubscriptionHub(crs=crs)
+        fast, slow = [], []
+        f = hub.subscribe('test.subject', delay=0.005)
+        s = hub.subscribe('test.subject', delay=0.1)
+        f.add_callback_method(lambda resp: fast.append(resp[0].value.v))
+        s.add_callback_method(lambda resp: slow.append(resp[0].value.v))
+        s.start()
+        f.start()
+        await asyncio.sleep(0)
+        # the underlying query follows the fastest consumer
+        self.assertEqual(f._entry.batch.source._delay, 0.005)
+        await asyncio.sleep(0.35)
+        self.assertGreater(len(fast), 2 * len(slow))
+        self.assertGreaterEqual(len(slow), 2)
+        self.assertLessEqual(len(slow), 5)
+        # slow consumer gets the newest value, not an old queued one
+        self.assertEqual(slow, sorted(slow))
+        await f.stop_and_wait()
+        # fast consumer left: the underlying query slows down to the remaining consumer
+        self.assertEqual(s._entry.batch.source._delay, 0.1)
+        await hub.close()
+
+    async def test_last_consumer_tears_down_underlying_query(self):
+        crs = _CountingSolver()
+        hub = SubscriptionHub(crs=crs)
+        a = hub.subscribe('test.subject', delay=0.01)
+        b = hub.subscribe('test.subject', delay=0.01)
+        a.start()
+        b.start()
+        await asyncio.sleep(0)
+        source = a._entry.batch.source
+        await a.stop_and_wait()
+        self.assertFalse(source.is_stopped())
+        await b.stop_and_wait()
+        self.assertTrue(source.is_stopped())
+        self.assertEqual(hub.sources_count(), 0)
+        calls = crs.calls
+        await asyncio.sleep(0.05)
+        self.assertEqual(crs.calls, calls)
+        # subscribing again creates a fresh underlying query
+        c = hub.subscribe('test.subject', delay=0.01)
+        c.start()
+        await asyncio.sleep(0)
+        self.assertIsNot(c._entry.batch.source, source)
+        await hub.close()
+
+    async def test_late_consumer_gets_current_value_at_once(self):
+
+        class _OneChangeSolver(_CountingSolver):
+            async def send_request(self, requests, timeout=None, no_wait=False):
+                if self.calls:
+                    # the value does not change any more
+                    await asyncio.sleep(10)
+                return await super().send_request(requests, timeout, no_wait)
+
+        crs = _OneChangeSolver()
+        hub = SubscriptionHub(crs=crs)
+        early = hub.subscribe('test.subject', delay=0.01)
+        early.start()
+        await asyncio.wait_for(early.get_response(), 1.0)
+        late = hub.subscribe('test.subject', delay=0.01)
+        received = []
+        late.add_callback_method(lambda resp: received.append(resp[0].value.v))
+        late.start()
+        await _wait_for(lambda: received, timeout=0.5)
+        self.assertEqual(received, [1])
+        self.assertEqual(crs.calls, 1)  # the server sent no other value
+        await hub.close()
+
+    async def test_error_of_underlying_query_reaches_all_consumers(self):
+        hub = SubscriptionHub(crs=_ErrorSolver())
+        a = hub.subscribe('test.subject', delay=0.01)
+        b = hub.subscribe('test.subject', delay=0.01)
+        a.start()
+        b.start()
+        for c in (a, b):
+            with self.assertRaises(CommunicationRuntimeError):
+                await asyncio.wait_for(c.get_response(), 1.0)
+        await _wait_for(lambda: a.is_stopped() and b.is_stopped())
+        self.assertEqual(hub.sources_count(), 0)
+        self.assertEqual(hub.consumers_count(), 0)
+
+    async def test_client_api_shared_subscribe(self):
+        crs = _CountingSolver()
+        api = _StubClientAPI(crs)
+        a = await api.subscribe(Address('test.subject'), delay=0.01, shared=True)
+        b = await api.subscribe('test.subject', delay=0.02, shared=True)
+        a.start()
+        b.start()
+        self.assertIs(a._entry, b._entry)
+        self.assertEqual(api.subscription_hub.sources_count(), 1)
+        resp = await asyncio.wait_for(b.get_response(), 1.0)
+        self.assertTrue(resp[0].status)
+        await api.subscription_hub.close()
+
+
+class TestSubscriptionBatching(unittest.IsolatedAsyncioTestCase):
+
+    async def test_compatible_subscriptions_are_packed_into_batches(self):
+        crs = _CountingSolver()
+        hub = SubscriptionHub(crs=crs, max_batch_size=4)
+        received = {}
+        for i in range(10):
+            c = hub.subscribe(f'test.subject_{i}', delay=0.01)
+            c.add_callback_method(lambda resp, i=i: received.setdefault(i, []).append(resp))
+            c.start()
+        # 10 addresses, 4 per batch -> 3 underlying queries
+        self.assertEqual(hub.sources_count(), 3)
+        await _wait_for(lambda: len(received) == 10)
+        for i, responses in received.items():
+            # each consumer sees only its own address
+            for resp in responses:
+                self.assertEqual(len(resp), 1)
+                self.assertEqual(str(resp[0].address), f'test.subject_{i}')
+        self.assertLessEqual(max(len(a) for a in crs.addresses_per_call), 4)
+        await hub.close()
+
+    async def test_incompatible_delay_is_not_packed_together(self):
+        hub = SubscriptionHub(crs=_CountingSolver(), max_batch_size=10)
+        for i in range(3):
+            hub.subscribe(f'test.fast_{i}', delay=0.01).start()
+        for i in range(3):
+            hub.subscribe(f'test.slow_{i}', delay=0.5).start()
+        self.assertEqual(hub.sources_count(), 2)
+        await hub.close()
+
+    async def test_batches_are_repacked_when_subscriptions_leave(self):
+        crs = _CountingSolver()
+        hub = SubscriptionHub(crs=crs, max_batch_size=3)
+        consumers = [hub.subscribe(f'test.subject_{i}', delay=0.01) for i in range(6)]
+        for c in consumers:
+            c.start()
+        self.assertEqual(hub.sources_count(), 2)
+        # leave 1 in the first batch and 2 in the second -> merged into one query
+        for c in (consumers[0], consumers[1], consumers[3]):
+            await c.stop_and_wait()
+        self.assertEqual(hub.sources_count(), 1)
+        remaining = {str(c._entry.address) for c in (consumers[2], consumers[4], consumers[5])}
+        calls = len(crs.addresses_per_call)
+        await _wait_for(lambda: len(crs.addresses_per_call) > calls)
+        self.assertEqual(set(crs.addresses_per_call[-1]), remaining)
+        self.assertIs(consumers[2]._entry.batch, consumers[5]._entry.batch)
+        await hub.close()
+
+    async def test_repacking_keeps_time_of_known_change(self):
+        crs = _CountingSolver()
+        hub = SubscriptionHub(crs=crs, max_batch_size=5)
+        first = hub.subscribe('test.first', delay=0.01)
+        first.start()
+        await asyncio.wait_for(first.get_response(), 1.0)
+        await asyncio.sleep(0.02)
+        self.assertIsNotNone(first._entry.request.request_data.get('time_of_known_change'))
+        hub.subscribe('test.second', delay=0.01).start()
+        self.assertEqual(hub.sources_count(), 1)
+        # the first address was moved to the rebuilt batch with its conditional state
+        self.assertIs(first._entry.batch.source._list_request[0], first._entry.request)
+        self.assertIsNotNone(first._entry.request.request_data.get('time_of_known_change'))
+        await hub.close()
+
+    async def test_error_of_one_address_does_not_stop_the_others(self):
+
+        class _OneBrokenSolver(_CountingSolver):
+            async def send_request(self, requests, timeout=None, no_wait=False):
+                result = await super().send_request(requests, timeout, no_wait)
+                return [ValueResponse(address=r.address, value=None, status=False,
+                                      error=ResponseError(code=2003, message='broken', component_name='test'))
+                        if str(r.address) == 'test.broken' else r
+                        for r in result]
+
+        hub = SubscriptionHub(crs=_OneBrokenSolver(), max_batch_size=5)
+        broken = hub.subscribe('test.broken', delay=0.01)
+        good = hub.subscribe('test.good', delay=0.01)
+        broken.start()
+        good.start()
+        with self.assertRaises(CommunicationRuntimeError):
+            await asyncio.wait_for(broken.get_response(), 1.0)
+        await _wait_for(lambda: broken.is_stopped())
+        # the good address is restarted in a batch of its own and keeps receiving values
+        resp = await asyncio.wait_for(good.get_response(), 1.0)
+        self.assertTrue(resp[0].status)
+        self.assertFalse(good.is_stopped())
+        self.assertEqual(hub.sources_count(), 1)
+        await hub.close()
+
+    async def test_only_consumers_of_changed_address_are_fed(self):
+
+        class _OneStaticSolver(_CountingSolver):
+            async def send_request(self, requests, timeout=None, no_wait=False):
+                result = await super().send_request(requests, timeout, no_wait)
+                return [ValueResponse(address=r.address, value=Value(v=1.0, ts=1.0, tags={'from_cf': True}),
+                                      status=True)
+                        if str(r.address) == 'test.static' else r
+                        for r in result]
+
+        crs = _OneStaticSolver()
+        hub = SubscriptionHub(crs=crs, max_batch_size=5)
+        received = {'test.changing': [], 'test.static': []}
+        for address, values in received.items():
+            c = hub.subscribe(address, delay=0.01)
+            c.add_callback_method(lambda resp, values=values: values.append(resp[0].value.v))
+            c.start()
+        self.assertEqual(hub.sources_count(), 1)
+        await _wait_for(lambda: len(received['test.changing']) >= 5)
+        self.assertGreaterEqual(crs.calls, 5)
+        self.assertEqual(received['test.static'], [1.0])
+        await hub.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
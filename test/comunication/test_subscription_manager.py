@@ -0,0 +1,90 @@
+"""Tests for cycle query lifecycle states and SubscriptionManager."""
+
+import asyncio
+import gc
+import unittest
+
+from obcom.comunication.cycle_query import ConditionalCycleQuery, CycleQueryState, PeriodicCycleQuery
+from obcom.comunication.subscription_manager import SubscriptionManager
+from obcom.data_colection.address import Address
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from test.comunication.test_subscription_hub import _CountingSolver, _StubClientAPI
+
+
+def _cq(crs, address='test.subject', name='Default subscription'):
+    return ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address=address)], delay=0.01, query_name=name)
+
+
+class TestCycleQueryState(unittest.IsolatedAsyncioTestCase):
+
+    async def test_states_follow_lifecycle(self):
+        cq = _cq(_CountingSolver())
+        seen = []
+        cq.add_state_listener(lambda q, old, new: seen.append((old, new)))
+        self.assertEqual(cq.state, CycleQueryState.STOPPED)
+        self.assertTrue(cq.is_stopped())
+        cq.start()
+        self.assertEqual(cq.state, CycleQueryState.STARTING)
+        await asyncio.sleep(0)
+        self.assertEqual(cq.state, CycleQueryState.RUNNING)
+        self.assertFalse(cq.is_stopped())
+        cq.stop()
+        self.assertEqual(cq.state, CycleQueryState.STOPPING)
+        await cq.stop_and_wait()
+        self.assertEqual(cq.state, CycleQueryState.STOPPED)
+        self.assertTrue(cq.is_stopped())
+        self.assertEqual([new for _, new in seen], [CycleQueryState.STARTING, CycleQueryState.RUNNING,
+                                                    CycleQueryState.STOPPING, CycleQueryState.STOPPED])
+
+    async def test_stop_and_wait_of_never_started_query(self):
+        cq = _cq(_CountingSolver())
+        await cq.stop_and_wait()
+        self.assertEqual(cq.state, CycleQueryState.STOPPED)
+
+
+class TestSubscriptionManager(unittest.IsolatedAsyncioTestCase):
+
+    async def test_lookup_and_health(self):
+        crs = _CountingSolver()
+        manager = SubscriptionManager()
+        queries = [manager.register(_cq(crs, f'test.subject_{i % 3}', name=f'q{i}')) for i in range(9)]
+        self.assertEqual(len(manager), 9)
+        self.assertEqual(len(manager.by_address(Address('test.subject_1'))), 3)
+        self.assertEqual(manager.by_name('q4'), [queries[4]])
+        self.assertEqual(manager.by_name('missing'), [])
+        manager.start_all()
+        await asyncio.sleep(0)
+        self.assertEqual(manager.health()['running'], 9)
+        queries[0].stop()
+        self.assertEqual(manager.count(CycleQueryState.STOPPING), 1)
+        await manager.stop_all_and_wait()
+        self.assertEqual(manager.count(CycleQueryState.STOPPED), 9)
+        self.assertTrue(all(q.is_stopped() for q in queries))
+        manager.unregister(queries[4])
+        self.assertNotIn(queries[4], manager)
+        self.assertEqual(manager.by_name('q4'), [])
+
+    async def test_dropped_queries_are_forgotten(self):
+        manager = SubscriptionManager()
+        manager.register(_cq(_CountingSolver()))
+        gc.collect()
+        self.assertEqual(len(manager), 0)
+        self.assertEqual(manager.by_address('test.subject'), [])
+
+    async def test_client_api_registers_created_queries(self):
+        api = _StubClientAPI(_CountingSolver())
+        a = await api.subscribe_with_callback('test.a', delay=0.01)
+        b = await api.send_cycle_multipart('test.b', delay=0.01)
+        c = await api.subscribe_with_callback('test.a', delay=0.01, shared=True)
+        self.assertIsInstance(b, PeriodicCycleQuery)
+        self.assertEqual(set(api.subscription_manager.by_address('test.a')), {a, c})
+        await asyncio.sleep(0)
+        self.assertEqual(api.subscription_manager.count(CycleQueryState.RUNNING), 2)
+        await api.subscription_manager.stop_all_and_wait()
+        self.assertTrue(a.is_stopped() and c.is_stopped())
+        await api.subscription_hub.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+"""Tests of the bulk restore of subscriptions after the connection to the router comes back."""
+
+import asyncio
+import unittest
+
+from obcom.comunication.base_client_request_solver import BaseClientRequestSolver, ConnectionState
+from obcom.comunication.comunication_error import CommunicationTimeoutError
+from obcom.comunication.cycle_driver import CycleQueryDriver
+from obcom.comunication.cycle_query import ConditionalCycleQuery
+from obcom.comunication.subscription_restore import SubscriptionRestorer
+from obcom.data_colection.response_error import ResponseError
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from test.comunication.test_cycle_query_streaming import _FakeStream
+from test.comunication.test_subscription_hub import _StubClientAPI, _wait_for
+
+
+class _RouterSolver(BaseClientRequestSolver):
+    """
+    Conditional long-poll answering when a value is newer than its `time_of_known_change`, or with the 4004 expiry
+    after `request_timeout`. A request sent before the connection was lost, or while it is lost, gets no answer and
+    times out. Records the addresses of every request.
+    """
+
+    def __init__(self, **values):
+        self.values = {f'test.{k}': (v, 1.0) for k, v in values.items()}
+        self.sent = []
+        self.timeouts = 0
+        self._epoch = 0
+
+    def set(self, name, v):
+        address = f'test.{name}'
+        self.values[address] = (v, self.values[address][1] + 1)
+
+    def disconnect(self):
+        self._epoch += 1
+        self._set_connection_state(ConnectionState.DISCONNECTED)
+
+    def connect(self):
+        self._set_connection_state(ConnectionState.CONNECTED)
+
+    def _changed(self, r):
+        return self.values[str(r.address)][1] > (r.request_data.get('time_of_known_change') or 0)
+
+    async def send_request(self, requests, timeout=None, no_wait=False):
+        self.sent.append([str(r.address) for r in requests])
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(r.request_timeout for r in requests)
+        epoch = self._epoch
+        while loop.time() < deadline:
+            if epoch == self._epoch and self.connection_state == ConnectionState.CONNECTED:
+                if any(self._changed(r) for r in requests):
+                    return [ValueResponse(address=r.address,
+                                          value=Value(v=self.values[str(r.address)][0],
+                                                      ts=self.values[str(r.address)][1], tags={'from_cf': True}),
+                                          status=True)
+                            for r in requests]
+            await asyncio.sleep(0.002)
+        if epoch != self._epoch or self.connection_state != ConnectionState.CONNECTED:
+            self.timeouts += 1
+            raise CommunicationTimeoutError()
+        return [ValueResponse(address=r.address, value=None, status=False,
+                              error=ResponseError(code=4004, message='expired', component_name='test'))
+                for r in requests]
+
+
+class _StreamingRouterSolver(_RouterSolver):
+    """Router opening streams, which the test pushes into, besides the long-polls of the restore."""
+
+    def __init__(self, **values):
+        super().__init__(**values)
+        self.streams = []
+
+    def supports_streaming(self) -> bool:
+        return True
+
+    async def open_stream(self, requests, credits, lease, min_interval=0):
+        stream = _FakeStream(requests, credits, lease)
+        self.streams.append(stream)
+        return stream
+
+
+def _cq(crs, name, request_timeout=5.0, **kwargs):
+    return ConditionalCycleQuery(crs=crs, list_request=[ValueRequest(address=f'test.{name}')], delay=0.001,
+                                 request_timeout=request_timeout, max_missed_msg=3, **kwargs)
+
+
+class TestSubscriptionRestore(unittest.IsolatedAsyncioTestCase):
+
+    async def _restore(self, crs, queries, restorer, changed):
+        received = {str(cq._list_request[0].address): [] for cq in queries}
+        for cq in queries:
+            cq.add_callback_method(lambda responses: received[str(responses[0].address)].append(responses[0].value.v))
+            cq.start()
+        await _wait_for(lambda: all(received.values()))
+        crs.disconnect()
+        self.assertTrue(restorer.is_holding())
+        await asyncio.sleep(0.02)
+        sent = len(crs.sent)
+        for name in changed:
+            crs.set(name, 2)
+        crs.connect()
+        # long-polls lost with the connection are not waited for, the changes come from the restore
+        await asyncio.wait_for(_wait_for(lambda: all(received[f'test.{n}'] == [1, 2] for n in changed)), 1.0)
+        self.assertFalse(restorer.is_holding())
+        # a batch without a change is answered when its short lease expires
+        await asyncio.wait_for(_wait_for(lambda: restorer.restores == 1), 1.0)
+        self.assertEqual(crs.timeouts, 0)
+        return received, crs.sent[sent:]
+
+    async def test_changes_during_outage_restored_in_batches(self):
+        names = [f's{i}' for i in range(10)]
+        crs = _RouterSolver(**{n: 1 for n in names})
+        queries = [_cq(crs, n) for n in names]
+        restorer = SubscriptionRestorer(crs=crs, queries=lambda: queries, max_batch_size=4, restore_timeout=0.05)
+        received, sent = await self._restore(crs, queries, restorer, changed=['s1', 's7'])
+        # 10 queries in 3 requests, nothing was sent during the outage
+        self.assertEqual(restorer.restore_requests, 3)
+        self.assertEqual([len(r) for r in sent[:3]], [4, 4, 2])
+        self.assertEqual(received['test.s0'], [1])
+        # then every query continues with its own long-poll from the known change
+        crs.set('s0', 3)
+        await asyncio.wait_for(_wait_for(lambda: received['test.s0'] == [1, 3]), 1.0)
+        for cq in queries:
+            await cq.stop_and_wait()
+        restorer.close()
+
+    async def test_driven_queries(self):
+        crs = _RouterSolver(a=1, b=1)
+        driver = CycleQueryDriver()
+        queries = [_cq(crs, 'a', driver=driver), _cq(crs, 'b', driver=driver)]
+        restorer = SubscriptionRestorer(crs=crs, queries=lambda: queries, restore_timeout=0.05)
+        _, sent = await self._restore(crs, queries, restorer, changed=['b'])
+        self.assertEqual(sent[0], ['test.a', 'test.b'])
+        driver.close()
+        restorer.close()
+
+    async def test_streaming_query_reopens_stream_after_restore(self):
+        crs = _StreamingRouterSolver(a=1)
+        cq = _cq(crs, 'a', streaming=True)
+        received = []
+        cq.add_callback_method(lambda responses: received.append(responses[0].value.v))
+        restorer = SubscriptionRestorer(crs=crs, queries=lambda: [cq], restore_timeout=0.05)
+        cq.start()
+        await _wait_for(lambda: crs.streams)
+        crs.disconnect()
+        # the stream lost with the connection is closed, nothing is opened during the outage
+        await _wait_for(lambda: crs.streams[0].closed)
+        await asyncio.sleep(0.02)
+        self.assertEqual(len(crs.streams), 1)
+        crs.set('a', 2)
+        crs.connect()
+        await asyncio.wait_for(_wait_for(lambda: len(crs.streams) == 2), 1.0)
+        # the change comes from the restore, the new stream follows from it
+        self.assertEqual(received, [2])
+        self.assertEqual(crs.sent, [['test.a']])
+        self.assertEqual(restorer.restores, 1)
+        self.assertEqual(crs.streams[1].requests[0].request_data['time_of_known_change'], 2.0)
+        await cq.stop_and_wait()
+        restorer.close()
+
+    async def test_without_restore_queries_time_out(self):
+        crs = _RouterSolver(a=1)
+        cq = _cq(crs, 'a', request_timeout=0.05)
+        cq.start()
+        await asyncio.wait_for(cq.get_response(), 1.0)
+        crs.disconnect()
+        await asyncio.sleep(0.08)
+        crs.set('a', 2)
+        crs.connect()
+        response = await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(response[0].value.v, 2)
+        self.assertGreater(crs.timeouts, 0)
+        await cq.stop_and_wait()
+
+    async def test_connection_listeners(self):
+        crs = _RouterSolver(a=1)
+        events = []
+        listener = lambda solver, old, new: events.append((old, new))
+        crs.add_connection_listener(listener)
+        self.assertEqual(crs.connection_state, ConnectionState.CONNECTED)
+        crs.connect()
+        crs.disconnect()
+        crs.disconnect()
+        crs.connect()
+        crs.remove_connection_listener(listener)
+        crs.disconnect()
+        self.assertEqual(events, [(ConnectionState.CONNECTED, ConnectionState.DISCONNECTED),
+                                  (ConnectionState.DISCONNECTED, ConnectionState.CONNECTED)])
+
+    async def test_client_restores_its_queries(self):
+        crs = _RouterSolver(a=1, b=1)
+        api = _StubClientAPI(crs)
+        api.restore_subscriptions = True
+        cq = await api.subscribe('test.a', delay=0.001, max_missed_msg=3, initial=True)
+        shared = await api.subscribe('test.b', delay=0.001, max_missed_msg=3, shared=True, initial=True)
+        restorer = api.subscription_restorer
+        self.assertIsNotNone(restorer)
+        crs.disconnect()
+        await asyncio.sleep(0.02)
+        crs.set('b', 2)
+        crs.connect()
+        response = await asyncio.wait_for(shared.get_response(), 1.0)
+        self.assertEqual(response[0].value.v, 2)
+        # the private query and the source of the shared one were restored together
+        self.assertEqual(restorer.restores, 1)
+        self.assertIn(['test.a', 'test.b'], crs.sent)
+        await cq.stop_and_wait()
+        await api.subscription_hub.close()
+        restorer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests of the on-disk snapshot of the last known values."""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from obcom.comunication.value_snapshot import ValueSnapshot
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueResponse
+from test.comunication.test_runtime_requests import _LongPollSolver
+from test.comunication.test_subscription_hub import _StubClientAPI, _wait_for
+
+
+def _response(address, v, ts):
+    return ValueResponse(address=address, value=Value(v=v, ts=ts, tags={'from_cf': True}), status=True)
+
+
+class TestValueSnapshot(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'values.sqlite')
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    async def test_values_survive_restart(self):
+        snapshot = ValueSnapshot(self.path, flush_interval=0.01)
+        snapshot.put(_response('test.a', 1, 1.0))
+        snapshot.put(_response('test.a', 2, 2.0))
+        snapshot.put(_response('test.a', 0, 0.5))  # older than known
+        snapshot.put(_response('test.a', 10, 1.0), parameters={'unit': 'K'})
+        snapshot.put(ValueResponse(address='test.b', value=None, status=False))
+        # written by one periodic flush
+        await _wait_for(lambda: snapshot.writes == 1)
+        self.assertEqual(snapshot.writes, 1)
+        await snapshot.close()
+
+        restarted = ValueSnapshot(self.path)
+        self.assertEqual(len(restarted), 2)
+        response = restarted.get('test.a')
+        self.assertEqual((response.value.v, response.value.ts), (2, 2.0))
+        self.assertTrue(response.value.tags[ValueSnapshot.TAG])
+        self.assertTrue(response.value.tags['from_cf'])
+        self.assertEqual(restarted.get('test.a', {'unit': 'K'}).value.v, 10)
+        self.assertIsNone(restarted.get('test.b'))
+        await restarted.close()
+
+    async def test_subscription_resumes_from_snapshot(self):
+        snapshot = ValueSnapshot(self.path, flush_interval=0.01)
+        snapshot.put(_response('test.a', 1, 1.0))
+        crs = _LongPollSolver(a=1)
+        api = _StubClientAPI(crs)
+        api.value_snapshot = snapshot
+        cq = await api.subscribe('test.a', delay=0.01, initial=True)
+        # served at once, marked as stale; the value is not transferred again
+        self.assertEqual(cq.current_response[0].value.v, 1)
+        self.assertTrue(cq.current_response[0].value.tags[ValueSnapshot.TAG])
+        self.assertTrue(api.get_last_known('test.a').value.tags[ValueSnapshot.TAG])
+        await asyncio.sleep(0.02)
+        self.assertEqual(crs.sent, [{'test.a': 1.0}])
+        crs.set('a', 2)
+        response = await asyncio.wait_for(cq.get_response(), 1.0)
+        self.assertEqual(response[0].value.v, 2)
+        # recorded by a callback of the query
+        await _wait_for(lambda: snapshot.get('test.a').value.v == 2)
+        await cq.stop_and_wait()
+        await snapshot.close()
+        restarted = ValueSnapshot(self.path)
+        self.assertEqual(restarted.get('test.a').value.v, 2)
+        await restarted.close()
+
+    def test_invalid_interval(self):
+        with self.assertRaises(ValueError):
+            ValueSnapshot(self.path, flush_interval=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from obcom.data_colection.tree_user import TreeUser
+from obcom.data_colection.value_call import ValueRequest, ValueRequestTemplate
+
+
+class ValueRequestTemplateTest(unittest.TestCase):
+
+    def _request(self):
+        return ValueRequest(address='aaa.bbb.ccc', time_of_data=123456.0, time_of_data_tolerance=5.0,
+                            request_timeout=30.0, request_data={'sample': 55.0}, user=TreeUser(name='user_name1'))
+
+    def test_build_encodes_like_source(self):
+        vr = self._request()
+        template = ValueRequestTemplate(vr)
+        built = template.build(time_of_data=200.0, request_data={'sample': 55.0, 'time_of_known_change': 100.0})
+        expected = vr.to_dict()
+        expected['time_of_data'] = 200.0
+        expected['request_data'] = {'sample': 55.0, 'time_of_known_change': 100.0}
+        self.assertDictEqual(built.to_dict(), expected)
+        self.assertEqual(ValueRequest.from_byte(built.to_byte()).to_dict(), expected)
+        # static objects are shared, per-send fields are not
+        self.assertIs(built.address, vr.address)
+        self.assertIs(built.user, vr.user)
+        self.assertIsNot(built.request_data, vr.request_data)
+        self.assertEqual(vr.time_of_data, 123456.0)
+
+    def test_changed_static_field_is_detected(self):
+        vr = self._request()
+        template = ValueRequestTemplate(vr)
+        self.assertTrue(template.matches(vr))
+        self.assertFalse(template.matches(self._request()))
+        built = template.build()
+        vr.time_of_data_tolerance = 10.0
+        self.assertFalse(template.matches(vr))
+        # a built request changed after building does not use the stale encoding
+        built.request_timeout = 60.0
+        self.assertEqual(built.to_dict()['request_timeout'], 60.0)
+
+
+if __name__ == '__main__':
+    unittest.main()